@@ -6,7 +6,8 @@ import ifcopenshell
 import ifcopenshell.util.element
 import json
 
-# The IFC model is provided as 'ifc_file' by the system
+# The IFC model is provided as 'ifc_file' by the system, and 'ifc_index' gives
+# relationship lookups (containment, aggregation, groups) without scanning rels
 model = ifc_file
 
 # Initialize result structure
@@ -44,10 +45,9 @@ try:
         }
         
         # Find which storey contains this space
-        for rel in model.by_type("IfcRelAggregates"):
-            if space in rel.RelatedObjects and rel.RelatingObject.is_a("IfcBuildingStorey"):
-                space_info["storey"] = rel.RelatingObject.Name
-                break
+        storey = ifc_index.storey(space)
+        if storey:
+            space_info["storey"] = storey.Name
         
         # Get space properties and quantities
         try:
@@ -70,23 +70,21 @@ try:
         
         # Find elements contained in this space
         contained_elements = []
-        for rel in model.by_type("IfcRelContainedInSpatialStructure"):
-            if rel.RelatingStructure == space:
-                for element in rel.RelatedElements:
-                    element_info = {
-                        "id": element.GlobalId,
-                        "type": element.is_a(),
-                        "name": element.Name or f"{element.is_a()}_{element.GlobalId[:8]}"
-                    }
-                    contained_elements.append(element_info)
-                    
-                    # Map element to space
-                    element_space_map[element.GlobalId] = {
-                        "space_id": space.GlobalId,
-                        "space_name": space_info["name"],
-                        "space_type": space_info["type"],
-                        "storey": space_info["storey"]
-                    }
+        for element in ifc_index.contained(space):
+            element_info = {
+                "id": element.GlobalId,
+                "type": element.is_a(),
+                "name": element.Name or f"{element.is_a()}_{element.GlobalId[:8]}"
+            }
+            contained_elements.append(element_info)
+            
+            # Map element to space
+            element_space_map[element.GlobalId] = {
+                "space_id": space.GlobalId,
+                "space_name": space_info["name"],
+                "space_type": space_info["type"],
+                "storey": space_info["storey"]
+            }
         
         space_info["elements"] = contained_elements
         space_info["element_count"] = len(contained_elements)
@@ -104,14 +102,12 @@ try:
         }
         
         # Find spaces in this zone
-        for rel in model.by_type("IfcRelAssignsToGroup"):
-            if rel.RelatingGroup == zone:
-                for obj in rel.RelatedObjects:
-                    if obj.is_a("IfcSpace"):
-                        zone_info["spaces"].append({
-                            "id": obj.GlobalId,
-                            "name": obj.Name or ""
-                        })
+        for obj in ifc_index.members(zone):
+            if obj.is_a("IfcSpace"):
+                zone_info["spaces"].append({
+                    "id": obj.GlobalId,
+                    "name": obj.Name or ""
+                })
         
         zone_data.append(zone_info)
     
@@ -122,11 +118,7 @@ try:
     for element in all_elements:
         if element.GlobalId not in element_space_map:
             # Check if it's in a storey at least
-            in_storey = False
-            for rel in model.by_type("IfcRelContainedInSpatialStructure"):
-                if element in rel.RelatedElements:
-                    in_storey = True
-                    break
+            in_storey = ifc_index.container(element) is not None
             
             if not in_storey:
                 unassigned.append({
@@ -2,7 +2,22 @@
 // This runs in a separate thread to avoid blocking the main UI
 
 export interface PyodideMessage {
-  type: "init" | "process" | "progress" | "complete" | "error" | "execute_query" | "export_sqlite" | "sqlite_export"
+  type:
+    | "init"
+    | "process"
+    | "progress"
+    | "complete"
+    | "error"
+    | "execute_query"
+    | "export_sqlite"
+    | "sqlite_export"
+    | "cancel"
+    | "cancelled"
+    | "query_result"
+    | "fetch_query"
+    | "close_query"
+    | "get_index_advice"
+    | "index_advice"
   data?: any
   progress?: number
   step?: string
@@ -18,6 +33,40 @@ export interface ProcessingResult {
   properties: any[]
 }
 
+export interface QueryOptions {
+  // Rows per page, memory and latency of each page are bounded by it. A positive integer, 1000 by default
+  pageSize?: number
+  // Rows after which the query is closed and the last page marked as truncated. A positive integer, 100000 by default
+  maxRows?: number
+  // "rows" gives one object per row, "columns" one array per column (Float64Array if all-numeric)
+  format?: "rows" | "columns"
+}
+
+export interface QueryPage {
+  columns: string[]
+  rows?: Record<string, any>[]
+  values?: (any[] | Float64Array)[]
+  // Continuation handle for the next page, null once the query is closed
+  handle: number | null
+  hasMore: boolean
+  truncated: boolean
+  // Rows returned so far, including this page
+  rowCount: number
+}
+
+export interface IndexRecommendation {
+  table: string
+  columns: string[]
+  // CREATE INDEX statement for the advised index
+  statement: string
+  // Logged queries that fully scanned the table, and their total seconds
+  queries: number
+  elapsed: number
+  query: string
+  // Created automatically once queries reached the advisor threshold
+  created: boolean
+}
+
 // This would be the actual worker implementation
 export const createPyodideWorker = async () => {
   const response = await fetch("/ifc2sql.py")
@@ -31,7 +80,7 @@ export const createPyodideWorker = async () => {
 
   const workerCode = `
     let pyodide = null;
-    let sqliteDbPath = null;
+    let hasSqliteDb = false;
 
     self.onmessage = async function(e) {
       const { type, data } = e.data;
@@ -44,8 +93,21 @@ export const createPyodideWorker = async () => {
           case 'process':
             await processIfcFile(data.fileBuffer, data.fileName);
             break;
+          case 'cancel':
+            // Polled by the Patcher between classes and batches while processIfcFile is awaiting
+            pyodide.globals.set('conversion_cancelled', true);
+            break;
           case 'execute_query':
-            await executeQuery(data.query);
+            await executeQuery(data.query, data);
+            break;
+          case 'fetch_query':
+            fetchQueryPage(data.handle);
+            break;
+          case 'close_query':
+            closeQuery(data.handle);
+            break;
+          case 'get_index_advice':
+            getIndexAdvice();
             break;
           case 'export_sqlite':
             await exportSQLiteDatabase();
@@ -136,6 +198,7 @@ import os
 import sys
 import base64
 import sqlite3
+import time
 
 print(f"IfcOpenShell version: {ifcopenshell.version}")
 
@@ -146,8 +209,9 @@ ifc2sql_code = base64.b64decode(encoded_code).decode('utf-8')
 exec(ifc2sql_code)
 print("Official ifc2sql Patcher class loaded successfully")
 
-def process_ifc_to_sqlite(file_content, filename):
+async def process_ifc_to_sqlite(file_content, filename, on_progress=None):
     """Process IFC file using the official ifc2sql.py Patcher class"""
+    global conversion_patcher, query_advisor
     print(f"Processing IFC file: {filename}")
     print(f"File size: {len(file_content)} bytes")
     
@@ -164,37 +228,35 @@ def process_ifc_to_sqlite(file_content, filename):
         print("IFC file opened successfully")
         print(f"Schema: {ifc_file.schema}")
         
-        sqlite_db_path = '/tmp/model.db'
-        
-        print("Creating SQLite database using official ifc2sql.py Patcher...")
-        
-        # Remove existing database if present
-        if os.path.exists(sqlite_db_path):
-            os.remove(sqlite_db_path)
+        print("Creating in-memory SQLite database using official ifc2sql.py Patcher...")
         
         # Create the official Patcher instance with comprehensive options
         patcher = Patcher(
             file=ifc_file,
             sql_type="SQLite",
-            database=sqlite_db_path,
+            database=":memory:",  # Kept in memory, exported with get_output_bytes() instead of via the virtual FS
             full_schema=True,   # Create all IFC class tables for comprehensive database
             is_strict=False,    # Don't enforce strict null constraints
             should_expand=False,  # Keep ifc_id as primary key
             should_get_inverses=True,   # Get inverse relationships
             should_get_psets=True,      # Get property sets
             should_get_geometry=False,   # Skip geometry processing (Pyodide limitation)
-            should_skip_geometry_data=False  # Include geometry representation tables (but not processed geometry)
+            should_skip_geometry_data=False,  # Include geometry representation tables (but not processed geometry)
+            should_get_stats=True  # stats_* catalog of counts and value ranges, so summaries don't scan tables
         )
         
         print("Executing official ifc2sql patch...")
-        patcher.patch()
-        
-        output_path = patcher.get_output()
-        print(f"SQLite database created at: {output_path}")
-        
-        print("Opening SQLite database with ifcopenshell.sql.sqlite...")
-        db = ifcopenshell.sql.sqlite(output_path)
-        print(f"Database opened successfully. Schema: {db.schema}")
+        # Yields to the event loop between classes so the worker can post progress and receive a cancel message
+        async for event in patcher.patch_async(cancel=lambda: conversion_cancelled):
+            if on_progress:
+                on_progress(80 + event['progress'] * 0.15, f"Converting {event['name']}")
+        if patcher.is_cancelled:
+            # The previous model, if any, stays the one queried and exported
+            patcher.db.close()
+            print("Conversion cancelled")
+            return {'cancelled': True}
+        
+        print("SQLite database created in memory")
         
         # Extract entity information from major types only for performance
         print("Extracting key entity information...")
@@ -202,7 +264,7 @@ def process_ifc_to_sqlite(file_content, filename):
         total_entities = 0
 
         # Get all available entity types from the database
-        cursor = db.db.cursor()
+        cursor = patcher.db.cursor()
         cursor.execute("SELECT DISTINCT ifc_class FROM id_map ORDER BY ifc_class")
         available_types = [row[0] for row in cursor.fetchall()]
 
@@ -220,7 +282,8 @@ def process_ifc_to_sqlite(file_content, filename):
         # Process each major entity type
         for ifc_type in types_to_process:
             try:
-                elements = db.by_type(ifc_type)
+                # ifcopenshell.sql.sqlite can only open database files, so read entities from the source model
+                elements = ifc_file.by_type(ifc_type)
                 if elements:
                     entities[ifc_type] = []
                     limit = len(elements)
@@ -534,7 +597,7 @@ def process_ifc_to_sqlite(file_content, filename):
             'schema': ifc_file.schema,
             'entities': entities,
             'properties': properties,
-            'processingMethod': 'Official ifc2sql.py Patcher with ifcopenshell.sql.sqlite',
+            'processingMethod': 'Official ifc2sql.py Patcher with in-memory SQLite',
             'fileName': filename
         }
         
@@ -543,6 +606,14 @@ def process_ifc_to_sqlite(file_content, filename):
         print(f"Entity types found: {len(entities)}")
         print(f"Properties extracted: {len(properties)}")
         
+        # Only a completed conversion replaces the database that queries and exports use. The in-memory database
+        # lives as long as the Patcher's connection.
+        for handle in list(query_cursors):
+            close_query(handle)
+        conversion_patcher = patcher
+        # Advises, and after 3 queries needing the same one creates, indexes for the queries run on this model
+        query_advisor = IndexAdvisor(patcher.db, threshold=3)
+        
         return result
         
     except Exception as e:
@@ -551,6 +622,75 @@ def process_ifc_to_sqlite(file_content, filename):
         traceback.print_exc()
         raise Exception(f"Failed to process IFC file '{filename}': {str(e)}")
 
+# The Patcher of the last completed conversion, its database is the one queried and exported
+conversion_patcher = None
+
+# Open query cursors by handle, so results can be fetched page by page
+query_cursors = {}
+next_query_handle = 0
+query_advisor = None
+
+def open_query(sql_query, page_size, max_rows):
+    """Execute a query on the converted database and return a handle for fetch_query_page"""
+    global next_query_handle
+    for name, value in (('page_size', page_size), ('max_rows', max_rows)):
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            raise ValueError(f"{name} must be a positive integer, got {value!r}")
+    cursor = conversion_patcher.db.cursor()
+    start = time.perf_counter()
+    cursor.execute(sql_query)
+    next_query_handle += 1
+    query_cursors[next_query_handle] = {
+        'cursor': cursor,
+        'query': sql_query,
+        'elapsed': time.perf_counter() - start,
+        'page_size': page_size,
+        'remaining': max_rows,
+        'row_count': 0,
+        'pending': [],
+    }
+    return next_query_handle
+
+def fetch_query_page(handle):
+    """Fetch the next page of an open query, closing it after the last page or once max_rows is reached"""
+    query = query_cursors[handle]
+    cursor = query['cursor']
+    columns = [column[0] for column in cursor.description] if cursor.description else []
+    rows = query['pending']
+    start = time.perf_counter()
+    size = min(query['page_size'], query['remaining']) - len(rows)
+    # fetchmany(0) would return every remaining row, the pending row may already fill the page
+    if columns and size > 0:
+        rows += cursor.fetchmany(size)
+    query['remaining'] -= len(rows)
+    query['row_count'] += len(rows)
+    # Look one row ahead, so the last page is known to be the last one
+    next_row = cursor.fetchone() if columns else None
+    query['elapsed'] += time.perf_counter() - start
+    has_more = next_row is not None and query['remaining'] > 0
+    query['pending'] = [next_row] if has_more else []
+    if not has_more:
+        close_query(handle)
+    return {
+        'columns': columns,
+        'rows': [[value if value is None or isinstance(value, (int, float, str, bool)) else str(value) for value in row] for row in rows],
+        'handle': handle if has_more else None,
+        'hasMore': has_more,
+        'truncated': next_row is not None and not has_more,
+        'rowCount': query['row_count'],
+    }
+
+def close_query(handle):
+    query = query_cursors.pop(handle, None)
+    if query:
+        query['cursor'].close()
+        # Logged once closed, so the time of every page fetched is included
+        if query_advisor:
+            query_advisor.log_query(query['query'], (), query['elapsed'])
+
+def get_index_advice():
+    return query_advisor.get_recommendations() if query_advisor else []
+
 print("IFC processing environment initialized with official ifc2sql.py")
         \`);
         
@@ -579,22 +719,20 @@ print("IFC processing environment initialized with official ifc2sql.py")
         const uint8Array = new Uint8Array(fileBuffer);
         pyodide.globals.set('file_content', uint8Array);
         pyodide.globals.set('file_name', fileName);
+        pyodide.globals.set('conversion_cancelled', false);
+        pyodide.globals.set('post_progress', (progress, step) => {
+          self.postMessage({ type: 'progress', progress, step });
+        });
         
         self.postMessage({ type: 'progress', progress: 80, step: 'Converting to SQLite using official Patcher' });
         
         // Execute the processing function
         await pyodide.runPythonAsync(\`
 print("[DEBUG] About to call process_ifc_to_sqlite with official ifc2sql.py...")
-processing_result = process_ifc_to_sqlite(file_content, file_name)
+processing_result = await process_ifc_to_sqlite(file_content, file_name, post_progress)
 print("[DEBUG] Official ifc2sql.py processing completed successfully")
-
-global sqlite_db_path
-sqlite_db_path = '/tmp/model.db'
-print(f"[DEBUG] SQLite database path set to: {sqlite_db_path}")
         \`);
         
-        sqliteDbPath = '/tmp/model.db';
-        
         // Get the result from Python
         const result = pyodide.globals.get('processing_result');
         
@@ -672,6 +810,15 @@ print(f"[DEBUG] SQLite database path set to: {sqlite_db_path}")
         if (jsResult && jsResult.error) {
           throw new Error('Python processing error: ' + jsResult.message);
         }
+
+        if (jsResult && jsResult.cancelled) {
+          self.postMessage({ type: 'cancelled' });
+          return;
+        }
+        
+        // Python only replaced the queried database once the conversion completed, its old query handles are closed
+        hasSqliteDb = true;
+        queryFormats.clear();
         
         // IFC processing completed successfully using official ifc2sql.py
         self.postMessage({ type: 'progress', progress: 100, step: 'Processing Complete' });
@@ -689,104 +836,42 @@ print(f"[DEBUG] SQLite database path set to: {sqlite_db_path}")
       }
     }
 
-    async function executeQuery(query) {
+    // Output format of every open query, by handle
+    const queryFormats = new Map();
+    
+    function getPositiveInteger(value, fallback, name) {
+      if (value === undefined || value === null) {
+        return fallback;
+      }
+      if (!Number.isInteger(value) || value <= 0) {
+        throw new Error(name + ' must be a positive integer, got ' + value);
+      }
+      return value;
+    }
+
+    async function executeQuery(query, options = {}) {
       try {
-        // Executing SQL query silently
-        
         if (!pyodide) {
           throw new Error('Pyodide not initialized');
         }
         
-        if (!sqliteDbPath) {
+        if (!hasSqliteDb) {
           throw new Error('No SQLite database available. Please process an IFC file first.');
         }
         
-        // Set the query in Python scope
-        pyodide.globals.set('sql_query', query);
+        const pageSize = getPositiveInteger(options.pageSize, 1000, 'pageSize');
+        const maxRows = getPositiveInteger(options.maxRows, 100000, 'maxRows');
         
-        // Execute the query using Python
-        await pyodide.runPythonAsync(\`
-import sqlite3
-import json
-
-try:
-    print(f"Executing query: {sql_query}")
-    
-    if 'sqlite_db_path' not in globals():
-        sqlite_db_path = '/tmp/model.db'
-        print(f"Using default database path: {sqlite_db_path}")
-    else:
-        print(f"Using existing database path: {sqlite_db_path}")
-    
-    # Connect to the SQLite database
-    conn = sqlite3.connect(sqlite_db_path)
-    conn.row_factory = sqlite3.Row  # Enable column access by name
-    cursor = conn.cursor()
-    
-    # Execute the query
-    cursor.execute(sql_query)
-    
-    # Fetch all results
-    rows = cursor.fetchall()
-    
-    # Convert to list of dictionaries
-    query_results = []
-    for row in rows:
-        row_dict = {}
-        for key in row.keys():
-            value = row[key]
-            # Handle None values and ensure JSON serializable
-            if value is None:
-                row_dict[key] = None
-            elif isinstance(value, (int, float, str, bool)):
-                row_dict[key] = value
-            else:
-                row_dict[key] = str(value)
-        query_results.append(row_dict)
-    
-    conn.close()
-    
-    print(f"Query executed successfully, returned {len(query_results)} rows")
-    
-except Exception as e:
-    print(f"Query execution error: {e}")
-    import traceback
-    traceback.print_exc()
-    query_results = {"error": str(e)}
-        \`);
-        
-        // Get the results from Python
-        const results = pyodide.globals.get('query_results');
-        
-        if (!results) {
-          throw new Error('No results returned from query execution');
-        }
-        
-        let jsResults;
+        // Only a cursor is kept, rows are read page by page so memory stays bounded by the page size
+        const openQuery = pyodide.globals.get('open_query');
+        let handle;
         try {
-          // Convert to JavaScript
-          jsResults = results.toJs ? results.toJs({ dict_converter: Object.fromEntries }) : results;
-          
-          // Deep serialize to ensure no proxy objects remain
-          const serializedResults = JSON.parse(JSON.stringify(jsResults, (key, value) => {
-            if (value && typeof value === 'object' && value.constructor && value.constructor.name === 'PyProxy') {
-              return value.toJs ? value.toJs() : String(value);
-            }
-            return value;
-          }));
-          
-          jsResults = serializedResults;
-        } catch (conversionError) {
-          console.error('[v0] Error converting query results:', conversionError);
-          throw new Error('Failed to convert query results to JavaScript: ' + conversionError.message);
-        }
-        
-        if (jsResults && jsResults.error) {
-          throw new Error('SQL execution error: ' + jsResults.error);
+          handle = openQuery(query, pageSize, maxRows);
+        } finally {
+          openQuery.destroy();
         }
-        
-        // Query executed successfully
-        self.postMessage({ type: 'query_result', data: jsResults });
+        queryFormats.set(handle, options.format || 'rows');
+        postQueryPage(handle);
         
       } catch (error) {
         console.error('[v0] Query execution failed:', error);
@@ -800,6 +885,70 @@ except Exception as e:
       }
     }
 
+    function fetchQueryPage(handle) {
+      try {
+        if (!queryFormats.has(handle)) {
+          throw new Error('Query ' + handle + ' is not open');
+        }
+        postQueryPage(handle);
+      } catch (error) {
+        console.error('[v0] Query page fetch failed:', error);
+        self.postMessage({
+          type: 'error',
+          data: {
+            message: 'Failed to fetch query results: ' + error.message,
+            stack: error.stack
+          }
+        });
+      }
+    }
+
+    function closeQuery(handle) {
+      if (queryFormats.delete(handle)) {
+        pyodide.globals.get('close_query')(handle);
+      }
+    }
+
+    function postQueryPage(handle) {
+      const fetchPage = pyodide.globals.get('fetch_query_page');
+      const pageProxy = fetchPage(handle);
+      const page = pageProxy.toJs({ dict_converter: Object.fromEntries });
+      pageProxy.destroy();
+      fetchPage.destroy();
+      
+      const format = queryFormats.get(handle);
+      if (!page.hasMore) {
+        queryFormats.delete(handle);
+      }
+      
+      const transfer = [];
+      const { rows, ...data } = page;
+      data.handle = page.hasMore ? handle : null;
+      if (format === 'columns') {
+        // Columnar: one array per column, all-numeric columns as transferable Float64Arrays
+        data.values = page.columns.map((_, i) => {
+          const column = rows.map(row => row[i]);
+          if (column.length > 0 && column.every(value => typeof value === 'number')) {
+            const typed = Float64Array.from(column);
+            transfer.push(typed.buffer);
+            return typed;
+          }
+          return column;
+        });
+      } else {
+        data.rows = rows.map(row => Object.fromEntries(page.columns.map((column, i) => [column, row[i]])));
+      }
+      
+      self.postMessage({ type: 'query_result', data }, transfer);
+    }
+
+    function getIndexAdvice() {
+      const adviceProxy = pyodide.runPython('get_index_advice()');
+      const recommendations = adviceProxy.toJs({ dict_converter: Object.fromEntries });
+      adviceProxy.destroy();
+      self.postMessage({ type: 'index_advice', data: recommendations });
+    }
+
     async function exportSQLiteDatabase() {
       try {
         // Exporting SQLite database silently
@@ -808,12 +957,14 @@ except Exception as e:
           throw new Error('Pyodide not initialized');
         }
 
-        if (!sqliteDbPath) {
+        if (!hasSqliteDb) {
           throw new Error('No SQLite database available. Please process an IFC file first.');
         }
 
-        // Read the SQLite database file from Pyodide's virtual filesystem
-        const bytes = pyodide.FS.readFile(sqliteDbPath);
+        // Serialize the in-memory database into a single buffer, without a copy on Pyodide's virtual filesystem
+        const outputBytes = pyodide.runPython('conversion_patcher.get_output_bytes()');
+        const bytes = outputBytes.toJs();
+        outputBytes.destroy();
 
         // Send the database bytes back to the main thread
         // Use transferrable ArrayBuffer for better performance
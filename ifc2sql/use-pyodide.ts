@@ -1,7 +1,14 @@
 "use client"
 
 import { useState, useCallback, useRef, useEffect } from "react"
-import { createPyodideWorker, type PyodideMessage, type ProcessingResult } from "@/src/lib/pyodide-worker"
+import {
+  createPyodideWorker,
+  type PyodideMessage,
+  type ProcessingResult,
+  type QueryOptions,
+  type QueryPage,
+  type IndexRecommendation,
+} from "@/src/lib/pyodide-worker"
 
 export interface ProcessingStatus {
   isProcessing: boolean
@@ -123,6 +130,14 @@ export function usePyodide() {
               }
               break
 
+            case "cancelled":
+              setStatus((prev) => ({ ...prev, isProcessing: false, progress: 0, currentStep: "Cancelled" }))
+              if (rejectRef.current) {
+                rejectRef.current(new Error("Processing cancelled"))
+                rejectRef.current = null
+              }
+              break
+
             case "error":
               setStatus((prev) => ({
                 ...prev,
@@ -171,19 +186,20 @@ export function usePyodide() {
     [isInitialized],
   )
 
-  const executeQuery = useCallback(
-    async (query: string): Promise<any[]> => {
+  const cancelProcessing = useCallback(() => {
+    workerRef.current?.postMessage({ type: "cancel" })
+  }, [])
+
+  const requestQueryPage = useCallback(
+    async (message: PyodideMessage): Promise<QueryPage> => {
       if (!workerRef.current || !isInitialized) {
         throw new Error("Pyodide not initialized")
       }
 
-      return new Promise<any[]>((resolve, reject) => {
+      return new Promise<QueryPage>((resolve, reject) => {
         const worker = workerRef.current!
 
-        worker.postMessage({
-          type: "execute_query",
-          data: { query: query.trim() },
-        })
+        worker.postMessage(message)
 
         const timeout = setTimeout(() => {
           reject(new Error("Query execution timeout"))
@@ -194,12 +210,10 @@ export function usePyodide() {
         worker.onmessage = (event) => {
           const { type, data } = event.data
 
-          console.log("[v0] Query worker response:", { type, data })
-
           if (type === "query_result") {
             clearTimeout(timeout)
             worker.onmessage = originalOnMessage
-            resolve(data)
+            resolve(data as QueryPage)
           } else if (type === "error") {
             clearTimeout(timeout)
             worker.onmessage = originalOnMessage
@@ -220,6 +234,52 @@ export function usePyodide() {
     [isInitialized],
   )
 
+  // Resolves with the first page, pass its handle to fetchQueryPage while hasMore is true
+  const executeQuery = useCallback(
+    (query: string, options: QueryOptions = {}): Promise<QueryPage> =>
+      requestQueryPage({ type: "execute_query", data: { ...options, query: query.trim() } }),
+    [requestQueryPage],
+  )
+
+  const fetchQueryPage = useCallback(
+    (handle: number): Promise<QueryPage> => requestQueryPage({ type: "fetch_query", data: { handle } }),
+    [requestQueryPage],
+  )
+
+  // Releases the cursor of a query whose remaining pages are not needed
+  const closeQuery = useCallback((handle: number) => {
+    workerRef.current?.postMessage({ type: "close_query", data: { handle } })
+  }, [])
+
+  // Indexes advised for the queries run so far, those used by 3 or more queries are already created
+  const getIndexAdvice = useCallback(async (): Promise<IndexRecommendation[]> => {
+    if (!workerRef.current || !isInitialized) {
+      throw new Error("Pyodide not initialized")
+    }
+
+    return new Promise<IndexRecommendation[]>((resolve, reject) => {
+      const worker = workerRef.current!
+
+      worker.postMessage({ type: "get_index_advice" })
+
+      const originalOnMessage = worker.onmessage
+
+      worker.onmessage = (event) => {
+        const { type, data } = event.data
+
+        if (type === "index_advice") {
+          worker.onmessage = originalOnMessage
+          resolve(data as IndexRecommendation[])
+        } else if (type === "error") {
+          worker.onmessage = originalOnMessage
+          reject(new Error(data.message || "Index advice failed"))
+        } else if (originalOnMessage) {
+          originalOnMessage.call(worker, event)
+        }
+      }
+    })
+  }, [isInitialized])
+
   const exportSQLite = useCallback(
     async (): Promise<Uint8Array> => {
       if (!workerRef.current || !isInitialized) {
@@ -298,7 +358,11 @@ export function usePyodide() {
     isInitialized,
     initializePyodide,
     processIfcFile,
+    cancelProcessing,
     executeQuery,
+    fetchQueryPage,
+    closeQuery,
+    getIndexAdvice,
     exportSQLite,
     cleanup,
   }
@@ -23,19 +23,13 @@ import json
 import time
 import tempfile
 import typing
+import importlib.util
 import itertools
 import logging
-import numpy as np
-import multiprocessing
 import ifcopenshell
-import ifcopenshell.geom
 import ifcopenshell.ifcopenshell_wrapper as W
 import ifcopenshell.util.attribute
-import ifcopenshell.util.element
-import ifcopenshell.util.placement
 import ifcopenshell.util.schema
-import ifcopenshell.util.shape
-import ifcopenshell.util.unit
 import ifcpatch
 from pathlib import Path
 from typing import Any, TYPE_CHECKING, Literal, Union
@@ -44,6 +38,7 @@ from typing_extensions import assert_never
 SQLTypes = typing.Literal["SQLite", "MySQL"]
 
 if TYPE_CHECKING:
+    import numpy as np
     import sqlite3
     import mysql.connector
     import mysql.connector.abstracts
@@ -54,16 +49,18 @@ else:
         # SQLite support not available
         SQLTypes = typing.Literal["MySQL"]
 
-    try:
-        import mysql.connector
-        import mysql.connector.abstracts
-    except:
+    # mysql.connector is imported when a MySQL conversion starts, as it is slow to import
+    if importlib.util.find_spec("mysql") is None:
         # MySQL support not available
         SQLTypes = typing.Literal["SQLite"]
 
 DEFAULT_DATABASE_NAME = "database"
 
 
+class ConversionCancelled(Exception):
+    pass
+
+
 class Patcher(ifcpatch.BasePatcher):
     def __init__(
         self,
@@ -73,7 +70,7 @@ class Patcher(ifcpatch.BasePatcher):
         host: str = "localhost",
         username: str = "root",
         password: str = "pass",
-        database: str = DEFAULT_DATABASE_NAME,
+        database: Union[str, "sqlite3.Connection"] = DEFAULT_DATABASE_NAME,
         full_schema: bool = True,
         is_strict: bool = False,
         should_expand: bool = False,
@@ -81,6 +78,29 @@ class Patcher(ifcpatch.BasePatcher):
         should_get_psets: bool = True,
         should_get_geometry: bool = True,
         should_skip_geometry_data: bool = False,
+        should_commit_progressively: bool = False,
+        should_get_spatial_closure: bool = False,
+        should_get_room_assignment: bool = False,
+        should_get_geometric_quantities: bool = False,
+        should_get_search_index: bool = False,
+        should_get_associations: bool = False,
+        should_compact_psets: bool = False,
+        should_get_lods: bool = False,
+        lod_ratios: tuple[float, ...] = (0.5, 0.2, 0.05),
+        should_track_changes: bool = False,
+        should_resume: bool = False,
+        should_get_supertypes: bool = False,
+        materialised_supertypes: tuple[str, ...] = (),
+        geometry_time_budget: Union[float, None] = None,
+        should_retry_deferred_geometry: bool = True,
+        should_preview: bool = False,
+        should_optimise_storage: bool = False,
+        sparse_column_threshold: float = 0.05,
+        should_get_pset_pivots: bool = False,
+        pset_pivot_threshold: float = 0.25,
+        should_get_guid_map: bool = False,
+        should_compact_guids: bool = False,
+        should_get_stats: bool = False,
     ):
         """Convert an IFC-SPF model to SQLite or MySQL.
 
@@ -90,6 +110,9 @@ class Patcher(ifcpatch.BasePatcher):
             Could also be a directory, then the database will be stored
             using default filename (e.g. 'database.sqlite').
             If filepath is missing fitting suffix, it will be added.
+            Could also be ":memory:" or an open ``sqlite3.Connection``, then
+            nothing is written to disk and the connection is left open after
+            the conversion, see ``get_output_bytes``.
             For MySQL - database name.
         :filter_glob database: *.db;*.sqlite
         :param full_schema: if True, will create tables for all IFC classes,
@@ -111,7 +134,116 @@ class Patcher(ifcpatch.BasePatcher):
         :param should_skip_geometry_data: Whether or not to also create tables for
             IfcRepresentation and IfcRepresentationItem classes. These tables are
             unnecessary if you are not interested in geometry.
-
+        :param should_commit_progressively: if True, the database is committed
+            after every class (SQLite uses WAL journaling) and completed work is
+            recorded in a conversion_status table. This lets other connections
+            query finished tables while the conversion is still running. Spatial
+            structure and products are converted first and geometry last.
+        :param should_get_spatial_closure: if True, a spatial_closure table will
+            be created mapping every decomposed or contained object to its
+            nearest space, storey, building and site, so spatial lookups are a
+            single indexed join instead of walking relationships.
+        :param should_get_room_assignment: if True, IfcSpace geometry is also
+            tessellated and every element is geometrically assigned to the
+            spaces containing it, stored in an element_space table. Elements
+            whose centroid lies inside a space volume are marked "centroid",
+            others fall back to bounding box overlap and are marked "aabb".
+            Requires should_get_geometry.
+        :param should_get_geometric_quantities: if True, IfcSpace geometry is
+            also tessellated and a geometric_quantities table is created with
+            surface area, volume, footprint area, height and plan bounding
+            dimensions (in metres) computed from each tessellated shape. Useful
+            when authoring tools did not export base quantities. Requires
+            should_get_geometry.
+        :param should_get_search_index: if True, an FTS5 full-text table called
+            search_index will be created over Name, Description, ObjectType,
+            GlobalId and property set names and values (if should_get_psets).
+            SQLite only, ignored if SQLite was built without FTS5.
+        :param should_get_associations: if True, material and classification
+            associations (including those inherited from the element type) are
+            resolved once into element_material and element_classification
+            tables, so material take-offs don't have to walk layer sets.
+        :param should_compact_psets: if True, class, property set and property
+            names are interned into class_def, pset_def and prop_def lookup
+            tables and only integer keys are stored per row (in id_map_data and
+            pset_values). The id_map and psets views keep the usual columns so
+            existing queries keep working.
+        :param should_get_lods: if True, simplified meshes are generated for
+            every geometry by vertex clustering and stored in a geometry_lod
+            table together with their maximum vertex displacement, so viewers
+            can load a coarse model first. Requires should_get_geometry.
+        :param lod_ratios: Target vertex count ratios of the generated levels of
+            detail, from finest to coarsest. Levels that would not reduce the
+            mesh any further are skipped, consumers should then fall back to the
+            next finer level or the full geometry.
+        :param should_track_changes: if True, triggers are added so that every
+            inserted, updated or deleted row of a class table is recorded in a
+            dirty table, and every edited psets value in a dirty_psets table.
+            Use WriteBack to then patch only those entities into the original
+            IFC file. SQLite only.
+        :param should_resume: if True, continue an interrupted conversion into
+            the same database instead of starting over. Implies
+            should_commit_progressively, whose conversion_status table serves
+            as the checkpoint ledger: completed classes and stages are
+            skipped, partially converted classes and geometry continue after
+            their last committed batch. Work since that batch was never
+            committed and is rolled back by the database.
+        :param should_get_supertypes: if True, a UNION ALL view is created for
+            every abstract supertype of the converted classes (e.g. IfcElement,
+            IfcBuildingElement, IfcProduct) with an ifc_class column and the
+            attributes all its subtypes share.
+        :param materialised_supertypes: Abstract supertypes to store as real
+            tables instead, indexed on ifc_id, ifc_class and GlobalId, for
+            frequent polymorphic queries. They are a snapshot taken at
+            conversion time, e.g. ("IfcElement", "IfcSpatialElement").
+        :param geometry_time_budget: if set, elements are tessellated one at a
+            time in worker processes, with at most this many seconds each. An
+            element exceeding it gets a bounding box placeholder (of its shape
+            without openings and booleans) and is listed in a geometry_status
+            table, so one pathological element can't stall the conversion.
+            Requires subprocesses, so is not available in Pyodide.
+        :param should_retry_deferred_geometry: if True, elements that exceeded
+            geometry_time_budget are tessellated again without a budget once all
+            other geometry is stored, replacing their placeholders.
+        :param should_preview: if True, a preview is committed before anything
+            else: the id_map, the spatial structure with its aggregation and
+            containment relationships, and the rows of all other products
+            without inverses. Their inverses, psets and geometry then follow
+            and the product rows are replaced in place, class by class (see the
+            "preview" status in conversion_status). Implies
+            should_commit_progressively.
+        :param should_optimise_storage: if True, class tables with mostly NULL
+            columns are rebuilt once converted: those columns are folded into
+            a JSON extras column of a <class>_data table (STRICT if supported)
+            and <class> becomes a view with the original columns. Tables with
+            indexes or triggers (e.g. should_track_changes) are kept as they
+            are. The database is then analysed and vacuumed. SQLite only.
+        :param sparse_column_threshold: Columns whose share of non NULL values
+            is at most this are folded by should_optimise_storage. Floats are
+            never folded, as they would not round trip through JSON text.
+        :param should_get_pset_pivots: if True, a <class>_props table is
+            created per class with psets, with one typed and indexed column
+            per frequent property, named "<pset name>.<property name>". So
+            filtering by several properties is a single table lookup instead
+            of a self join of psets per property. Like materialised
+            supertypes, they are a snapshot taken at conversion time. Requires
+            should_get_psets, SQLite only.
+        :param pset_pivot_threshold: Share of the elements of a class that must
+            have a property for it to get a column in should_get_pset_pivots.
+        :param should_get_guid_map: if True, a guid_map table keyed by GlobalId
+            is created with the ifc_id and ifc_class of every rooted entity, so
+            a GlobalId is resolved with one index lookup instead of scanning
+            the GlobalId column of every class table.
+        :param should_compact_guids: if True, guid_map stores GlobalIds decoded
+            into their 16 byte binary form (e.g. unhex of
+            ifcopenshell.guid.expand) instead of 22 characters, for a smaller
+            table and index. Invalid GlobalIds are kept as text.
+        :param should_get_stats: if True, statistics are gathered from the
+            rows as they are inserted into a catalog of stats_* tables: rows
+            per class, null fraction and numeric range per attribute, elements
+            per pset and rows, nulls and numeric range per property. Summaries
+            then read a few catalog rows instead of scanning every table. Like
+            materialised supertypes, they are a snapshot of the conversion.
 
         Example:
 
@@ -138,14 +270,52 @@ class Patcher(ifcpatch.BasePatcher):
         self.should_get_psets = should_get_psets
         self.should_get_geometry = should_get_geometry
         self.should_skip_geometry_data = should_skip_geometry_data
+        self.should_commit_progressively = should_commit_progressively
+        self.should_get_spatial_closure = should_get_spatial_closure
+        self.should_get_room_assignment = should_get_room_assignment
+        self.should_get_geometric_quantities = should_get_geometric_quantities
+        self.should_get_search_index = should_get_search_index
+        self.should_get_associations = should_get_associations
+        self.should_compact_psets = should_compact_psets
+        self.should_get_lods = should_get_lods
+        self.lod_ratios = lod_ratios
+        self.should_track_changes = should_track_changes
+        self.should_resume = should_resume
+        self.should_get_supertypes = should_get_supertypes
+        self.materialised_supertypes = materialised_supertypes
+        self.geometry_time_budget = geometry_time_budget
+        self.should_retry_deferred_geometry = should_retry_deferred_geometry
+        self.should_preview = should_preview
+        self.should_optimise_storage = should_optimise_storage
+        self.sparse_column_threshold = sparse_column_threshold
+        self.should_get_pset_pivots = should_get_pset_pivots
+        self.pset_pivot_threshold = pset_pivot_threshold
+        self.should_get_guid_map = should_get_guid_map
+        self.should_compact_guids = should_compact_guids
+        self.should_get_stats = should_get_stats
+        if self.should_resume or self.should_preview:
+            self.should_commit_progressively = True
 
     geometry_rows: dict[str, tuple[str, bytes, bytes, bytes, bytes, str]]
     shape_rows: dict[int, tuple[int, list[float], list[float], list[float], bytes, str]]
 
     def get_output(self) -> Union[str, None]:
-        """Return resulting database filepath for sqlite and ``None`` for mysql."""
+        """Return resulting database filepath for sqlite and ``None`` for mysql or an in-memory database."""
         return self.file_patched
 
+    def get_output_bytes(self) -> bytes:
+        """Return the converted SQLite database as a single buffer.
+
+        For an in-memory database or a passed connection this serializes the
+        connection, so the database can be handed over (e.g. from Pyodide to
+        JavaScript) without writing it to a filesystem first.
+        """
+        if self.sql_type != "sqlite":
+            raise ValueError("Only SQLite databases can be returned as bytes")
+        if self.file_patched is None:
+            return self.db.serialize()
+        return Path(self.file_patched).read_bytes()
+
     my_sql_classes_json_attrs: dict[str, list[int]]
     """Mapping ifc_class -> list of attr indices.
 
@@ -154,7 +324,50 @@ class Patcher(ifcpatch.BasePatcher):
     (mysql doesn't convert them automatically, unlike sqlite)"""
 
     def patch(self) -> None:
-        if self.sql_type == "sqlite":
+        for _ in self.patch_iter():
+            pass
+
+    async def patch_async(
+        self, cancel: Union[typing.Callable[[], bool], None] = None, batch_size: int = 10000
+    ) -> typing.AsyncIterator[dict[str, Any]]:
+        """Like patch_iter, but hands control back to the event loop after every event.
+
+        In a Pyodide worker this lets ``onmessage`` run during the conversion,
+        so progress can be posted and a cancel message can set the flag polled
+        by ``cancel``.
+        """
+        import asyncio
+
+        events = self.patch_iter(cancel, batch_size)
+        try:
+            for event in events:
+                yield event
+                await asyncio.sleep(0)
+        finally:
+            events.close()
+
+    def patch_iter(
+        self, cancel: Union[typing.Callable[[], bool], None] = None, batch_size: int = 10000
+    ) -> typing.Iterator[dict[str, Any]]:
+        """Convert step by step, yielding a progress event between classes and batches.
+
+        Each event is a dict with a ``kind`` ("stage", "class" or "geometry"),
+        a ``name`` and an overall ``progress`` from 0 to 100. ``cancel``
+        returning True, or closing the iterator early (``close()``, or dropping
+        it so it is garbage collected), stops the conversion at that event,
+        rolls back uncommitted work and closes the database. ``is_cancelled``
+        is then True, unless the final "conversion" event was already reached.
+        With ``should_commit_progressively`` the classes completed so far are
+        kept.
+
+        :param cancel: Callable polled after every event, e.g. ``threading.Event().is_set``.
+        :param batch_size: Maximum number of elements inserted between two events.
+        """
+        self.cancel = cancel
+        self.batch_size = batch_size
+        if self.sql_type == "sqlite" and (isinstance(self.database, sqlite3.Connection) or self.database == ":memory:"):
+            database = self.database
+        elif self.sql_type == "sqlite":
             database = Path(self.database)
             if database.is_dir():
                 database = database / DEFAULT_DATABASE_NAME
@@ -175,99 +388,266 @@ class Patcher(ifcpatch.BasePatcher):
         self.schema = ifcopenshell.schema_by_name(self.file.schema_identifier)
 
         if self.sql_type == "sqlite":
-            self.db = sqlite3.connect(database)
+            if isinstance(database, sqlite3.Connection):
+                self.db = database
+            else:
+                self.db = sqlite3.connect(database)
             self.c = self.db.cursor()
-            self.file_patched = database
+            # In-memory databases only exist as long as their connection, so it is kept open.
+            self.is_kept_open = not isinstance(database, str) or database == ":memory:"
+            self.file_patched = None if self.is_kept_open else database
 
             # SQLite performance optimizations for bulk inserts
-            self.c.execute("PRAGMA synchronous = OFF")  # Don't wait for disk sync
-            self.c.execute("PRAGMA journal_mode = MEMORY")  # Keep journal in memory
+            if self.should_commit_progressively:
+                # WAL lets readers see committed classes while we keep writing
+                self.c.execute("PRAGMA journal_mode = WAL")
+                self.c.execute("PRAGMA synchronous = NORMAL")
+            else:
+                self.c.execute("PRAGMA synchronous = OFF")  # Don't wait for disk sync
+                self.c.execute("PRAGMA journal_mode = MEMORY")  # Keep journal in memory
             self.c.execute("PRAGMA cache_size = -64000")  # 64MB cache (negative = KB)
             self.c.execute("PRAGMA temp_store = MEMORY")  # Temp tables in memory
             self.c.execute("PRAGMA mmap_size = 268435456")  # 256MB memory map
         elif self.sql_type == "mysql":
+            import mysql.connector
+
             self.db = mysql.connector.connect(
                 host=self.host, user=self.username, password=self.password, database=database
             )
             self.c = self.db.cursor()
+            self.is_kept_open = False
             self.file_patched = None
         else:
             assert False
 
-        self.check_existing_ifc_database()
-        self.create_id_map()
-        self.create_metadata()
+        self.is_cancelled = False
+        is_complete = False
+        try:
+            self.def_ids: dict[str, dict[str, int]] = {}
+            self.prop_def_ids: dict[tuple[str, str], int] = {}
+            self.stats_attributes: dict[str, list[tuple[str, bool]]] = {}
+
+            self.check_existing_ifc_database()
+            self.checkpoints = self.get_checkpoints()
+            # A resumed preview has all id_map rows and preview product rows, even if should_preview is off now
+            self.has_preview = self.should_preview or "preview" in self.checkpoints
+            self.create_id_map()
+            if not self.checkpoints:
+                self.create_metadata()
+            elif self.should_compact_psets:
+                self.load_def_ids()
+
+            if self.should_commit_progressively:
+                self.create_conversion_status_table()
+                self.mark_progress("conversion", "stage", "running")
 
-        if self.should_get_psets:
-            self.create_pset_table()
-
-        if self.should_get_geometry:
-            self.create_geometry_table()
-            self.create_geometry()
+            if self.should_get_psets:
+                self.create_pset_table()
+
+            if self.should_get_search_index:
+                self.create_search_index_table()
+
+            if self.should_get_guid_map:
+                self.create_guid_map_table()
+
+            if self.should_get_stats:
+                self.create_stats_tables()
+
+            if self.should_get_spatial_closure and not self.is_complete("spatial_closure"):
+                self.create_spatial_closure()
+                self.mark_progress("spatial_closure", "stage")
+
+            if self.should_get_associations and not self.is_complete("associations"):
+                self.create_associations()
+                self.mark_progress("associations", "stage")
+
+            yield from self.report_progress("stage", "setup", 0)
+
+            self.shape_rows = {}
+            self.geometry_rows = {}
+            self.stored_shape_ids: set[int] = set()
+            self.stored_geometry_ids: set[str] = set()
+            self.pending_shape_ids: list[int] = []
+            self.pending_geometry_ids: list[str] = []
+            self.placeholder_ids: set[int] = set()
+            self.failed_shape_ids: set[int] = set()
+            self.replaced_shape_ids: set[int] = set()
+            geometry_share = 35 if self.should_get_geometry else 0
+            class_share = 95 - geometry_share
+            if self.should_get_geometry:
+                self.create_geometry_table()
+                from ifcopenshell.util.unit import calculate_unit_scale
+
+                # Also needed by the stages after geometry when a resumed conversion skips create_geometry
+                self.unit_scale = calculate_unit_scale(self.file)
+                self.placement_matrices = self.get_placement_matrices()
+                if self.checkpoints:
+                    self.load_geometry_rows()
+                if not self.should_commit_progressively:
+                    for percent in self.create_geometry():
+                        yield from self.report_progress("geometry", "geometry", geometry_share * percent / 100)
+
+            if self.full_schema:
+                # Get all possible IFC classes from schema
+                all_schema_classes = [
+                    d.name()
+                    for d in self.schema.declarations()
+                    if isinstance(d, ifcopenshell.ifcopenshell_wrapper.entity)
+                ]
+                # But only use classes that actually exist in the file
+                existing_classes = set(self.file.wrapped_data.types())
+                ifc_classes = [cls for cls in all_schema_classes if cls in existing_classes]
+            else:
+                ifc_classes = self.file.wrapped_data.types()
 
-        if self.full_schema:
-            # Get all possible IFC classes from schema
-            all_schema_classes = [
-                d.name() for d in self.schema.declarations() if isinstance(d, ifcopenshell.ifcopenshell_wrapper.entity)
-            ]
-            # But only use classes that actually exist in the file
-            existing_classes = set(self.file.wrapped_data.types())
-            ifc_classes = [cls for cls in all_schema_classes if cls in existing_classes]
-        else:
-            ifc_classes = self.file.wrapped_data.types()
+            if self.should_commit_progressively:
+                ifc_classes = sorted(ifc_classes, key=self.get_class_priority)
 
-        total_classes = len(ifc_classes)
-        for i, ifc_class in enumerate(ifc_classes, 1):
-            declaration = self.schema.declaration_by_name(ifc_class)
+            if self.has_preview and not self.is_complete("preview"):
+                self.create_preview(ifc_classes)
+                yield from self.report_progress("stage", "preview", 0)
 
-            if self.should_skip_geometry_data:
-                if ifcopenshell.util.schema.is_a(declaration, "IfcRepresentation") or ifcopenshell.util.schema.is_a(
-                    declaration, "IfcRepresentationItem"
-                ):
+            total_classes = len(ifc_classes)
+            class_tables = []
+            class_offset = 0 if self.should_commit_progressively else geometry_share
+            for i, ifc_class in enumerate(ifc_classes, 1):
+                if self.is_skipped(ifc_class):
                     continue
 
-            # Only log major progress milestones to reduce overhead
-            if i % 10 == 0 or i == total_classes or i == 1:
-                pass  # Processing class silently
-
-            if self.sql_type == "sqlite":
-                self.create_sqlite_table(ifc_class, declaration)
-            elif self.sql_type == "mysql":
-                self.my_sql_classes_json_attrs = {}
-                self.create_mysql_table(ifc_class, declaration)
-            self.insert_data(ifc_class)
+                # Only log major progress milestones to reduce overhead
+                if i % 10 == 0 or i == total_classes or i == 1:
+                    pass  # Processing class silently
+
+                class_tables.append(ifc_class)
+                elements = self.file.by_type(ifc_class, include_subtypes=False)
+                status, total_elements = self.checkpoints.get(ifc_class, (None, 0))
+                if self.should_get_geometry and not self.is_complete("geometry"):
+                    # Placement only shape rows are written with the geometry, so rebuild them for skipped elements
+                    for element in elements if status == "complete" else elements[:total_elements]:
+                        self.add_placement_shape_row(element)
+                if status == "complete":
+                    continue
 
-        if self.should_get_geometry:
-            if self.sql_type == "sqlite":
-                assert isinstance(self.c, sqlite3.Cursor)
-                if self.shape_rows:
-                    self.c.executemany("INSERT INTO shape VALUES (?, ?, ?, ?, ?, ?);", self.shape_rows.values())
-                if self.geometry_rows:
-                    self.c.executemany("INSERT INTO geometry VALUES (?, ?, ?, ?, ?, ?);", self.geometry_rows.values())
-            elif self.sql_type == "mysql":
-                assert isinstance(self.c, mysql.connector.abstracts.MySQLCursorAbstract)
-                if self.shape_rows:
-                    # mysql is requiring it to be a list or a tuple.
-                    values = list(self.shape_rows.values())
-                    self.c.executemany("INSERT INTO shape VALUES (%s, %s, %s, %s, %s, %s);", values)
-                # Do row by row in case of max_allowed_packet
-                for row in self.geometry_rows.values():
-                    self.c.execute("INSERT INTO geometry VALUES (%s, %s, %s, %s, %s, %s);", row)
+                self.create_class_table(ifc_class)
+                is_preview_class = self.has_preview and self.get_class_priority(ifc_class) == 1
+                for start in range(total_elements, len(elements), self.batch_size):
+                    if is_preview_class:
+                        # Swap preview rows for full ones in the same transaction, readers always see every element
+                        self.delete_rows(ifc_class, elements[start : start + self.batch_size])
+                    total_elements += self.insert_data(ifc_class, elements[start : start + self.batch_size])
+                    if total_elements < len(elements):
+                        self.mark_progress(ifc_class, "class", "running", row_count=total_elements)
+                    progress = (i - 1 + total_elements / len(elements)) / total_classes
+                    yield from self.report_progress("class", ifc_class, class_offset + class_share * progress)
+                self.mark_progress(ifc_class, "class", row_count=total_elements)
+
+            if (self.should_get_supertypes or self.materialised_supertypes) and not self.is_complete("supertypes"):
+                create_supertypes(
+                    self.c,
+                    self.sql_type,
+                    self.schema,
+                    class_tables,
+                    self.should_get_supertypes,
+                    self.materialised_supertypes,
+                    has_inverses=self.should_get_inverses,
+                    is_unique=not self.should_expand,
+                )
+                self.mark_progress("supertypes", "stage")
+
+            is_pivoted = self.should_get_pset_pivots and self.should_get_psets and self.sql_type == "sqlite"
+            if is_pivoted and not self.is_complete("pset_pivots"):
+                pset_table = "pset_values" if self.should_compact_psets else "psets"
+                create_pset_pivots(self.c, class_tables, self.pset_pivot_threshold, pset_table)
+                self.mark_progress("pset_pivots", "stage")
+                yield from self.report_progress("stage", "pset_pivots", class_offset + class_share)
+
+            if self.should_get_geometry and not self.is_complete("geometry"):
+                if self.should_commit_progressively:
+                    # Tessellation is the slowest stage, so do it once the class tables are readable.
+                    for percent in self.create_geometry():
+                        # Checkpoint tessellated shapes only, placement only rows may still be replaced
+                        self.insert_geometry_rows(self.pending_shape_ids, self.pending_geometry_ids)
+                        self.pending_shape_ids, self.pending_geometry_ids = [], []
+                        self.mark_progress("geometry", "stage", "running", row_count=len(self.stored_shape_ids))
+                        progress = class_share + geometry_share * percent / 100
+                        yield from self.report_progress("geometry", "geometry", progress)
+                self.insert_geometry_rows(self.shape_rows, self.geometry_rows)
+                self.mark_progress("geometry", "stage", row_count=len(self.shape_rows))
 
-        self.db.commit()
-        self.c.close()  # Important for static use of Patcher on Windows.
-        self.db.close()
+            if self.should_get_geometry:
+                if self.should_get_room_assignment and not self.is_complete("room_assignment"):
+                    self.create_room_assignment()
+                    self.mark_progress("room_assignment", "stage")
+                    yield from self.report_progress("stage", "room_assignment", 95)
+
+                if self.should_get_geometric_quantities and not self.is_complete("geometric_quantities"):
+                    self.create_geometric_quantities()
+                    self.mark_progress("geometric_quantities", "stage")
+                    yield from self.report_progress("stage", "geometric_quantities", 95)
+
+                if self.should_get_lods and not self.is_complete("lods"):
+                    self.create_lods()
+                    self.mark_progress("lods", "stage")
+                    yield from self.report_progress("stage", "lods", 95)
+
+            if self.should_track_changes:
+                self.create_change_tracking()
+
+            is_optimised = self.should_optimise_storage and self.sql_type == "sqlite"
+            if is_optimised and not self.is_complete("storage"):
+                optimise_storage(self.c, class_tables, self.sparse_column_threshold)
+                self.mark_progress("storage", "stage")
+                yield from self.report_progress("stage", "storage", 95)
+
+            if self.should_get_search_index:
+                # Merge the b-tree segments written per class into one for faster queries.
+                self.c.execute("INSERT INTO search_index(search_index) VALUES ('optimize');")
+
+            self.mark_progress("conversion", "stage")
+            self.db.commit()
+            is_complete = True
+            yield from self.report_progress("stage", "conversion", 100)
+            if is_optimised:
+                try:
+                    self.c.execute("VACUUM")
+                except sqlite3.OperationalError:
+                    pass  # A reader still holds the database open
+            if self.should_commit_progressively and self.sql_type == "sqlite":
+                # Fold the WAL back into the main file so the database is a single, shippable file.
+                try:
+                    self.c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    self.c.execute("PRAGMA journal_mode = DELETE")
+                except sqlite3.OperationalError:
+                    pass  # A reader still holds the database open, keep WAL
+        except ConversionCancelled:
+            self.is_cancelled = not is_complete
+        except GeneratorExit:
+            # The consumer closed the iterator, or dropped it, before the conversion finished
+            self.is_cancelled = not is_complete
+            raise
+        finally:
+            # Uncommitted work is rolled back on close, also when the consumer stops iterating early.
+            self.c.close()  # Important for static use of Patcher on Windows.
+            if self.is_kept_open:
+                self.db.rollback()
+            else:
+                self.db.close()
 
-    def create_geometry(self) -> None:
-        self.unit_scale = ifcopenshell.util.unit.calculate_unit_scale(self.file)
+    def report_progress(self, kind: str, name: str, progress: float) -> typing.Iterator[dict[str, Any]]:
+        yield {"kind": kind, "name": name, "progress": progress}
+        if self.cancel and self.cancel():
+            raise ConversionCancelled()
 
-        self.shape_rows = {}
-        self.geometry_rows = {}
+    def create_geometry(self) -> typing.Iterator[float]:
+        """Tessellate elements into shape_rows and geometry_rows, yielding the percentage done every 250 shapes."""
+        import ifcopenshell.geom
 
         if self.file.schema in ("IFC2X3", "IFC4"):
             self.elements = self.file.by_type("IfcElement") + self.file.by_type("IfcProxy")
         else:
             self.elements = self.file.by_type("IfcElement")
+        if self.should_get_room_assignment or self.should_get_geometric_quantities:
+            self.elements += self.file.by_type("IfcSpace")
 
         self.settings = ifcopenshell.geom.settings()
         self.settings.set("apply-default-materials", False)
@@ -287,8 +667,33 @@ class Patcher(ifcpatch.BasePatcher):
         )
         self.settings.set("context-ids", self.body_contexts)
 
-        products = self.elements
-        iterator = ifcopenshell.geom.iterator(self.settings, self.file, multiprocessing.cpu_count(), include=products)
+        # When resuming, shapes tessellated before the interruption are already stored
+        products = [e for e in self.elements if e.id() not in self.stored_shape_ids]
+        if self.geometry_time_budget is None:
+            yield from self.iterate_geometry(products)
+            return
+
+        if products:
+            for percent in self.create_budgeted_geometry(products):
+                yield 0.9 * percent
+        deferred_ids = self.placeholder_ids | self.failed_shape_ids
+        if self.should_retry_deferred_geometry and deferred_ids:
+            deferred = [self.file.by_id(i) for i in sorted(deferred_ids)]
+            # Placeholders stay in place until the replacing shape is inserted, see insert_geometry_rows
+            self.replaced_shape_ids = self.stored_shape_ids & deferred_ids
+            self.stored_shape_ids -= deferred_ids
+            for percent in self.iterate_geometry(deferred):
+                yield 90 + 0.1 * percent
+            self.remove_placeholders(deferred_ids)
+
+    def iterate_geometry(self, products: list[ifcopenshell.entity_instance]) -> typing.Iterator[float]:
+        """Tessellate products with the geometry iterator, yielding the percentage done every 250 shapes."""
+        import ifcopenshell.geom
+        import ifcopenshell.util.shape
+
+        if not products:
+            return
+        iterator = ifcopenshell.geom.iterator(self.settings, self.file, os.cpu_count() or 1, include=products)
         valid_file = iterator.initialize()
         if not valid_file:
             # If there were no elements, iterator will also fail and it's okay not to report it.
@@ -304,12 +709,11 @@ class Patcher(ifcpatch.BasePatcher):
                 percent_created = round(progress / total * 100)
                 percent_preprocessed = iterator.progress()
                 percent_average = (percent_created + percent_preprocessed) / 2
-                pass  # Geometry processing progress silently tracked
+                yield percent_average
                 checkpoint = time.time()
             shape = iterator.get()
             if shape:
                 assert isinstance(shape, W.TriangulationElement)
-                shape_id = shape.id
                 geometry = shape.geometry
                 geometry_id = geometry.id
                 if geometry_id not in self.geometry_rows:
@@ -319,17 +723,602 @@ class Patcher(ifcpatch.BasePatcher):
                     mids = geometry.material_ids_buffer
                     m = json.dumps([m.instance_id() for m in geometry.materials])
                     self.geometry_rows[geometry_id] = (geometry_id, v, e, f, mids, m)
-                # Copy required since otherwise it is read-only
-                m = ifcopenshell.util.shape.get_shape_matrix(shape).copy()
-                m[:3, 3] /= self.unit_scale
-                x, y, z = m[:, 3][0:3].tolist()
-                self.shape_rows[shape_id] = (shape_id, x, y, z, m.tobytes(), geometry_id)
+                    self.pending_geometry_ids.append(geometry_id)
+                self.add_shape_row(shape.id, ifcopenshell.util.shape.get_shape_matrix(shape), geometry_id)
             if not iterator.next():
                 break
 
+    def add_shape_row(self, shape_id: int, matrix: "np.ndarray", geometry_id: str) -> None:
+        # Copy required since otherwise it is read-only
+        m = matrix.copy()
+        m[:3, 3] /= self.unit_scale
+        x, y, z = m[:, 3][0:3].tolist()
+        self.shape_rows[shape_id] = (shape_id, x, y, z, m.tobytes(), geometry_id)
+        self.pending_shape_ids.append(shape_id)
+
+    def create_budgeted_geometry(self, products: list[ifcopenshell.entity_instance]) -> typing.Iterator[float]:
+        """Tessellate products in worker processes, yielding the percentage done every 250 shapes.
+
+        A worker still busy with an element after geometry_time_budget seconds
+        is killed and replaced. The element is queued again to be tessellated
+        without openings and booleans, whose bounding box becomes a placeholder.
+        If that also fails or exceeds the budget, the element has no geometry.
+        """
+        import multiprocessing
+        import multiprocessing.connection
+
+        budget = self.geometry_time_budget
+        assert budget is not None
+        settings = {"apply-default-materials": False, "context-ids": self.body_contexts}
+        queue = [(element.id(), False) for element in reversed(products)]
+        total = len(queue)
+        progress = reported = 0
+        # Per worker connection: its process, the (element id, is_simplified) it works on and its deadline
+        workers: dict[Any, dict[str, Any]] = {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "model.ifc")
+            self.file.write(filepath)
+            try:
+                while queue or workers:
+                    while queue and len(workers) < min(os.cpu_count() or 1, len(queue)):
+                        connection, worker_connection = multiprocessing.Pipe()
+                        process = multiprocessing.Process(
+                            target=tessellate_elements, args=(filepath, settings, worker_connection), daemon=True
+                        )
+                        process.start()
+                        worker_connection.close()
+                        # Loading the model does not count towards the budget, the worker reports when it is ready
+                        workers[connection] = {"process": process, "element": None, "deadline": None}
+
+                    deadlines = [w["deadline"] for w in workers.values() if w["deadline"] is not None]
+                    timeout = max(0.0, min(deadlines) - time.time()) if deadlines else None
+                    for connection in multiprocessing.connection.wait(list(workers), timeout):
+                        worker = workers[connection]
+                        try:
+                            result = connection.recv()
+                        except EOFError:
+                            if worker["element"] is None:
+                                raise RuntimeError("Geometry worker process failed to load the model")
+                            worker["deadline"] = 0.0  # It crashed on the element, handle it like exceeding the budget
+                            continue
+                        if worker["element"] is not None:
+                            self.add_budgeted_shape(*worker["element"], result)
+                            progress += 1
+                        if queue:
+                            worker["element"] = queue.pop()
+                            worker["deadline"] = time.time() + budget
+                            connection.send(worker["element"])
+                        else:
+                            self.stop_worker(workers.pop(connection), connection)
+
+                    now = time.time()
+                    for connection, worker in list(workers.items()):
+                        if worker["deadline"] is not None and worker["deadline"] <= now:
+                            self.stop_worker(workers.pop(connection), connection)
+                            element_id, is_simplified = worker["element"]
+                            if is_simplified:
+                                self.add_budgeted_shape(element_id, True, None)
+                                progress += 1
+                            else:
+                                queue.append((element_id, True))
+
+                    if progress >= reported + 250:
+                        reported = progress
+                        yield round(progress / total * 100)
+            finally:
+                for connection, worker in workers.items():
+                    self.stop_worker(worker, connection)
+
+    def stop_worker(self, worker: dict[str, Any], connection: Any) -> None:
+        worker["process"].terminate()
+        worker["process"].join()
+        connection.close()
+
+    def add_budgeted_shape(self, element_id: int, is_simplified: bool, result: Union[tuple[Any, ...], None]) -> None:
+        """Store the shape a worker process tessellated, or the bounding box placeholder of a simplified shape."""
+        import numpy as np
+
+        if result is None:
+            if is_simplified:
+                self.set_geometry_status(element_id, "failed")
+                self.failed_shape_ids.add(element_id)
+            return
+        geometry_row, matrix = result
+        if is_simplified:
+            verts = np.frombuffer(geometry_row[1], dtype="d").reshape(-1, 3)
+            geometry_row = self.get_box_geometry_row(f"{element_id}-placeholder", verts.min(axis=0), verts.max(axis=0))
+            self.placeholder_ids.add(element_id)
+            self.set_geometry_status(element_id, "placeholder")
+        geometry_id = geometry_row[0]
+        if geometry_id not in self.geometry_rows:
+            self.geometry_rows[geometry_id] = geometry_row
+            self.pending_geometry_ids.append(geometry_id)
+        self.add_shape_row(element_id, matrix, geometry_id)
+
+    def get_box_geometry_row(
+        self, geometry_id: str, lower: "np.ndarray", upper: "np.ndarray"
+    ) -> tuple[str, bytes, bytes, bytes, bytes, str]:
+        import numpy as np
+
+        corners = np.array([[(lower, upper)[(i >> axis) & 1][axis] for axis in range(3)] for i in range(8)], dtype="d")
+        faces = np.array(
+            [
+                [0, 2, 1], [1, 2, 3], [4, 5, 6], [5, 7, 6], [0, 1, 4], [1, 5, 4],
+                [2, 6, 3], [3, 6, 7], [0, 4, 2], [2, 4, 6], [1, 3, 5], [3, 7, 5],
+            ],
+            dtype=np.int32,
+        )  # fmt: skip
+        edges = np.array(
+            [[0, 1], [2, 3], [4, 5], [6, 7], [0, 2], [1, 3], [4, 6], [5, 7], [0, 4], [1, 5], [2, 6], [3, 7]],
+            dtype=np.int32,
+        )
+        material_ids = np.full(len(faces), -1, dtype=np.int32)
+        return (geometry_id, corners.tobytes(), edges.tobytes(), faces.tobytes(), material_ids.tobytes(), "[]")
+
+    def set_geometry_status(self, ifc_id: int, status: str) -> None:
+        if self.sql_type == "sqlite":
+            self.c.execute("INSERT OR REPLACE INTO geometry_status VALUES (?, ?);", (ifc_id, status))
+        elif self.sql_type == "mysql":
+            self.c.execute("REPLACE INTO geometry_status VALUES (%s, %s);", (ifc_id, status))
+
+    def remove_placeholders(self, deferred_ids: set[int]) -> None:
+        """Drop the placeholders of deferred elements that are now tessellated and flag them as deferred."""
+        replaced_ids = {i for i in deferred_ids if self.shape_rows.get(i, (None,) * 6)[5] != f"{i}-placeholder"}
+        for ifc_id in replaced_ids:
+            self.set_geometry_status(ifc_id, "deferred")
+        self.placeholder_ids -= replaced_ids
+        self.failed_shape_ids -= replaced_ids
+        geometry_ids = [f"{i}-placeholder" for i in replaced_ids]
+        for geometry_id in geometry_ids:
+            self.geometry_rows.pop(geometry_id, None)
+        self.pending_geometry_ids = [i for i in self.pending_geometry_ids if i in self.geometry_rows]
+        stored_ids = [i for i in geometry_ids if i in self.stored_geometry_ids]
+        self.stored_geometry_ids.difference_update(stored_ids)
+        if stored_ids:
+            placeholders = ", ".join(["?" if self.sql_type == "sqlite" else "%s"] * len(stored_ids))
+            self.c.execute(f"DELETE FROM geometry WHERE id IN ({placeholders});", stored_ids)
+
+    def insert_geometry_rows(self, shape_ids: typing.Iterable[int], geometry_ids: typing.Iterable[str]) -> None:
+        """Insert the shape and geometry rows of the given ids that are not stored yet."""
+        shape_rows = [self.shape_rows[i] for i in shape_ids if i not in self.stored_shape_ids]
+        geometry_rows = [self.geometry_rows[i] for i in geometry_ids if i not in self.stored_geometry_ids]
+        self.stored_shape_ids.update(row[0] for row in shape_rows)
+        self.stored_geometry_ids.update(row[0] for row in geometry_rows)
+        # Stored placeholders of deferred elements are replaced in the same transaction, so readers always see a shape
+        replaced_ids = [row[0] for row in shape_rows if row[0] in self.replaced_shape_ids]
+        self.replaced_shape_ids.difference_update(replaced_ids)
+        if self.sql_type == "sqlite":
+            assert isinstance(self.c, sqlite3.Cursor)
+            if replaced_ids:
+                placeholders = ", ".join("?" * len(replaced_ids))
+                self.c.execute(f"DELETE FROM shape WHERE ifc_id IN ({placeholders});", replaced_ids)
+            if shape_rows:
+                self.c.executemany("INSERT INTO shape VALUES (?, ?, ?, ?, ?, ?);", shape_rows)
+            if geometry_rows:
+                self.c.executemany("INSERT INTO geometry VALUES (?, ?, ?, ?, ?, ?);", geometry_rows)
+        elif self.sql_type == "mysql":
+            import mysql.connector.abstracts
+
+            assert isinstance(self.c, mysql.connector.abstracts.MySQLCursorAbstract)
+            if replaced_ids:
+                placeholders = ", ".join(["%s"] * len(replaced_ids))
+                self.c.execute(f"DELETE FROM shape WHERE ifc_id IN ({placeholders});", replaced_ids)
+            if shape_rows:
+                self.c.executemany("INSERT INTO shape VALUES (%s, %s, %s, %s, %s, %s);", shape_rows)
+            # Do row by row in case of max_allowed_packet
+            for row in geometry_rows:
+                self.c.execute("INSERT INTO geometry VALUES (%s, %s, %s, %s, %s, %s);", row)
+
+    def load_geometry_rows(self) -> None:
+        """Load shapes and geometries stored by an interrupted conversion, needed by the later geometry stages."""
+        self.c.execute("SELECT * FROM shape;")
+        for row in self.c.fetchall():
+            self.shape_rows[row[0]] = tuple(row)
+        self.c.execute("SELECT * FROM geometry;")
+        for row in self.c.fetchall():
+            self.geometry_rows[row[0]] = tuple(row)
+        self.stored_shape_ids.update(self.shape_rows)
+        self.stored_geometry_ids.update(self.geometry_rows)
+        if self.geometry_time_budget is not None:
+            self.c.execute("SELECT ifc_id, status FROM geometry_status;")
+            for ifc_id, status in self.c.fetchall():
+                if status == "placeholder":
+                    self.placeholder_ids.add(ifc_id)
+                elif status == "failed":
+                    self.failed_shape_ids.add(ifc_id)
+
+    def get_mesh(self, geometry_id: str) -> tuple["np.ndarray", "np.ndarray"]:
+        """Return local vertices (n, 3) in metres and triangle indices (m, 3) of a geometry row."""
+        import numpy as np
+
+        _, verts, _, faces, _, _ = self.geometry_rows[geometry_id]
+        return np.frombuffer(verts, dtype="d").reshape(-1, 3), np.frombuffer(faces, dtype=np.int32).reshape(-1, 3)
+
+    def get_world_verts(self, verts: "np.ndarray", matrix: bytes) -> "np.ndarray":
+        """Transform local vertices by a shape row matrix into world coordinates in metres."""
+        import numpy as np
+
+        m = np.frombuffer(matrix, dtype="d").reshape(4, 4)
+        # Shape row translations are stored in project units, see create_geometry.
+        return verts @ m[:3, :3].T + m[:3, 3] * self.unit_scale
+
+    def create_room_assignment(self) -> None:
+        if self.sql_type == "sqlite":
+            statement = """
+            CREATE TABLE IF NOT EXISTS element_space (
+                element_id integer NOT NULL,
+                space_id integer NOT NULL,
+                method text
+            );
+            """
+        elif self.sql_type == "mysql":
+            statement = """
+            CREATE TABLE IF NOT EXISTS `element_space` (
+              `element_id` int(10) unsigned NOT NULL,
+              `space_id` int(10) unsigned NOT NULL,
+              `method` varchar(255) DEFAULT NULL,
+              KEY `idx_element_space_element_id` (`element_id`),
+              KEY `idx_element_space_space_id` (`space_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+        if self.sql_type == "sqlite":
+            self.c.execute("CREATE INDEX IF NOT EXISTS idx_element_space_element_id ON element_space (element_id);")
+            self.c.execute("CREATE INDEX IF NOT EXISTS idx_element_space_space_id ON element_space (space_id);")
+
+        rows = self.get_room_assignment_rows()
+        if not rows:
+            return
+        if self.sql_type == "sqlite":
+            self.c.executemany("INSERT INTO element_space VALUES (?, ?, ?);", rows)
+        elif self.sql_type == "mysql":
+            self.c.executemany("INSERT INTO element_space VALUES (%s, %s, %s);", rows)
+
+    def get_room_assignment_rows(self, tolerance: float = 0.01) -> list[tuple[int, int, str]]:
+        """Assign tessellated elements to the IfcSpace volumes containing them.
+
+        A grid based bounding box broad phase selects candidate spaces for every
+        element, then the element centroids are tested against each candidate
+        space mesh with batched ray casting. Elements whose centroid is in no
+        space (typically walls and slabs bounding rooms) are assigned to every
+        space their bounding box overlaps.
+
+        :param tolerance: Bounding box padding in metres.
+        """
+        import numpy as np
+
+        space_ids = {space.id() for space in self.file.by_type("IfcSpace")}
+        spaces: list[tuple[int, np.ndarray]] = []
+        element_ids: list[int] = []
+        element_bounds: list[np.ndarray] = []
+        for shape_id, _, _, _, matrix, geometry_id in self.shape_rows.values():
+            if geometry_id is None:
+                continue
+            verts, faces = self.get_mesh(geometry_id)
+            if not len(faces):
+                continue
+            world_verts = self.get_world_verts(verts, matrix)
+            if shape_id in space_ids:
+                spaces.append((shape_id, world_verts[faces]))
+            else:
+                element_ids.append(shape_id)
+                element_bounds.append(np.stack((world_verts.min(axis=0), world_verts.max(axis=0))))
+        if not spaces or not element_ids:
+            return []
+
+        space_min = np.array([triangles.reshape(-1, 3).min(axis=0) for _, triangles in spaces]) - tolerance
+        space_max = np.array([triangles.reshape(-1, 3).max(axis=0) for _, triangles in spaces]) + tolerance
+        bounds = np.array(element_bounds)
+        element_min, element_max = bounds[:, 0], bounds[:, 1]
+        centroids = (element_min + element_max) / 2
+
+        # Narrow phase, one batched point-in-mesh test per candidate space.
+        rows: list[tuple[int, int, str]] = []
+        is_assigned = np.zeros(len(element_ids), dtype=bool)
+        candidates = self.get_box_overlaps(centroids, centroids, space_min, space_max)
+        candidates = candidates[np.argsort(candidates[:, 1], kind="stable")]
+        space_indices, group_starts = np.unique(candidates[:, 1], return_index=True)
+        for space_index, element_indices in zip(space_indices, np.split(candidates[:, 0], group_starts[1:])):
+            space_id, triangles = spaces[space_index]
+            inside = element_indices[self.get_points_in_mesh(centroids[element_indices], triangles)]
+            is_assigned[inside] = True
+            rows.extend((element_ids[i], space_id, "centroid") for i in inside.tolist())
+
+        unassigned = np.flatnonzero(~is_assigned)
+        overlaps = self.get_box_overlaps(element_min[unassigned], element_max[unassigned], space_min, space_max)
+        for element_index, space_index in overlaps.tolist():
+            rows.append((element_ids[unassigned[element_index]], spaces[space_index][0], "aabb"))
+        return rows
+
+    def get_box_overlaps(
+        self, query_min: "np.ndarray", query_max: "np.ndarray", box_min: "np.ndarray", box_max: "np.ndarray"
+    ) -> "np.ndarray":
+        """Return (query index, box index) pairs of overlapping 3D bounding boxes.
+
+        Boxes are hashed into a uniform XY grid sized after the median box, so
+        only boxes sharing a grid cell are compared instead of all pairs.
+        """
+        import numpy as np
+
+        if not len(query_min) or not len(box_min):
+            return np.empty((0, 2), dtype=np.int64)
+        cell_size = max(float(np.median(box_max[:, :2] - box_min[:, :2])), 1e-3)
+        origin = np.minimum(query_min[:, :2].min(axis=0), box_min[:, :2].min(axis=0))
+
+        def get_cells(lower: "np.ndarray", upper: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+            start = np.floor((lower[:, :2] - origin) / cell_size).astype(np.int64)
+            size = np.floor((upper[:, :2] - origin) / cell_size).astype(np.int64) - start + 1
+            counts = size.prod(axis=1)
+            owner = np.repeat(np.arange(len(lower)), counts)
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            x = start[owner, 0] + local % size[owner, 0]
+            y = start[owner, 1] + local // size[owner, 0]
+            return owner, (x << 32) | y
+
+        box_owner, box_keys = get_cells(box_min, box_max)
+        order = np.argsort(box_keys, kind="stable")
+        box_owner, box_keys = box_owner[order], box_keys[order]
+
+        query_owner, query_keys = get_cells(query_min, query_max)
+        lo = np.searchsorted(box_keys, query_keys, side="left")
+        matches = np.searchsorted(box_keys, query_keys, side="right") - lo
+        query_index = np.repeat(query_owner, matches)
+        offsets = np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches)
+        box_index = box_owner[np.repeat(lo, matches) + offsets]
+
+        # Large boxes share several cells, so drop duplicates before the exact test.
+        pairs = np.unique(np.stack((query_index, box_index), axis=1), axis=0)
+        q, b = pairs[:, 0], pairs[:, 1]
+        overlaps = np.all((query_min[q] <= box_max[b]) & (query_max[q] >= box_min[b]), axis=1)
+        return pairs[overlaps]
+
+    def get_points_in_mesh(self, points: "np.ndarray", triangles: "np.ndarray") -> "np.ndarray":
+        """Even-odd ray casting of points (n, 3) against a closed mesh of triangles (m, 3, 3).
+
+        Uses a vectorised Möller-Trumbore intersection of every point with every
+        triangle. The ray direction is deliberately skewed so that it does not
+        graze the edges of axis aligned meshes.
+        """
+        import numpy as np
+
+        direction = np.array([0.2113, 0.4227, 0.8813])
+        v0 = triangles[:, 0]
+        e1 = triangles[:, 1] - v0
+        e2 = triangles[:, 2] - v0
+        p = np.cross(direction, e2)
+        det = np.einsum("ij,ij->i", e1, p)
+        valid = np.abs(det) > 1e-12
+        v0, e1, e2, p = v0[valid], e1[valid], e2[valid], p[valid]
+        inv_det = 1.0 / det[valid]
+
+        inside = np.zeros(len(points), dtype=bool)
+        chunk = max(1, 2**20 // max(len(v0), 1))
+        for start in range(0, len(points), chunk):
+            t_vec = points[start : start + chunk, None] - v0
+            u = np.einsum("kmj,mj->km", t_vec, p) * inv_det
+            q = np.cross(t_vec, e1)
+            v = (q @ direction) * inv_det
+            t = np.einsum("kmj,mj->km", q, e2) * inv_det
+            hits = (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+            inside[start : start + chunk] = np.count_nonzero(hits, axis=1) % 2 == 1
+        return inside
+
+    def create_geometric_quantities(self) -> None:
+        if self.sql_type == "sqlite":
+            statement = """
+            CREATE TABLE IF NOT EXISTS geometric_quantities (
+                ifc_id integer PRIMARY KEY NOT NULL,
+                surface_area real,
+                volume real,
+                footprint_area real,
+                height real,
+                size_x real,
+                size_y real
+            );
+            """
+        elif self.sql_type == "mysql":
+            statement = """
+            CREATE TABLE IF NOT EXISTS `geometric_quantities` (
+              `ifc_id` int(10) unsigned NOT NULL,
+              `surface_area` double DEFAULT NULL,
+              `volume` double DEFAULT NULL,
+              `footprint_area` double DEFAULT NULL,
+              `height` double DEFAULT NULL,
+              `size_x` double DEFAULT NULL,
+              `size_y` double DEFAULT NULL,
+              PRIMARY KEY (`ifc_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+
+        rows = self.get_geometric_quantities_rows()
+        if not rows:
+            return
+        if self.sql_type == "sqlite":
+            self.c.executemany("INSERT INTO geometric_quantities VALUES (?, ?, ?, ?, ?, ?, ?);", rows)
+        elif self.sql_type == "mysql":
+            self.c.executemany("INSERT INTO geometric_quantities VALUES (%s, %s, %s, %s, %s, %s, %s);", rows)
+
+    def get_geometric_quantities_rows(self, batch_size: int = 2**20) -> list[tuple[Any, ...]]:
+        """Compute quantities of every tessellated shape, batching triangles of many shapes.
+
+        :param batch_size: Approximate number of triangles processed per batch.
+        """
+        import numpy as np
+
+        rows: list[tuple[Any, ...]] = []
+        shape_ids: list[int] = []
+        triangles: list[np.ndarray] = []
+        total = 0
+        for shape_id, _, _, _, matrix, geometry_id in self.shape_rows.values():
+            if geometry_id is None:
+                continue
+            verts, faces = self.get_mesh(geometry_id)
+            if not len(faces):
+                continue
+            # Quantities are translation invariant, only rotation and scale are applied.
+            m = np.frombuffer(matrix, dtype="d").reshape(4, 4)
+            shape_ids.append(shape_id)
+            triangles.append((verts @ m[:3, :3].T)[faces])
+            total += len(faces)
+            if total >= batch_size:
+                rows.extend(self.get_mesh_quantities(shape_ids, triangles))
+                shape_ids, triangles, total = [], [], 0
+        if shape_ids:
+            rows.extend(self.get_mesh_quantities(shape_ids, triangles))
+        return rows
+
+    def get_mesh_quantities(self, shape_ids: list[int], triangles: list["np.ndarray"]) -> list[tuple[Any, ...]]:
+        """Vectorised quantities for a batch of meshes, each given as triangles (m, 3, 3) in metres.
+
+        Volume uses the divergence theorem (sum of signed tetrahedra to the
+        origin), footprint is the mean of the upward and downward projected
+        triangle areas, which for closed meshes is orientation independent.
+        """
+        import numpy as np
+
+        counts = np.array([len(t) for t in triangles])
+        starts = np.cumsum(counts) - counts
+        tris = np.concatenate(triangles)
+        cross = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+        surface_area = np.add.reduceat(np.linalg.norm(cross, axis=1), starts) / 2
+        volume = np.abs(np.add.reduceat(np.einsum("ij,ij->i", tris[:, 0], cross), starts)) / 6
+        footprint_area = np.add.reduceat(np.abs(cross[:, 2]), starts) / 4
+        points = tris.reshape(-1, 3)
+        size = np.maximum.reduceat(points, starts * 3) - np.minimum.reduceat(points, starts * 3)
+        return list(
+            zip(
+                shape_ids,
+                surface_area.tolist(),
+                volume.tolist(),
+                footprint_area.tolist(),
+                size[:, 2].tolist(),
+                size[:, 0].tolist(),
+                size[:, 1].tolist(),
+            )
+        )
+
+    def create_lods(self) -> None:
+        import numpy as np
+
+        if self.sql_type == "sqlite":
+            statement = """
+            CREATE TABLE IF NOT EXISTS geometry_lod (
+                id text NOT NULL,
+                lod integer NOT NULL,
+                ratio real,
+                verts blob,
+                faces blob,
+                material_ids blob,
+                error real
+            );
+            """
+        elif self.sql_type == "mysql":
+            # mediumblob holds up to 16mb, see create_geometry_table
+            statement = """
+            CREATE TABLE IF NOT EXISTS `geometry_lod` (
+              `id` varchar(255) NOT NULL,
+              `lod` int(10) unsigned NOT NULL,
+              `ratio` double DEFAULT NULL,
+              `verts` mediumblob,
+              `faces` mediumblob,
+              `material_ids` mediumblob,
+              `error` double DEFAULT NULL,
+              KEY `idx_geometry_lod_id` (`id`, `lod`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+        if self.sql_type == "sqlite":
+            self.c.execute("CREATE INDEX IF NOT EXISTS idx_geometry_lod_id ON geometry_lod (id, lod);")
+
+        for geometry_id, _, _, _, material_ids, _ in self.geometry_rows.values():
+            verts, faces = self.get_mesh(geometry_id)
+            if len(verts) < 32:
+                continue  # Simple shapes such as boxes are already as coarse as they can be
+            material_ids = np.frombuffer(material_ids, dtype=np.int32)
+            previous_count = len(verts)
+            for lod, ratio in enumerate(self.lod_ratios, 1):
+                lod_verts, lod_faces, kept_faces, error = self.get_simplified_mesh(verts, faces, ratio)
+                if len(lod_verts) >= previous_count or not len(lod_faces):
+                    continue
+                previous_count = len(lod_verts)
+                lod_material_ids = material_ids[kept_faces] if len(material_ids) == len(faces) else material_ids
+                row = (
+                    geometry_id,
+                    lod,
+                    ratio,
+                    lod_verts.tobytes(),
+                    lod_faces.tobytes(),
+                    lod_material_ids.tobytes(),
+                    error,
+                )
+                if self.sql_type == "sqlite":
+                    self.c.execute("INSERT INTO geometry_lod VALUES (?, ?, ?, ?, ?, ?, ?);", row)
+                elif self.sql_type == "mysql":
+                    self.c.execute("INSERT INTO geometry_lod VALUES (%s, %s, %s, %s, %s, %s, %s);", row)
+
+    def get_simplified_mesh(
+        self, verts: "np.ndarray", faces: "np.ndarray", ratio: float
+    ) -> tuple["np.ndarray", "np.ndarray", "np.ndarray", float]:
+        """Decimate a mesh by vertex clustering on a uniform grid.
+
+        The grid cell size is bisected until roughly ``ratio`` of the vertices
+        remain. Each cluster collapses to the mean of its vertices, faces that
+        become degenerate or duplicated are dropped.
+
+        :return: Simplified vertices (float64), faces (int32), indices of the
+            original faces that were kept and the maximum distance a vertex moved.
+        """
+        import numpy as np
+
+        target = max(int(len(verts) * ratio), 4)
+        origin = verts.min(axis=0)
+        extent = float((verts.max(axis=0) - origin).max()) or 1.0
+
+        low, high = 0.0, extent
+        cell_size = extent / max(target ** (1 / 3), 1.0)
+        for _ in range(16):
+            cells = np.floor((verts - origin) / cell_size).astype(np.int64)
+            _, inverse = np.unique(cells, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            cluster_count = inverse.max() + 1
+            if cluster_count > target:
+                low = cell_size
+            elif cluster_count < target * 0.8:
+                high = cell_size
+            else:
+                break
+            cell_size = (low + high) / 2
+
+        counts = np.bincount(inverse)
+        new_verts = np.stack([np.bincount(inverse, weights=verts[:, i]) / counts for i in range(3)], axis=1)
+        error = float(np.linalg.norm(verts - new_verts[inverse], axis=1).max())
+
+        new_faces = inverse[faces]
+        is_valid = (
+            (new_faces[:, 0] != new_faces[:, 1])
+            & (new_faces[:, 1] != new_faces[:, 2])
+            & (new_faces[:, 0] != new_faces[:, 2])
+        )
+        kept_faces = np.flatnonzero(is_valid)
+        # The same triangle may be produced by several collapsed faces.
+        _, unique_indices = np.unique(np.sort(new_faces[kept_faces], axis=1), axis=0, return_index=True)
+        kept_faces = kept_faces[np.sort(unique_indices)]
+
+        # Drop clusters that are no longer referenced by any face.
+        used, remapped = np.unique(new_faces[kept_faces], return_inverse=True)
+        return new_verts[used], remapped.reshape(-1, 3).astype(np.int32), kept_faces, error
+
     def check_existing_ifc_database(self) -> None:
         if self.sql_type == "sqlite":
-            cursor = self.c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='id_map'")
+            cursor = self.c.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name='id_map'")
             assert cursor is not None
             row = cursor.fetchone()
         elif self.sql_type == "mysql":
@@ -345,17 +1334,46 @@ class Patcher(ifcpatch.BasePatcher):
             assert_never(self.sql_type)
 
         if row is not None:
+            if self.should_resume and not self.has_table("conversion_status"):
+                raise ValueError("Cannot resume, the database was not converted with should_commit_progressively")
             # TODO: convert to error as it's unsafe?
             pass  # Database already used for ifc2sql patch before
 
+    def has_table(self, name: str) -> bool:
+        if self.sql_type == "sqlite":
+            self.c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (name,))
+        elif self.sql_type == "mysql":
+            query = "SELECT 1 FROM information_schema.tables WHERE table_schema = %s AND table_name = %s LIMIT 1;"
+            self.c.execute(query, (self.database, name))
+        return self.c.fetchone() is not None
+
+    def get_checkpoints(self) -> dict[str, tuple[str, int]]:
+        """Return the status and committed row count of each class and stage in the ledger when resuming."""
+        if not self.should_resume or not self.has_table("conversion_status"):
+            return {}
+        self.c.execute("SELECT name, status, row_count FROM conversion_status;")
+        return {name: (status, row_count or 0) for name, status, row_count in self.c.fetchall()}
+
+    def is_complete(self, name: str) -> bool:
+        return self.checkpoints.get(name, (None, 0))[0] == "complete"
+
+    def load_def_ids(self) -> None:
+        """Reload interned names so resumed rows keep using the ids already stored."""
+        for table in ("class_def", "pset_def"):
+            self.c.execute(f"SELECT id, name FROM {table};")
+            self.def_ids[table] = {name: def_id for def_id, name in self.c.fetchall()}
+        self.c.execute("SELECT p.id, d.name, p.name FROM prop_def p JOIN pset_def d ON d.id = p.pset_id;")
+        self.prop_def_ids = {(pset_name, name): prop_id for prop_id, pset_name, name in self.c.fetchall()}
+
     def create_id_map(self) -> None:
+        if self.should_compact_psets:
+            self.create_compact_id_map()
+            return
         if self.sql_type == "sqlite":
-            statement = (
-                "CREATE TABLE IF NOT EXISTS id_map (ifc_id integer PRIMARY KEY NOT NULL UNIQUE, ifc_class text);"
-            )
+            statement = "CREATE TABLE IF NOT EXISTS id_map (ifc_id integer PRIMARY KEY NOT NULL, ifc_class text);"
         elif self.sql_type == "mysql":
             statement = """
-            CREATE TABLE `id_map` (
+            CREATE TABLE IF NOT EXISTS `id_map` (
               `ifc_id` int(10) unsigned NOT NULL,
               `ifc_class` varchar(255) NOT NULL,
               PRIMARY KEY (`ifc_id`)
@@ -389,7 +1407,222 @@ class Patcher(ifcpatch.BasePatcher):
             self.c.execute(statement)
             self.c.execute("INSERT INTO metadata VALUES (%s, %s, %s);", metadata)
 
+    def create_conversion_status_table(self) -> None:
+        if self.sql_type == "sqlite":
+            statement = """
+            CREATE TABLE IF NOT EXISTS conversion_status (
+                name text PRIMARY KEY NOT NULL,
+                kind text,
+                status text,
+                row_count integer,
+                updated_at real
+            ) WITHOUT ROWID;
+            """
+        elif self.sql_type == "mysql":
+            statement = """
+            CREATE TABLE IF NOT EXISTS `conversion_status` (
+              `name` varchar(255) NOT NULL,
+              `kind` varchar(255) DEFAULT NULL,
+              `status` varchar(255) DEFAULT NULL,
+              `row_count` int(10) unsigned DEFAULT NULL,
+              `updated_at` double DEFAULT NULL,
+              PRIMARY KEY (`name`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+
+    def mark_progress(self, name: str, kind: str, status: str = "complete", row_count: Union[int, None] = None) -> None:
+        """Record a finished unit of work in conversion_status and commit it.
+
+        Does nothing unless ``should_commit_progressively`` is enabled.
+
+        :param name: IFC class name or stage name (e.g. "geometry", "conversion").
+        :param kind: "class" or "stage".
+        """
+        if not self.should_commit_progressively:
+            return
+        row = (name, kind, status, row_count, time.time())
+        if self.sql_type == "sqlite":
+            self.c.execute("INSERT OR REPLACE INTO conversion_status VALUES (?, ?, ?, ?, ?);", row)
+        elif self.sql_type == "mysql":
+            self.c.execute("REPLACE INTO conversion_status VALUES (%s, %s, %s, %s, %s);", row)
+        self.db.commit()
+
+    def create_preview(self, ifc_classes: list[str]) -> None:
+        """Insert the id_map of all classes and the preview tier, committed in one go.
+
+        Spatial structure classes, IfcRelAggregates and
+        IfcRelContainedInSpatialStructure are converted in full. Other products
+        get preview rows, which the class loop replaces in place.
+        """
+        ifc_classes = [c for c in ifc_classes if not self.is_skipped(c)]
+        id_map_rows = []
+        for ifc_class in ifc_classes:
+            class_key = self.get_def_id("class_def", ifc_class) if self.should_compact_psets else ifc_class
+            id_map_rows.extend((e.id(), class_key) for e in self.file.by_type(ifc_class, include_subtypes=False))
+        id_map_table = "id_map_data" if self.should_compact_psets else "id_map"
+        placeholder = "?" if self.sql_type == "sqlite" else "%s"
+        if id_map_rows:
+            self.c.executemany(f"INSERT INTO {id_map_table} VALUES ({placeholder}, {placeholder});", id_map_rows)
+
+        statuses = []
+        for ifc_class in ifc_classes:
+            if (priority := self.get_class_priority(ifc_class)) == 2:
+                continue
+            self.create_class_table(ifc_class)
+            total_elements = self.insert_data(ifc_class, is_preview=priority == 1)
+            statuses.append((ifc_class, "preview", 0) if priority == 1 else (ifc_class, "complete", total_elements))
+        for ifc_class, status, row_count in statuses:
+            self.mark_progress(ifc_class, "class", status, row_count=row_count)
+            self.checkpoints[ifc_class] = (status, row_count)
+        self.mark_progress("preview", "stage")
+
+    def is_skipped(self, ifc_class: str) -> bool:
+        """Whether a class gets no table, as it holds geometry data and should_skip_geometry_data is set."""
+        if not self.should_skip_geometry_data:
+            return False
+        declaration = self.schema.declaration_by_name(ifc_class)
+        return ifcopenshell.util.schema.is_a(declaration, "IfcRepresentation") or ifcopenshell.util.schema.is_a(
+            declaration, "IfcRepresentationItem"
+        )
+
+    def create_class_table(self, ifc_class: str) -> None:
+        declaration = self.schema.declaration_by_name(ifc_class)
+        if self.sql_type == "sqlite":
+            self.create_sqlite_table(ifc_class, declaration)
+        elif self.sql_type == "mysql":
+            self.my_sql_classes_json_attrs = {}
+            self.create_mysql_table(ifc_class, declaration)
+
+    def delete_rows(self, ifc_class: str, elements: list[ifcopenshell.entity_instance], chunk_size: int = 500) -> None:
+        placeholder = "?" if self.sql_type == "sqlite" else "%s"
+        for start in range(0, len(elements), chunk_size):
+            ifc_ids = [e.id() for e in elements[start : start + chunk_size]]
+            placeholders = ", ".join([placeholder] * len(ifc_ids))
+            self.c.execute(f"DELETE FROM {ifc_class} WHERE ifc_id IN ({placeholders});", ifc_ids)
+
+    def get_class_priority(self, ifc_class: str) -> int:
+        """Sort key putting spatial structure first and other products second."""
+        declaration = self.schema.declaration_by_name(ifc_class)
+        if ifc_class in ("IfcRelAggregates", "IfcRelContainedInSpatialStructure"):
+            return 0
+        if ifcopenshell.util.schema.is_a(declaration, "IfcSpatialElement") or ifcopenshell.util.schema.is_a(
+            declaration, "IfcSpatialStructureElement"
+        ):
+            return 0
+        if ifcopenshell.util.schema.is_a(declaration, "IfcProduct"):
+            return 1
+        return 2
+
+    def create_compact_id_map(self) -> None:
+        if self.sql_type == "sqlite":
+            statements = [
+                "CREATE TABLE IF NOT EXISTS class_def (id integer PRIMARY KEY NOT NULL, name text NOT NULL);",
+                "CREATE TABLE IF NOT EXISTS id_map_data (ifc_id integer PRIMARY KEY NOT NULL, class_id integer);",
+            ]
+        elif self.sql_type == "mysql":
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS `class_def` (
+                  `id` int(10) unsigned NOT NULL,
+                  `name` varchar(255) NOT NULL,
+                  PRIMARY KEY (`id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS `id_map_data` (
+                  `ifc_id` int(10) unsigned NOT NULL,
+                  `class_id` int(10) unsigned NOT NULL,
+                  PRIMARY KEY (`ifc_id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+            ]
+        else:
+            assert False
+        for statement in statements:
+            self.c.execute(statement)
+        create_view = "CREATE VIEW IF NOT EXISTS" if self.sql_type == "sqlite" else "CREATE OR REPLACE VIEW"
+        self.c.execute(f"""
+            {create_view} id_map AS
+            SELECT d.ifc_id AS ifc_id, c.name AS ifc_class
+            FROM id_map_data d JOIN class_def c ON c.id = d.class_id;
+            """)
+
+    def create_compact_pset_table(self) -> None:
+        if self.sql_type == "sqlite":
+            statements = [
+                "CREATE TABLE IF NOT EXISTS pset_def (id integer PRIMARY KEY NOT NULL, name text);",
+                "CREATE TABLE IF NOT EXISTS prop_def (id integer PRIMARY KEY NOT NULL, pset_id integer, name text);",
+                "CREATE TABLE IF NOT EXISTS pset_values (ifc_id integer NOT NULL, prop_id integer NOT NULL, value text);",
+                "CREATE INDEX IF NOT EXISTS idx_pset_values_prop_id ON pset_values (prop_id);",
+            ]
+        elif self.sql_type == "mysql":
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS `pset_def` (
+                  `id` int(10) unsigned NOT NULL,
+                  `name` varchar(255) DEFAULT NULL,
+                  PRIMARY KEY (`id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS `prop_def` (
+                  `id` int(10) unsigned NOT NULL,
+                  `pset_id` int(10) unsigned NOT NULL,
+                  `name` varchar(255) DEFAULT NULL,
+                  PRIMARY KEY (`id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS `pset_values` (
+                  `ifc_id` int(10) unsigned NOT NULL,
+                  `prop_id` int(10) unsigned NOT NULL,
+                  `value` text,
+                  KEY `idx_pset_values_prop_id` (`prop_id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+            ]
+        else:
+            assert False
+        for statement in statements:
+            self.c.execute(statement)
+        create_view = "CREATE VIEW IF NOT EXISTS" if self.sql_type == "sqlite" else "CREATE OR REPLACE VIEW"
+        self.c.execute(f"""
+            {create_view} psets AS
+            SELECT v.ifc_id AS ifc_id, d.name AS pset_name, p.name AS name, v.value AS value
+            FROM pset_values v
+            JOIN prop_def p ON p.id = v.prop_id
+            JOIN pset_def d ON d.id = p.pset_id;
+            """)
+
+    def get_def_id(self, table: str, name: str) -> int:
+        """Return the interned id of a name in a class_def or pset_def table, inserting it if new."""
+        ids = self.def_ids.setdefault(table, {})
+        if (def_id := ids.get(name)) is None:
+            def_id = ids[name] = len(ids) + 1
+            if self.sql_type == "sqlite":
+                self.c.execute(f"INSERT INTO {table} VALUES (?, ?);", (def_id, name))
+            elif self.sql_type == "mysql":
+                self.c.execute(f"INSERT INTO {table} VALUES (%s, %s);", (def_id, name))
+        return def_id
+
+    def get_prop_def_id(self, pset_name: str, name: str) -> int:
+        """Return the interned id of a property of a property set, inserting it if new."""
+        if (prop_id := self.prop_def_ids.get((pset_name, name))) is None:
+            pset_id = self.get_def_id("pset_def", pset_name)
+            prop_id = self.prop_def_ids[(pset_name, name)] = len(self.prop_def_ids) + 1
+            if self.sql_type == "sqlite":
+                self.c.execute("INSERT INTO prop_def VALUES (?, ?, ?);", (prop_id, pset_id, name))
+            elif self.sql_type == "mysql":
+                self.c.execute("INSERT INTO prop_def VALUES (%s, %s, %s);", (prop_id, pset_id, name))
+        return prop_id
+
     def create_pset_table(self) -> None:
+        if self.should_compact_psets:
+            self.create_compact_pset_table()
+            return
         statement = """
         CREATE TABLE IF NOT EXISTS psets (
             ifc_id integer NOT NULL,
@@ -400,6 +1633,486 @@ class Patcher(ifcpatch.BasePatcher):
         """
         self.c.execute(statement)
 
+    def create_change_tracking(self) -> None:
+        """Add triggers recording edited rows, created after the bulk inserts so they don't slow them down."""
+        if self.sql_type != "sqlite":
+            return
+        self.c.execute("CREATE TABLE IF NOT EXISTS dirty (ifc_id integer PRIMARY KEY NOT NULL, ifc_class text);")
+        self.c.execute(
+            "CREATE TABLE IF NOT EXISTS dirty_psets "
+            "(ifc_id integer NOT NULL, pset_name text, name text, PRIMARY KEY (ifc_id, pset_name, name));"
+        )
+        tables = {row[0] for row in self.c.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+        for ifc_class in self.file.wrapped_data.types():
+            if ifc_class not in tables:
+                continue
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                self.c.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {ifc_class}_{event.lower()}_dirty AFTER {event} ON {ifc_class}
+                    BEGIN INSERT OR REPLACE INTO dirty VALUES ({row}.ifc_id, '{ifc_class}'); END;
+                    """)
+        if not self.should_get_psets:
+            return
+        if self.should_compact_psets:
+            self.c.execute("""
+                CREATE TRIGGER IF NOT EXISTS pset_values_update_dirty AFTER UPDATE OF value ON pset_values
+                BEGIN
+                    INSERT OR IGNORE INTO dirty_psets
+                    SELECT NEW.ifc_id, d.name, p.name FROM prop_def p JOIN pset_def d ON d.id = p.pset_id
+                    WHERE p.id = NEW.prop_id;
+                END;
+                """)
+        else:
+            self.c.execute("""
+                CREATE TRIGGER IF NOT EXISTS psets_update_dirty AFTER UPDATE OF value ON psets
+                BEGIN INSERT OR IGNORE INTO dirty_psets VALUES (NEW.ifc_id, NEW.pset_name, NEW.name); END;
+                """)
+
+    def create_guid_map_table(self) -> None:
+        # GlobalIds should be unique but aren't always, so ifc_id completes the key
+        if self.sql_type == "sqlite":
+            guid_type = "blob" if self.should_compact_guids else "text"
+            statement = f"""
+            CREATE TABLE IF NOT EXISTS guid_map (
+                guid {guid_type} NOT NULL,
+                ifc_id integer NOT NULL,
+                ifc_class text,
+                PRIMARY KEY (guid, ifc_id)
+            ) WITHOUT ROWID;
+            """
+        elif self.sql_type == "mysql":
+            guid_type = "varbinary(22)" if self.should_compact_guids else "varchar(22)"
+            statement = f"""
+            CREATE TABLE IF NOT EXISTS `guid_map` (
+              `guid` {guid_type} NOT NULL,
+              `ifc_id` int(10) unsigned NOT NULL,
+              `ifc_class` varchar(255) DEFAULT NULL,
+              PRIMARY KEY (`guid`, `ifc_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+
+    def get_guid_key(self, guid: str) -> Union[str, bytes]:
+        """Return the GlobalId as stored in guid_map, decoded to 16 bytes if should_compact_guids."""
+        if not self.should_compact_guids or len(guid) != 22:
+            return guid
+        import ifcopenshell.guid
+
+        try:
+            uuid = ifcopenshell.guid.expand(guid)
+        except ValueError:
+            return guid
+        # Characters beyond the 128 bits (e.g. a first character above 3) don't survive decoding
+        return bytes.fromhex(uuid) if ifcopenshell.guid.compress(uuid) == guid else guid
+
+    def create_stats_tables(self) -> None:
+        # Statistics of each batch are added to those of the batches before, see get_stats_upsert
+        if self.sql_type == "sqlite":
+            null_fraction = "null_fraction real GENERATED ALWAYS AS (CAST(null_count AS REAL) / row_count)"
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS stats_classes (
+                    ifc_class text PRIMARY KEY NOT NULL,
+                    row_count integer NOT NULL
+                ) WITHOUT ROWID;
+                """,
+                f"""
+                CREATE TABLE IF NOT EXISTS stats_columns (
+                    ifc_class text NOT NULL,
+                    name text NOT NULL,
+                    row_count integer NOT NULL,
+                    null_count integer NOT NULL,
+                    min_value real,
+                    max_value real,
+                    {null_fraction},
+                    PRIMARY KEY (ifc_class, name)
+                ) WITHOUT ROWID;
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS stats_psets (
+                    pset_name text PRIMARY KEY NOT NULL,
+                    element_count integer NOT NULL
+                ) WITHOUT ROWID;
+                """,
+                f"""
+                CREATE TABLE IF NOT EXISTS stats_properties (
+                    pset_name text NOT NULL,
+                    name text NOT NULL,
+                    row_count integer NOT NULL,
+                    null_count integer NOT NULL,
+                    min_value real,
+                    max_value real,
+                    {null_fraction},
+                    PRIMARY KEY (pset_name, name)
+                ) WITHOUT ROWID;
+                """,
+            ]
+        elif self.sql_type == "mysql":
+            table_options = "ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci"
+            null_fraction = "`null_fraction` double AS (`null_count` / `row_count`)"
+            statements = [
+                f"""
+                CREATE TABLE IF NOT EXISTS `stats_classes` (
+                  `ifc_class` varchar(255) NOT NULL,
+                  `row_count` int(10) unsigned NOT NULL,
+                  PRIMARY KEY (`ifc_class`)
+                ) {table_options};
+                """,
+                f"""
+                CREATE TABLE IF NOT EXISTS `stats_columns` (
+                  `ifc_class` varchar(255) NOT NULL,
+                  `name` varchar(255) NOT NULL,
+                  `row_count` int(10) unsigned NOT NULL,
+                  `null_count` int(10) unsigned NOT NULL,
+                  `min_value` double DEFAULT NULL,
+                  `max_value` double DEFAULT NULL,
+                  {null_fraction},
+                  PRIMARY KEY (`ifc_class`, `name`)
+                ) {table_options};
+                """,
+                f"""
+                CREATE TABLE IF NOT EXISTS `stats_psets` (
+                  `pset_name` varchar(255) NOT NULL,
+                  `element_count` int(10) unsigned NOT NULL,
+                  PRIMARY KEY (`pset_name`)
+                ) {table_options};
+                """,
+                f"""
+                CREATE TABLE IF NOT EXISTS `stats_properties` (
+                  `pset_name` varchar(255) NOT NULL,
+                  `name` varchar(255) NOT NULL,
+                  `row_count` int(10) unsigned NOT NULL,
+                  `null_count` int(10) unsigned NOT NULL,
+                  `min_value` double DEFAULT NULL,
+                  `max_value` double DEFAULT NULL,
+                  {null_fraction},
+                  PRIMARY KEY (`pset_name`, `name`)
+                ) {table_options};
+                """,
+            ]
+        else:
+            assert False
+        for statement in statements:
+            self.c.execute(statement)
+
+    def get_stats_attributes(self, ifc_class: str) -> list[tuple[str, bool]]:
+        """Return the name of each attribute column of a class table and whether it holds numbers."""
+        if ifc_class not in self.stats_attributes:
+            self.stats_attributes[ifc_class] = [
+                (a.name(), ifcopenshell.util.attribute.get_primitive_type(a) in ("float", "integer", "number"))
+                for a in self.schema.declaration_by_name(ifc_class).all_attributes()
+            ]
+        return self.stats_attributes[ifc_class]
+
+    def insert_stats(self, ifc_class: str, rows: list[list[Any]], pset_rows: list[tuple[int, str, str, Any]]) -> None:
+        """Add the statistics of a batch of class and pset rows to the stats_* catalog.
+
+        Only attributes whose type is numeric get a range, so entity
+        references, which are stored as ids, don't.
+        """
+        column_rows = []
+        for i, (name, is_numeric) in enumerate(self.get_stats_attributes(ifc_class), 1):
+            values = [row[i] for row in rows]
+            numbers = [v for v in values if type(v) in (int, float)] if is_numeric else []
+            null_count = sum(v is None for v in values)
+            column_rows.append(
+                (ifc_class, name, len(values), null_count, min(numbers, default=None), max(numbers, default=None))
+            )
+
+        pset_elements: dict[str, set[int]] = {}
+        properties: dict[tuple[str, str], list[Any]] = {}
+        for ifc_id, pset_name, name, value in pset_rows:
+            pset_elements.setdefault(pset_name, set()).add(ifc_id)
+            stats = properties.setdefault((pset_name, name), [0, 0, None, None])
+            stats[0] += 1
+            if value is None:
+                stats[1] += 1
+            elif type(value) in (int, float):
+                stats[2] = value if stats[2] is None else min(stats[2], value)
+                stats[3] = value if stats[3] is None else max(stats[3], value)
+
+        placeholder = "?" if self.sql_type == "sqlite" else "%s"
+        for table, stats_rows in (
+            ("stats_classes", [(ifc_class, len(rows))]),
+            ("stats_columns", column_rows),
+            ("stats_psets", [(pset_name, len(ids)) for pset_name, ids in pset_elements.items()]),
+            ("stats_properties", [(*key, *stats) for key, stats in properties.items()]),
+        ):
+            if stats_rows:
+                # Named columns, as the generated null_fraction takes no value
+                columns = ", ".join(itertools.chain(*STATS_TABLES[table]))
+                placeholders = ", ".join([placeholder] * len(stats_rows[0]))
+                upsert = get_stats_upsert(table, self.sql_type)
+                self.c.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) {upsert};", stats_rows)
+
+    def create_spatial_closure(self) -> None:
+        if self.sql_type == "sqlite":
+            statement = """
+            CREATE TABLE IF NOT EXISTS spatial_closure (
+                element_id integer PRIMARY KEY NOT NULL,
+                space_id integer,
+                storey_id integer,
+                building_id integer,
+                site_id integer
+            );
+            """
+        elif self.sql_type == "mysql":
+            statement = """
+            CREATE TABLE IF NOT EXISTS `spatial_closure` (
+              `element_id` int(10) unsigned NOT NULL,
+              `space_id` int(10) unsigned DEFAULT NULL,
+              `storey_id` int(10) unsigned DEFAULT NULL,
+              `building_id` int(10) unsigned DEFAULT NULL,
+              `site_id` int(10) unsigned DEFAULT NULL,
+              PRIMARY KEY (`element_id`),
+              KEY `idx_spatial_closure_space_id` (`space_id`),
+              KEY `idx_spatial_closure_storey_id` (`storey_id`),
+              KEY `idx_spatial_closure_building_id` (`building_id`),
+              KEY `idx_spatial_closure_site_id` (`site_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+            """
+        else:
+            assert False
+        self.c.execute(statement)
+        if self.sql_type == "sqlite":
+            for column in ("space_id", "storey_id", "building_id", "site_id"):
+                self.c.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_spatial_closure_{column} ON spatial_closure ({column});"
+                )
+
+        rows = self.get_spatial_closure_rows()
+        if not rows:
+            return
+        if self.sql_type == "sqlite":
+            self.c.executemany("INSERT INTO spatial_closure VALUES (?, ?, ?, ?, ?);", rows)
+        elif self.sql_type == "mysql":
+            self.c.executemany("INSERT INTO spatial_closure VALUES (%s, %s, %s, %s, %s);", rows)
+
+    def get_spatial_closure_rows(self) -> list[tuple[Union[int, None], ...]]:
+        """Resolve the nearest space, storey, building and site of every object.
+
+        Decomposition and containment are read in a single pass into a child ->
+        parent map. Each chain is then walked once, with resolved ancestors
+        memoised so that shared parents (storeys, buildings) are never revisited.
+        """
+        levels = ("IfcSpace", "IfcBuildingStorey", "IfcBuilding", "IfcSite")
+
+        parents: dict[int, int] = {}
+        for rel in self.file.by_type("IfcRelAggregates"):
+            for related_object in rel.RelatedObjects:
+                parents[related_object.id()] = rel.RelatingObject.id()
+        for rel in self.file.by_type("IfcRelContainedInSpatialStructure"):
+            for related_element in rel.RelatedElements:
+                parents.setdefault(related_element.id(), rel.RelatingStructure.id())
+
+        level_by_id: dict[int, int] = {}
+        for level, ifc_class in enumerate(levels):
+            for element in self.file.by_type(ifc_class):
+                level_by_id[element.id()] = level
+
+        # Ancestors of an object, excluding the object itself.
+        ancestors: dict[int, tuple[Union[int, None], ...]] = {}
+        empty = (None,) * len(levels)
+
+        for element_id in parents:
+            chain: list[int] = []
+            node = element_id
+            while node not in ancestors and node in parents and node not in chain:
+                chain.append(node)
+                node = parents[node]
+            if node not in ancestors:
+                # Root of the decomposition (e.g. IfcProject) or a cycle in invalid data.
+                ancestors[node] = empty
+            for child in reversed(chain):
+                parent = parents[child]
+                parent_ancestors = ancestors[parent]
+                if (level := level_by_id.get(parent)) is not None:
+                    parent_ancestors = parent_ancestors[:level] + (parent,) + parent_ancestors[level + 1 :]
+                ancestors[child] = parent_ancestors
+
+        return [(element_id, *ancestors[element_id]) for element_id in parents]
+
+    def create_search_index_table(self) -> None:
+        if self.sql_type != "sqlite":
+            self.should_get_search_index = False  # FTS5 is SQLite specific
+            return
+        # Keep common code punctuation inside tokens so "D-1*" or "EI-60" match as typed.
+        statement = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            ifc_id UNINDEXED,
+            ifc_class,
+            name,
+            description,
+            object_type,
+            global_id,
+            properties,
+            tokenize = "unicode61 tokenchars '-_.'"
+        );
+        """
+        try:
+            self.c.execute(statement)
+        except sqlite3.OperationalError:
+            self.should_get_search_index = False  # SQLite built without FTS5
+
+    def get_search_index_row(
+        self, element: ifcopenshell.entity_instance, ifc_class: str, pset_rows: list[tuple[int, str, str, Any]]
+    ) -> Union[tuple[Any, ...], None]:
+        """Return the search_index row of an element or None if it has nothing to search for.
+
+        :param pset_rows: Pset rows of this element only.
+        """
+        values = []
+        for name in ("Name", "Description", "ObjectType", "GlobalId"):
+            value = getattr(element, name, None)
+            values.append(None if value is None else str(value))
+        properties = " ".join(
+            f"{pset_name} {name} {value}" for _, pset_name, name, value in pset_rows if value is not None
+        )
+        if not properties and not any(values):
+            return None
+        return (element.id(), ifc_class, *values, properties or None)
+
+    def create_associations(self) -> None:
+        if self.sql_type == "sqlite":
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS element_material (
+                    ifc_id integer NOT NULL,
+                    material_id integer,
+                    layer_index integer,
+                    thickness real,
+                    material_name text
+                );
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS element_classification (
+                    ifc_id integer NOT NULL,
+                    system text,
+                    code text,
+                    name text
+                );
+                """,
+                "CREATE INDEX IF NOT EXISTS idx_element_material_ifc_id ON element_material (ifc_id);",
+                "CREATE INDEX IF NOT EXISTS idx_element_material_material_id ON element_material (material_id);",
+                "CREATE INDEX IF NOT EXISTS idx_element_classification_ifc_id ON element_classification (ifc_id);",
+                "CREATE INDEX IF NOT EXISTS idx_element_classification_code ON element_classification (code);",
+            ]
+        elif self.sql_type == "mysql":
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS `element_material` (
+                  `ifc_id` int(10) unsigned NOT NULL,
+                  `material_id` int(10) unsigned DEFAULT NULL,
+                  `layer_index` int(10) unsigned DEFAULT NULL,
+                  `thickness` double DEFAULT NULL,
+                  `material_name` varchar(255) DEFAULT NULL,
+                  KEY `idx_element_material_ifc_id` (`ifc_id`),
+                  KEY `idx_element_material_material_id` (`material_id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS `element_classification` (
+                  `ifc_id` int(10) unsigned NOT NULL,
+                  `system` varchar(255) DEFAULT NULL,
+                  `code` varchar(255) DEFAULT NULL,
+                  `name` varchar(255) DEFAULT NULL,
+                  KEY `idx_element_classification_ifc_id` (`ifc_id`),
+                  KEY `idx_element_classification_code` (`code`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;
+                """,
+            ]
+        else:
+            assert False
+        for statement in statements:
+            self.c.execute(statement)
+
+        material_rows = self.get_association_rows("IfcRelAssociatesMaterial", self.get_material_rows)
+        classification_rows = self.get_association_rows("IfcRelAssociatesClassification", self.get_classification_rows)
+        if self.sql_type == "sqlite":
+            if material_rows:
+                self.c.executemany("INSERT INTO element_material VALUES (?, ?, ?, ?, ?);", material_rows)
+            if classification_rows:
+                self.c.executemany("INSERT INTO element_classification VALUES (?, ?, ?, ?);", classification_rows)
+        elif self.sql_type == "mysql":
+            if material_rows:
+                self.c.executemany("INSERT INTO element_material VALUES (%s, %s, %s, %s, %s);", material_rows)
+            if classification_rows:
+                self.c.executemany("INSERT INTO element_classification VALUES (%s, %s, %s, %s);", classification_rows)
+
+    def get_association_rows(
+        self, rel_class: str, resolve: typing.Callable[[ifcopenshell.entity_instance], list[tuple[Any, ...]]]
+    ) -> list[tuple[Any, ...]]:
+        """Resolve every association relationship of a class into per-object rows.
+
+        Each relating material or classification is resolved only once, however
+        many objects share it. Occurrences without their own association inherit
+        the rows of their type.
+
+        :param resolve: Returns the row values (without ifc_id) of a relating entity.
+        """
+        resolved: dict[int, list[tuple[Any, ...]]] = {}
+        by_object: dict[int, list[tuple[Any, ...]]] = {}
+        relating_attribute = "RelatingMaterial" if rel_class == "IfcRelAssociatesMaterial" else "RelatingClassification"
+        for rel in self.file.by_type(rel_class):
+            relating = getattr(rel, relating_attribute)
+            if relating.id() not in resolved:
+                resolved[relating.id()] = resolve(relating)
+            for related_object in rel.RelatedObjects:
+                by_object.setdefault(related_object.id(), []).extend(resolved[relating.id()])
+
+        for rel in self.file.by_type("IfcRelDefinesByType"):
+            type_rows = by_object.get(rel.RelatingType.id())
+            if not type_rows:
+                continue
+            for related_object in rel.RelatedObjects:
+                if related_object.id() not in by_object:
+                    by_object[related_object.id()] = type_rows
+
+        return [(ifc_id, *row) for ifc_id, rows in by_object.items() for row in rows]
+
+    def get_material_rows(self, material: ifcopenshell.entity_instance) -> list[tuple[Any, ...]]:
+        """Flatten a material definition into (material_id, layer_index, thickness, material_name) rows."""
+        if material.is_a("IfcMaterialLayerSetUsage"):
+            material = material.ForLayerSet
+        elif material.is_a("IfcMaterialProfileSetUsage"):
+            material = material.ForProfileSet
+
+        if material.is_a("IfcMaterial"):
+            return [(material.id(), None, None, material.Name)]
+        elif material.is_a("IfcMaterialLayerSet"):
+            items = [(layer.Material, layer.LayerThickness) for layer in material.MaterialLayers]
+        elif material.is_a("IfcMaterialLayer"):
+            items = [(material.Material, material.LayerThickness)]
+        elif material.is_a("IfcMaterialProfileSet"):
+            items = [(profile.Material, None) for profile in material.MaterialProfiles]
+        elif material.is_a("IfcMaterialConstituentSet"):
+            items = [(constituent.Material, None) for constituent in material.MaterialConstituents or ()]
+        elif material.is_a("IfcMaterialList"):
+            items = [(m, None) for m in material.Materials]
+        elif material.is_a("IfcMaterialProfile") or material.is_a("IfcMaterialConstituent"):
+            items = [(material.Material, None)]
+        else:
+            return []
+        # Layers without a material (e.g. air gaps) are kept to preserve layer indices and thicknesses.
+        return [(m.id() if m else None, i, thickness, m.Name if m else None) for i, (m, thickness) in enumerate(items)]
+
+    def get_classification_rows(self, classification: ifcopenshell.entity_instance) -> list[tuple[Any, ...]]:
+        """Resolve a classification reference into a single (system, code, name) row."""
+        if classification.is_a("IfcClassification"):
+            return [(classification.Name, None, None)]
+        # IFC2X3 uses ItemReference, IFC4 renamed it to Identification.
+        code = getattr(classification, "Identification", None) or getattr(classification, "ItemReference", None)
+        system = None
+        source = classification.ReferencedSource
+        while source is not None:
+            if source.is_a("IfcClassification"):
+                system = source.Name
+                break
+            source = getattr(source, "ReferencedSource", None)
+        return [(system, code, classification.Name)]
+
     def create_geometry_table(self) -> None:
         statement = """
         CREATE TABLE IF NOT EXISTS shape (
@@ -430,13 +2143,23 @@ class Patcher(ifcpatch.BasePatcher):
 
         self.c.execute(statement)
 
+        if self.geometry_time_budget is not None:
+            statement = """
+            CREATE TABLE IF NOT EXISTS geometry_status (
+                ifc_id integer PRIMARY KEY NOT NULL,
+                status text NOT NULL
+            );
+            """
+            self.c.execute(statement)
+
     def create_sqlite_table(self, ifc_class: str, declaration: ifcopenshell.ifcopenshell_wrapper.declaration) -> None:
         statement = f"CREATE TABLE IF NOT EXISTS {ifc_class} ("
 
         if self.should_expand:
             statement += "ifc_id INTEGER NOT NULL"
         else:
-            statement += "ifc_id INTEGER PRIMARY KEY NOT NULL UNIQUE"
+            # An INTEGER PRIMARY KEY is the rowid itself, UNIQUE would only add a redundant index
+            statement += "ifc_id INTEGER PRIMARY KEY NOT NULL"
 
         assert isinstance(declaration, ifcopenshell.ifcopenshell_wrapper.entity)
         total_attributes = declaration.attribute_count()
@@ -527,13 +2250,27 @@ class Patcher(ifcpatch.BasePatcher):
         statement += ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci;"
         self.c.execute(statement)
 
-    def insert_data(self, ifc_class: str) -> None:
-        elements = self.file.by_type(ifc_class, include_subtypes=False)
+    def insert_data(
+        self, ifc_class: str, elements: Union[list[ifcopenshell.entity_instance], None] = None, is_preview: bool = False
+    ) -> int:
+        """Insert class table rows, with id_map, psets, search index and placement rows unless it is a preview.
+
+        Preview rows have all attributes but no inverses, and no id_map rows
+        are inserted as create_preview already did so for every class.
+        """
+        if elements is None:
+            elements = self.file.by_type(ifc_class, include_subtypes=False)
         total_elements = len(elements)
+        if self.should_get_psets:
+            # Imports shapely, so only when psets are wanted
+            from ifcopenshell.util.element import get_psets
 
         rows: list[list[Any]] = []
         id_map_rows: list[tuple[int, str]] = []
         pset_rows: list[tuple[int, str, str, Any]] = []
+        search_rows: list[tuple[Any, ...]] = []
+        guid_rows: list[tuple[Union[str, bytes], int, str]] = []
+        is_rooted = self.should_get_guid_map and bool(elements) and elements[0].is_a("IfcRoot")
 
         for element in elements:
             nested_indices: list[int] = []
@@ -563,17 +2300,25 @@ class Patcher(ifcpatch.BasePatcher):
                     values.append(attribute)
 
             if self.should_get_inverses:
-                values.append(json.dumps([e.id() for e in self.file.get_inverse(element)]))
+                values.append(None if is_preview else json.dumps([e.id() for e in self.file.get_inverse(element)]))
 
             if self.should_expand:
                 rows.extend(self.get_permutations(values, nested_indices))
             else:
                 rows.append(values)
 
-            id_map_rows.append((element.id(), ifc_class))
+            if not self.has_preview:
+                id_map_rows.append((element.id(), ifc_class))
+
+            if is_preview:
+                continue
 
+            if is_rooted and element.GlobalId:
+                guid_rows.append((self.get_guid_key(element.GlobalId), element.id(), ifc_class))
+
+            element_pset_start = len(pset_rows)
             if self.should_get_psets:
-                psets = ifcopenshell.util.element.get_psets(element)
+                psets = get_psets(element)
                 for pset_name, pset_data in psets.items():
                     for prop_name, value in pset_data.items():
                         if prop_name == "id":
@@ -582,11 +2327,23 @@ class Patcher(ifcpatch.BasePatcher):
                             value = json.dumps(value)
                         pset_rows.append((element.id(), pset_name, prop_name, value))
 
+            if self.should_get_search_index:
+                search_row = self.get_search_index_row(element, ifc_class, pset_rows[element_pset_start:])
+                if search_row:
+                    search_rows.append(search_row)
+
             if self.should_get_geometry:
-                if element.id() not in self.shape_rows and (placement := getattr(element, "ObjectPlacement", None)):
-                    m = ifcopenshell.util.placement.get_local_placement(placement)
-                    x, y, z = m[:, 3][0:3].tolist()
-                    self.shape_rows[element.id()] = [element.id(), x, y, z, m.tobytes(), None]
+                self.add_placement_shape_row(element)
+
+        if self.should_get_stats and rows and not is_preview:
+            self.insert_stats(ifc_class, rows, pset_rows)
+
+        id_map_table, pset_table = "id_map", "psets"
+        if self.should_compact_psets:
+            id_map_table, pset_table = "id_map_data", "pset_values"
+            class_id = self.get_def_id("class_def", ifc_class)
+            id_map_rows = [(ifc_id, class_id) for ifc_id, _ in id_map_rows]
+            pset_rows = [(i, self.get_prop_def_id(pset_name, name), value) for i, pset_name, name, value in pset_rows]
 
         if self.sql_type == "sqlite":
             if rows:
@@ -614,7 +2371,8 @@ class Patcher(ifcpatch.BasePatcher):
 
                 try:
                     self.c.executemany(f"INSERT INTO {ifc_class} VALUES ({','.join(['?']*len(sanitized_rows[0]))});", sanitized_rows)
-                    self.c.executemany("INSERT INTO id_map VALUES (?, ?);", id_map_rows)
+                    if id_map_rows:
+                        self.c.executemany(f"INSERT INTO {id_map_table} VALUES (?, ?);", id_map_rows)
                 except Exception as e:
                     # Error inserting data (silenced to reduce spam)
                     raise
@@ -641,11 +2399,18 @@ class Patcher(ifcpatch.BasePatcher):
                     sanitized_pset_rows.append(sanitized_row)
 
                 try:
-                    self.c.executemany("INSERT INTO psets VALUES (?, ?, ?, ?);", sanitized_pset_rows)
+                    placeholders = ",".join("?" * len(sanitized_pset_rows[0]))
+                    self.c.executemany(f"INSERT INTO {pset_table} VALUES ({placeholders});", sanitized_pset_rows)
                 except Exception as e:
                     # Error inserting pset data (silenced to reduce spam)
                     raise
 
+            if search_rows:
+                self.c.executemany("INSERT INTO search_index VALUES (?, ?, ?, ?, ?, ?, ?);", search_rows)
+
+            if guid_rows:
+                self.c.executemany("INSERT INTO guid_map VALUES (?, ?, ?);", guid_rows)
+
         elif self.sql_type == "mysql":
             if rows:
                 if json_attrs := self.my_sql_classes_json_attrs.get(ifc_class):
@@ -656,9 +2421,82 @@ class Patcher(ifcpatch.BasePatcher):
                                 continue
                             row[attr_i] = str(row[attr_i])
                 self.c.executemany(f"INSERT INTO {ifc_class} VALUES ({','.join(['%s']*len(rows[0]))});", rows)
-                self.c.executemany("INSERT INTO id_map VALUES (%s, %s);", id_map_rows)
+                if id_map_rows:
+                    self.c.executemany(f"INSERT INTO {id_map_table} VALUES (%s, %s);", id_map_rows)
             if pset_rows:
-                self.c.executemany("INSERT INTO psets VALUES (%s, %s, %s, %s);", pset_rows)
+                placeholders = ", ".join(["%s"] * len(pset_rows[0]))
+                self.c.executemany(f"INSERT INTO {pset_table} VALUES ({placeholders});", pset_rows)
+            if guid_rows:
+                self.c.executemany("INSERT INTO guid_map VALUES (%s, %s, %s);", guid_rows)
+
+        return total_elements
+
+    def get_placement_matrices(self) -> dict[int, "np.ndarray"]:
+        """Resolve the world matrix of every IfcLocalPlacement in the model.
+
+        Elements share their storey and building placements, so instead of
+        walking the PlacementRelTo chain per element, the relative matrices are
+        built in one go and composed top-down, one level of the chain at a time.
+        Placements relative to anything but an IfcLocalPlacement are left out.
+        """
+        import numpy as np
+        import ifcopenshell.util.placement
+
+        placements = self.file.by_type("IfcLocalPlacement")
+        index = {placement.id(): i for i, placement in enumerate(placements)}
+        n = len(placements)
+        origins = np.zeros((n, 3))
+        z_axes = np.tile((0.0, 0.0, 1.0), (n, 1))
+        x_axes = np.tile((1.0, 0.0, 0.0), (n, 1))
+        is_axis = np.zeros(n, dtype=bool)
+        parents = np.full(n, -1)
+        local = np.tile(np.eye(4), (n, 1, 1))
+        for i, placement in enumerate(placements):
+            if (rel_to := placement.PlacementRelTo) is not None:
+                parents[i] = index.get(rel_to.id(), -2)
+            axis = placement.RelativePlacement
+            ifc_class = axis.is_a()
+            coordinates = getattr(axis.Location, "Coordinates", None)
+            if ifc_class in ("IfcAxis2Placement3D", "IfcAxis2Placement2D") and coordinates:
+                is_axis[i] = True
+                origins[i, : len(coordinates)] = coordinates
+                if ifc_class == "IfcAxis2Placement3D" and axis.Axis:
+                    z_axes[i] = axis.Axis.DirectionRatios
+                if axis.RefDirection:
+                    ratios = axis.RefDirection.DirectionRatios
+                    x_axes[i] = 0.0
+                    x_axes[i, : len(ratios)] = ratios
+            else:
+                local[i] = ifcopenshell.util.placement.get_axis2placement(axis)
+
+        # Same as ifcopenshell.util.placement.a2p, for all placements at once
+        x = x_axes[is_axis] / np.linalg.norm(x_axes[is_axis], axis=1, keepdims=True)
+        z = z_axes[is_axis] / np.linalg.norm(z_axes[is_axis], axis=1, keepdims=True)
+        y = np.cross(z, x)
+        y /= np.linalg.norm(y, axis=1, keepdims=True)
+        local[is_axis, :3, 0] = x
+        local[is_axis, :3, 1] = y
+        local[is_axis, :3, 2] = z
+        local[is_axis, :3, 3] = origins[is_axis]
+
+        world = local.copy()
+        is_resolved = parents == -1
+        while True:
+            is_ready = ~is_resolved & (parents >= 0)
+            is_ready[is_ready] = is_resolved[parents[is_ready]]
+            if not is_ready.any():
+                break
+            world[is_ready] = world[parents[is_ready]] @ local[is_ready]
+            is_resolved |= is_ready
+        return {placement.id(): world[i] for i, placement in enumerate(placements) if is_resolved[i]}
+
+    def add_placement_shape_row(self, element: ifcopenshell.entity_instance) -> None:
+        if element.id() not in self.shape_rows and (placement := getattr(element, "ObjectPlacement", None)):
+            m = self.placement_matrices.get(placement.id())
+            if m is None:
+                m = ifcopenshell.util.placement.get_local_placement(placement)
+            x, y, z = m[:, 3][0:3].tolist()
+            self.shape_rows[element.id()] = [element.id(), x, y, z, m.tobytes(), None]
 
     def serialise_value(self, element: ifcopenshell.entity_instance, value: Any) -> Any:
         return element.walk(
@@ -705,3 +2543,1192 @@ class Patcher(ifcpatch.BasePatcher):
                     return False
             return True
         return False
+
+
+class FederatedPatcher:
+    geometry_columns = {("shape", "geometry"), ("geometry", "id"), ("geometry_lod", "id")}
+    skipped_tables = ("metadata", "conversion_status", "dirty", "dirty_psets")
+
+    def __init__(
+        self,
+        filepaths: list[str],
+        database: str,
+        max_workers: Union[int, None] = None,
+        **options: Any,
+    ):
+        """Convert several IFC-SPF models of the same schema into one SQLite database.
+
+        Each model is converted by a regular Patcher into its own temporary
+        database, in parallel in a process pool, and then merged in order.
+        STEP ids are shifted by an id offset per model so they don't collide,
+        including entity references, inverses and the relationship tables
+        created by the options. Geometry ids are prefixed with
+        "<model_id>:". A models table records the name, path, schema and id
+        range of every model, and id_map gets an indexed model_id column.
+        should_compact_psets is not supported. Neither is should_track_changes,
+        as WriteBack needs the single model a database was converted from.
+
+        :param filepaths: IFC-SPF files to convert, in model_id order starting at 1.
+        :param database: SQLite database filepath to merge the models into.
+        :param max_workers: Number of conversion processes, defaults to the
+            number of CPUs. Use 1 to convert in this process (e.g. in Pyodide).
+        :param options: Any other Patcher argument, e.g. should_get_geometry=False.
+
+        Example:
+
+        .. code:: python
+
+            FederatedPatcher(["ARC.ifc", "STR.ifc", "MEP.ifc"], "project.sqlite").patch()
+        """
+        if options.get("should_compact_psets"):
+            raise ValueError("should_compact_psets can't be combined with a federated conversion")
+        if options.get("should_track_changes"):
+            raise ValueError("should_track_changes can't be combined with a federated conversion")
+        self.filepaths = [str(f) for f in filepaths]
+        self.database = database
+        self.max_workers = max_workers
+        # Supertypes span the classes of all models, so they are created after merging
+        self.should_get_supertypes = options.pop("should_get_supertypes", False)
+        self.materialised_supertypes = options.pop("materialised_supertypes", ())
+        # Folded data tables would be merged without shifting their ids, so the merged database is optimised instead
+        self.should_optimise_storage = options.pop("should_optimise_storage", False)
+        self.sparse_column_threshold = options.pop("sparse_column_threshold", 0.05)
+        # Models may have different frequent properties, so pivots are created over the merged psets
+        self.should_get_pset_pivots = options.pop("should_get_pset_pivots", False)
+        self.pset_pivot_threshold = options.pop("pset_pivot_threshold", 0.25)
+        self.options = options
+
+    def get_output(self) -> str:
+        return self.database
+
+    def patch(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            databases = [os.path.join(directory, f"model_{i}.sqlite") for i in range(len(self.filepaths))]
+            if self.max_workers == 1 or len(self.filepaths) == 1:
+                for filepath, database in zip(self.filepaths, databases):
+                    convert_model(filepath, database, self.options)
+            else:
+                import concurrent.futures
+
+                with concurrent.futures.ProcessPoolExecutor(self.max_workers) as executor:
+                    futures = [
+                        executor.submit(convert_model, filepath, database, self.options)
+                        for filepath, database in zip(self.filepaths, databases)
+                    ]
+                    for future in futures:
+                        future.result()
+            self.merge(databases)
+
+    def merge(self, databases: list[str]) -> None:
+        self.db = sqlite3.connect(self.database)
+        self.c = self.db.cursor()
+        self.c.execute("PRAGMA synchronous = OFF")
+        self.c.execute("PRAGMA journal_mode = MEMORY")
+        self.db.create_function("offset_refs", 2, offset_refs, deterministic=True)
+        self.c.execute("""
+            CREATE TABLE IF NOT EXISTS models (
+                model_id integer PRIMARY KEY NOT NULL,
+                name text,
+                path text,
+                schema text,
+                id_offset integer,
+                max_id integer
+            );
+            """)
+        row = self.c.execute("SELECT max(model_id), max(id_offset + max_id) FROM models").fetchone()
+        model_id, id_offset = row[0] or 0, row[1] or 0
+
+        deferred_statements = []
+        for filepath, database in zip(self.filepaths, databases):
+            model_id += 1
+            self.c.execute("ATTACH DATABASE ? AS source", (database,))
+            preprocessor, schema, mvd = self.c.execute("SELECT * FROM source.metadata").fetchone()
+            if not self.c.execute("SELECT 1 FROM sqlite_master WHERE name = 'metadata'").fetchone():
+                self.c.execute("CREATE TABLE metadata (preprocessor text, schema text, mvd text);")
+                self.c.execute("INSERT INTO metadata VALUES (?, ?, ?);", (preprocessor, schema, mvd))
+            federation_schema = self.c.execute("SELECT schema FROM main.metadata").fetchone()[0]
+            if federation_schema.upper() != schema.upper():
+                raise ValueError(f"{filepath} is {schema}, federated models must share the schema {federation_schema}")
+            self.schema = ifcopenshell.schema_by_name(schema)
+            self.entities = {d.name(): d for d in self.schema.declarations() if isinstance(d, W.entity)}
+            max_id = self.c.execute("SELECT max(ifc_id) FROM source.id_map").fetchone()[0] or 0
+
+            query = "SELECT type, name, sql FROM source.sqlite_master WHERE sql IS NOT NULL"
+            objects = self.c.execute(query).fetchall()
+            virtual_tables = [name for _, name, sql in objects if sql.upper().startswith("CREATE VIRTUAL")]
+            for object_type, name, sql in objects:
+                if object_type == "trigger" and name.endswith("_dirty"):
+                    continue  # Change tracking of a source database, its dirty tables are not merged
+                if object_type != "table":
+                    if sql not in deferred_statements:
+                        deferred_statements.append(sql)  # Indexes and triggers are faster to add once filled
+                    continue
+                if name in self.skipped_tables or name.startswith("sqlite_"):
+                    continue  # Internal tables, e.g. planner statistics of the source tables
+                if any(name.startswith(f"{v}_") for v in virtual_tables):
+                    continue
+                self.merge_table(name, sql, id_offset, model_id)
+            self.c.execute(
+                "INSERT INTO models VALUES (?, ?, ?, ?, ?, ?);",
+                (model_id, Path(filepath).name, filepath, schema, id_offset, max_id),
+            )
+            self.db.commit()
+            self.c.execute("DETACH DATABASE source")
+            id_offset += max_id
+
+        for sql in deferred_statements:
+            sql = re.sub(r"^CREATE (UNIQUE )?(INDEX|TRIGGER) (?!IF NOT EXISTS)", r"CREATE \1\2 IF NOT EXISTS ", sql)
+            self.c.execute(sql)
+        self.c.execute("CREATE INDEX IF NOT EXISTS idx_id_map_model_id ON id_map (model_id);")
+        tables = [row[0] for row in self.c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        class_tables = [t for t in tables if t in self.entities and not self.entities[t].is_abstract()]
+        if self.should_get_supertypes or self.materialised_supertypes:
+            create_supertypes(
+                self.c,
+                "sqlite",
+                self.schema,
+                class_tables,
+                self.should_get_supertypes,
+                self.materialised_supertypes,
+                has_inverses=self.options.get("should_get_inverses", True),
+                is_unique=not self.options.get("should_expand", False),
+            )
+        if self.should_get_pset_pivots and self.options.get("should_get_psets", True):
+            create_pset_pivots(self.c, class_tables, self.pset_pivot_threshold)
+        if self.should_optimise_storage:
+            optimise_storage(self.c, class_tables, self.sparse_column_threshold)
+        self.db.commit()
+        if self.should_optimise_storage:
+            self.c.execute("VACUUM")
+        self.c.close()
+        self.db.close()
+
+    def merge_table(self, name: str, sql: str, id_offset: int, model_id: int) -> None:
+        sql = re.sub(r"^CREATE (VIRTUAL )?TABLE (?!IF NOT EXISTS)", r"CREATE \1TABLE IF NOT EXISTS ", sql)
+        self.c.execute(sql)
+        if name == "id_map" and "model_id" not in [r[1] for r in self.c.execute("PRAGMA main.table_info(id_map)")]:
+            self.c.execute("ALTER TABLE id_map ADD COLUMN model_id integer;")
+        columns = [row[1] for row in self.c.execute(f"PRAGMA source.table_info({name})").fetchall()]
+        expressions = [self.get_merge_expression(name, column, id_offset, model_id) for column in columns]
+        if name == "id_map":
+            columns.append("model_id")
+            expressions.append(str(model_id))
+        column_names = ", ".join(f"`{c}`" for c in columns)
+        statement = f"INSERT INTO main.{name} ({column_names}) SELECT {', '.join(expressions)} FROM source.{name}"
+        if name in STATS_TABLES:
+            # Statistics of the same class or property in several models are combined. WHERE true tells SQLite
+            # the ON of the upsert is not a join constraint.
+            statement += f" WHERE true {get_stats_upsert(name, 'sqlite')}"
+        self.c.execute(f"{statement};")
+
+    def get_merge_expression(self, table: str, column: str, id_offset: int, model_id: int) -> str:
+        if (table, column) in self.geometry_columns:
+            return f"'{model_id}:' || `{column}`"
+        if column == "ifc_id" or column.endswith("_id"):
+            return f"`{column}` + {id_offset}"
+        if (declaration := self.entities.get(table)) is None:
+            return f"`{column}`"
+        if column == "inverses":
+            return f"offset_refs(`{column}`, {id_offset})"
+        for attribute in declaration.all_attributes():
+            if attribute.name() == column:
+                primitive = ifcopenshell.util.attribute.get_primitive_type(attribute)
+                if primitive == "entity":
+                    return f"`{column}` + {id_offset}"
+                elif "entity" in str(primitive):
+                    return f"offset_refs(`{column}`, {id_offset})"
+        return f"`{column}`"
+
+
+def create_supertypes(
+    cursor: Any,
+    sql_type: Literal["sqlite", "mysql"],
+    schema: W.schema_definition,
+    tables: list[str],
+    should_get_views: bool = True,
+    materialised: tuple[str, ...] = (),
+    has_inverses: bool = True,
+    is_unique: bool = True,
+) -> None:
+    """Create UNION ALL views, or materialised tables, for the abstract supertypes of the class tables."""
+    subtypes: dict[str, list[str]] = {}
+    for table in tables:
+        declaration = schema.declaration_by_name(table).supertype()
+        while declaration:
+            if declaration.is_abstract():
+                subtypes.setdefault(declaration.name(), []).append(table)
+            declaration = declaration.supertype()
+
+    for supertype, tables in sorted(subtypes.items()):
+        if supertype not in materialised and not should_get_views:
+            continue
+        attributes = [a.name() for a in schema.declaration_by_name(supertype).all_attributes()]
+        columns = ", ".join(f"`{a}`" for a in attributes + (["inverses"] if has_inverses else []))
+        query = " UNION ALL ".join(f"SELECT ifc_id, '{t}' AS ifc_class, {columns} FROM `{t}`" for t in sorted(tables))
+        if supertype not in materialised:
+            create_view = "CREATE VIEW IF NOT EXISTS" if sql_type == "sqlite" else "CREATE OR REPLACE VIEW"
+            cursor.execute(f"{create_view} `{supertype}` AS {query};")
+            continue
+
+        if sql_type == "sqlite":
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS `{supertype}` AS {query};")
+            create_index = "CREATE INDEX IF NOT EXISTS"
+            ifc_id_index = "CREATE UNIQUE INDEX IF NOT EXISTS" if is_unique else create_index
+        elif sql_type == "mysql":
+            options = "ENGINE=InnoDB DEFAULT CHARSET=utf8mb3 COLLATE=utf8mb3_general_ci"
+            # Left over from an interrupted run, MySQL DDL commits and has no CREATE INDEX IF NOT EXISTS
+            cursor.execute(f"DROP TABLE IF EXISTS `{supertype}`;")
+            cursor.execute(f"CREATE TABLE `{supertype}` {options} AS {query};")
+            create_index = "CREATE INDEX"
+            ifc_id_index = "CREATE UNIQUE INDEX" if is_unique else create_index
+        else:
+            assert False
+        cursor.execute(f"{ifc_id_index} idx_{supertype}_ifc_id ON `{supertype}` (ifc_id);")
+        cursor.execute(f"{create_index} idx_{supertype}_ifc_class ON `{supertype}` (ifc_class);")
+        if "GlobalId" in attributes:
+            global_id = "GlobalId" if sql_type == "sqlite" else "GlobalId(22)"
+            cursor.execute(f"{create_index} idx_{supertype}_GlobalId ON `{supertype}` ({global_id});")
+
+
+def create_pset_pivots(
+    cursor: Any, tables: list[str], threshold: float = 0.25, pset_table: str = "psets"
+) -> dict[str, list[str]]:
+    """Create a <class>_props table per class with a column per property held by enough of its elements.
+
+    Pset values are stored as text, so a column is INTEGER or REAL only if
+    every value round trips through that type, and TEXT otherwise. Returns the
+    columns created per class.
+
+    :param pset_table: "pset_values" if psets is a view of interned names, to index the table itself.
+    """
+    # Drives the pivot from the class rows and is what looking up the psets of an element needs anyway
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{pset_table}_ifc_id ON {pset_table} (ifc_id);")
+    class_sizes = dict(cursor.execute("SELECT ifc_class, count(*) FROM id_map GROUP BY ifc_class;").fetchall())
+    is_integer = "CAST(CAST(p.value AS INTEGER) AS TEXT) = p.value"
+    is_real = "CAST(CAST(p.value AS REAL) AS TEXT) = p.value"
+    query = f"""
+        SELECT m.ifc_class, p.pset_name, p.name, count(*), count(p.value),
+            total({is_integer}), total({is_integer} OR {is_real})
+        FROM psets p JOIN id_map m ON m.ifc_id = p.ifc_id
+        GROUP BY m.ifc_class, p.pset_name, p.name;
+        """
+    properties: dict[str, list[tuple[str, str, str]]] = {}
+    for ifc_class, pset_name, name, total, values, integers, reals in cursor.execute(query).fetchall():
+        if ifc_class not in tables or total < threshold * class_sizes[ifc_class]:
+            continue
+        data_type = "TEXT"
+        if values and integers == values:
+            data_type = "INTEGER"
+        elif values and reals == values:
+            data_type = "REAL"
+        properties.setdefault(ifc_class, []).append((pset_name, name, data_type))
+
+    casts = {"INTEGER": "CAST(p.value AS INTEGER)", "REAL": "CAST(p.value AS REAL)", "TEXT": "p.value"}
+    columns = {}
+    for ifc_class, class_properties in sorted(properties.items()):
+        table = f"{ifc_class}_props"
+        columns[ifc_class] = [f"{pset_name}.{name}" for pset_name, name, _ in class_properties]
+        names = ["`" + column.replace("`", "``") + "`" for column in columns[ifc_class]]
+        definitions = ", ".join(f"{n} {data_type}" for n, (_, _, data_type) in zip(names, class_properties))
+        pivot = "max(CASE WHEN p.pset_name = ? AND p.name = ? THEN {} END)"
+        values = ", ".join(pivot.format(casts[data_type]) for *_, data_type in class_properties)
+        # Left over from an interrupted run, as CREATE TABLE commits unless a transaction is already open
+        cursor.execute(f"DROP TABLE IF EXISTS `{table}`;")
+        cursor.execute(f"CREATE TABLE `{table}` (ifc_id integer PRIMARY KEY NOT NULL, {definitions});")
+        cursor.execute(
+            f"""
+            INSERT INTO `{table}` SELECT c.ifc_id, {values}
+            FROM `{ifc_class}` c JOIN psets p ON p.ifc_id = c.ifc_id GROUP BY c.ifc_id;
+            """,
+            [v for pset_name, name, _ in class_properties for v in (pset_name, name)],
+        )
+        for i, name in enumerate(names):
+            cursor.execute(f"CREATE INDEX idx_{table}_{i} ON `{table}` ({name});")
+    return columns
+
+
+def optimise_storage(cursor: Any, tables: list[str], sparse_column_threshold: float = 0.05) -> list[str]:
+    """Fold the mostly NULL columns of SQLite class tables into an extras column and analyse the database.
+
+    A folded class is stored in <class>_data, whose extras column holds a JSON
+    object of the folded non NULL values, and <class> becomes a view with the
+    original columns in their original order. Returns the folded classes.
+    """
+    is_strict = sqlite3.sqlite_version_info >= (3, 37, 0)
+    # Storage classes a STRICT column of the declared type keeps unchanged, JSON (select) columns become ANY
+    strict_types = {"INTEGER": "'integer'", "REAL": "'real', 'integer'", "TEXT": "'text'"}
+    folded = []
+    for table in tables:
+        query = "SELECT type FROM sqlite_master WHERE tbl_name = ? AND sql NOT NULL AND type != 'view';"
+        if [row[0] for row in cursor.execute(query, (table,))] != ["table"]:
+            continue  # Already folded, or indexes and triggers would need to move to the data table
+        columns = cursor.execute(f"PRAGMA table_info(`{table}`)").fetchall()
+        checks = []
+        for _, name, data_type, *_ in columns:
+            if data_type in strict_types:
+                mismatch = f"typeof(`{name}`) NOT IN ({strict_types[data_type]}, 'null')"
+            else:
+                mismatch = f"typeof(`{name}`) IN ('real', 'blob')"  # Only integers and text round trip JSON
+            checks.append(f"count(`{name}`), total({mismatch})")
+        total_rows, *stats = cursor.execute(f"SELECT count(*), {', '.join(checks)} FROM `{table}`;").fetchone()
+        if not total_rows:
+            continue
+        counts, mismatches = stats[0::2], stats[1::2]
+        sparse = []
+        for (_, name, data_type, _, _, pk), count, mismatch in zip(columns, counts, mismatches):
+            if not pk and data_type in ("INTEGER", "TEXT", "JSON") and not mismatch:
+                if count <= sparse_column_threshold * total_rows:
+                    sparse.append(name)
+        if len(sparse) < 2:
+            continue  # An extras column for a single column saves nothing
+
+        is_table_strict = is_strict and not any(m for c, m in zip(columns, mismatches) if c[2] in strict_types)
+        definitions = []
+        for _, name, data_type, notnull, _, pk in columns:
+            if name not in sparse:
+                data_type = data_type if data_type in strict_types or not is_table_strict else "ANY"
+                constraints = (" PRIMARY KEY" if pk else "") + (" NOT NULL" if notnull else "")
+                definitions.append(f"`{name}` {data_type}{constraints}")
+        definitions.append("extras TEXT")
+        dense = [f"`{name}`" for _, name, *_ in columns if name not in sparse]
+        # json_patch drops the NULL members, json_object takes at most 127 arguments
+        extras = "'{}'"
+        for i in range(0, len(sparse), 50):
+            members = ", ".join(f"'{name}', `{name}`" for name in sparse[i : i + 50])
+            extras = f"json_patch({extras}, json_object({members}))"
+        view_columns = [
+            f"json_extract(extras, '$.{name}') AS `{name}`" if name in sparse else f"`{name}`"
+            for _, name, *_ in columns
+        ]
+
+        # Left over from an interrupted run, as CREATE TABLE commits unless a transaction is already open
+        cursor.execute(f"DROP TABLE IF EXISTS `{table}_data`;")
+        strict = " STRICT" if is_table_strict else ""
+        cursor.execute(f"CREATE TABLE `{table}_data` ({', '.join(definitions)}){strict};")
+        cursor.execute(
+            f"INSERT INTO `{table}_data` SELECT {', '.join(dense)}, NULLIF({extras}, '{{}}') FROM `{table}`;"
+        )
+        cursor.execute(f"DROP TABLE `{table}`;")
+        cursor.execute(f"CREATE VIEW `{table}` AS SELECT {', '.join(view_columns)} FROM `{table}_data`;")
+        folded.append(table)
+    cursor.execute("ANALYZE;")
+    return folded
+
+
+# Key and value columns of the stats_* catalog, values are added up except the min and max
+STATS_TABLES = {
+    "stats_classes": (("ifc_class",), ("row_count",)),
+    "stats_columns": (("ifc_class", "name"), ("row_count", "null_count", "min_value", "max_value")),
+    "stats_psets": (("pset_name",), ("element_count",)),
+    "stats_properties": (("pset_name", "name"), ("row_count", "null_count", "min_value", "max_value")),
+}
+
+
+def get_stats_upsert(table: str, sql_type: str) -> str:
+    """Return the clause of an INSERT into a stats_* table that merges a row into an existing row of its key."""
+    keys, columns = STATS_TABLES[table]
+    assignments = []
+    for column in columns:
+        value = f"excluded.{column}" if sql_type == "sqlite" else f"VALUES({column})"
+        if column in ("min_value", "max_value"):
+            function = column[:3] if sql_type == "sqlite" else {"min_value": "least", "max_value": "greatest"}[column]
+            # Both functions return NULL if either value is, e.g. when a batch has no numbers
+            assignments.append(f"{column} = coalesce({function}({column}, {value}), {column}, {value})")
+        else:
+            assignments.append(f"{column} = {column} + {value}")
+    if sql_type == "sqlite":
+        return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(assignments)}"
+    return f"ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+
+
+def convert_model(filepath: str, database: str, options: dict[str, Any]) -> str:
+    """Convert one model of a federation, a module level function so process pools can pickle it."""
+    patcher = Patcher(ifcopenshell.open(filepath), database=database, **options)
+    patcher.patch()
+    return patcher.get_output()
+
+
+def tessellate_elements(filepath: str, settings: dict[str, Any], connection: Any) -> None:
+    """Geometry worker process of Patcher.create_budgeted_geometry, a module level function so it can be spawned.
+
+    Receives (element id, is_simplified) tuples until ``None`` and answers each
+    with a (geometry row, shape matrix) tuple, or ``None`` without a shape.
+    """
+    import ifcopenshell.geom
+    import ifcopenshell.util.shape
+
+    model = ifcopenshell.open(filepath)
+    geometry_settings = ifcopenshell.geom.settings()
+    simplified_settings = ifcopenshell.geom.settings()
+    for name, value in settings.items():
+        geometry_settings.set(name, value)
+        simplified_settings.set(name, value)
+    simplified_settings.set("disable-opening-subtractions", True)
+    simplified_settings.set("disable-boolean-result", True)
+    context_ids = set(settings["context-ids"])
+    connection.send(None)
+
+    while (message := connection.recv()) is not None:
+        element_id, is_simplified = message
+        element = model.by_id(element_id)
+        representations = element.Representation.Representations if element.Representation else ()
+        representation = next((r for r in representations if r.ContextOfItems.id() in context_ids), None)
+        try:
+            assert representation is not None
+            shape = ifcopenshell.geom.create_shape(
+                simplified_settings if is_simplified else geometry_settings, element, representation
+            )
+        except (AssertionError, RuntimeError):
+            connection.send(None)
+            continue
+        geometry = shape.geometry
+        materials = json.dumps([m.instance_id() for m in geometry.materials])
+        geometry_row = (
+            geometry.id,
+            geometry.verts_buffer,
+            geometry.edges_buffer,
+            geometry.faces_buffer,
+            geometry.material_ids_buffer,
+            materials,
+        )
+        connection.send((geometry_row, ifcopenshell.util.shape.get_shape_matrix(shape)))
+
+
+def offset_refs(value: Any, id_offset: int) -> Any:
+    """Shift the entity ids in a column value, either an id or JSON where untyped integers are ids."""
+    if isinstance(value, int):
+        return value + id_offset
+    if not isinstance(value, str) or not value.startswith("["):
+        return value
+
+    def shift(item: Any) -> Any:
+        if isinstance(item, list):
+            return [shift(i) for i in item]
+        elif isinstance(item, int) and not isinstance(item, bool):
+            return item + id_offset
+        return item  # Typed values, e.g. {"type": "IfcLabel", "value": "..."}
+
+    return json.dumps(shift(json.loads(value)))
+
+
+class WriteBack:
+    value_columns = {
+        "IfcPropertySingleValue": "NominalValue",
+        "IfcQuantityLength": "LengthValue",
+        "IfcQuantityArea": "AreaValue",
+        "IfcQuantityVolume": "VolumeValue",
+        "IfcQuantityCount": "CountValue",
+        "IfcQuantityWeight": "WeightValue",
+        "IfcQuantityTime": "TimeValue",
+        "IfcQuantityNumber": "NumberValue",
+    }
+    property_columns = {"IfcPropertySet": "HasProperties", "IfcElementQuantity": "Quantities"}
+    pset_owner_columns = ("RelatingPropertyDefinition", "HasPropertySets")
+
+    def __init__(self, database: str, source: str, output: str):
+        """Write edits made to a SQLite database back to the IFC-SPF it was converted from.
+
+        Only entities recorded in the dirty table (see ``should_track_changes``)
+        are reserialised from their rows. Everything else is copied verbatim
+        from the source file, so the cost depends on the size of the edit, not
+        of the model. Deleted rows drop their instance and new rows are
+        appended to the DATA section. Edited psets values are first written
+        into the property or quantity they were read from. A pset shared with
+        other elements is copied for the edited element first, and a pset of
+        its type is overridden by an occurrence pset of the same name. Deleted
+        elements are removed from the relationships listing them, relationships
+        left without related objects are deleted along with the psets only they
+        defined. The dirty tables are kept, since every write-back starts again
+        from the original file.
+        Databases converted with ``should_expand`` are not supported.
+
+        :param database: SQLite database converted with should_track_changes.
+        :param source: The IFC-SPF file the database was converted from.
+        :param output: Filepath to write the updated IFC-SPF to.
+
+        Example:
+
+        .. code:: python
+
+            ifcpatch.execute({"input": "input.ifc", "file": model, "recipe": "Ifc2Sql",
+                "arguments": ["sqlite", "localhost", "root", "pass", "model.db"],
+                "should_track_changes": True})
+            # ... edit model.db ...
+            WriteBack("model.db", "input.ifc", "output.ifc").execute()
+        """
+        self.database = database
+        self.source = source
+        self.output = output
+
+    def execute(self) -> int:
+        """Write the output file and return the number of changed entities."""
+        import mmap
+
+        self.db = sqlite3.connect(self.database)
+        self.c = self.db.cursor()
+        self.schema = ifcopenshell.schema_by_name(self.c.execute("SELECT schema FROM metadata").fetchone()[0])
+        self.columns: dict[str, list[str]] = {}
+        self.tables = {row[0] for row in self.c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        with open(self.source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self.data = data
+            self.data_start = re.search(rb"(?m)^DATA;", data).end()
+            self.data_end = data.rfind(b"ENDSEC;")
+            self.offsets: Union[dict[int, int], None] = None
+            self.next_id: Union[int, None] = None
+
+            # Copied psets and cleaned up relationships are recorded in the dirty table by its triggers
+            self.apply_pset_changes()
+            self.remove_deleted_references()
+            self.db.commit()
+            changes = self.c.execute("SELECT ifc_id, ifc_class FROM dirty ORDER BY ifc_id").fetchall()
+
+            edits: list[tuple[int, int, bytes]] = []
+            appends: list[bytes] = []
+            for ifc_id, ifc_class in changes:
+                line = self.get_step_line(ifc_id, ifc_class)
+                location = self.find_instance(ifc_id)
+                if location is None:
+                    if line is not None:
+                        appends.append(line + b"\n")
+                    continue
+                start, end = location
+                if line is None:
+                    # Deleted, also drop its line break
+                    while data[end : end + 1] in (b"\r", b"\n"):
+                        end += 1
+                edits.append((start, end, line or b""))
+            edits.sort()
+            edits.append((self.data_end, self.data_end, b"".join(appends)))
+
+            with open(self.output, "wb") as out:
+                position = 0
+                for start, end, replacement in edits:
+                    self.copy_range(out, position, start)
+                    out.write(replacement)
+                    position = end
+                self.copy_range(out, position, len(data))
+            del self.data
+
+        self.c.close()
+        self.db.close()
+        return len(changes)
+
+    def copy_range(self, out: typing.BinaryIO, start: int, end: int, chunk_size: int = 2**24) -> None:
+        for position in range(start, end, chunk_size):
+            out.write(self.data[position : min(position + chunk_size, end)])
+
+    def find_instance(self, ifc_id: int) -> Union[tuple[int, int], None]:
+        """Return the byte range of ``#id=...;`` in the source, or None if it is a new entity."""
+        if self.offsets is None:
+            # Most exporters (including IfcOpenShell) write ascending ids, so bisect on byte offsets first.
+            start = self.bisect_instance(ifc_id)
+        else:
+            start = self.offsets.get(ifc_id)
+        if start is None and self.offsets is None:
+            start = self.get_offsets().get(ifc_id)
+        if start is None:
+            return None
+        boundary = self.data.find(b"\n#", start, self.data_end)
+        end = self.data.rfind(b";", start, self.data_end if boundary == -1 else boundary) + 1
+        return start, end
+
+    def get_offsets(self) -> dict[int, int]:
+        if self.offsets is None:
+            pattern = re.compile(rb"(?m)^#(\d+)\s*=")
+            matches = pattern.finditer(self.data, self.data_start, self.data_end)
+            self.offsets = {int(m.group(1)): m.start() for m in matches}
+        return self.offsets
+
+    def bisect_instance(self, ifc_id: int) -> Union[int, None]:
+        pattern = re.compile(rb"#(\d+)\s*=")
+
+        def get_instance_after(position: int) -> tuple[int, int]:
+            start = self.data.find(b"\n#", position, self.data_end)
+            if start == -1:
+                return -1, 0
+            match = pattern.match(self.data, start + 1)
+            return start + 1, int(match.group(1)) if match else 0
+
+        low, high = self.data_start - 1, self.data_end
+        while low < high:
+            middle = (low + high) // 2
+            start, found_id = get_instance_after(middle)
+            if start == -1 or found_id >= ifc_id:
+                high = middle
+            else:
+                low = middle + 1
+        start, found_id = get_instance_after(low)
+        return start if found_id == ifc_id else None
+
+    def get_step_line(self, ifc_id: int, ifc_class: str) -> Union[bytes, None]:
+        row = self.c.execute(f"SELECT * FROM {ifc_class} WHERE ifc_id = ?", (ifc_id,)).fetchone()
+        if row is None:
+            return None
+        declaration = self.schema.declaration_by_name(ifc_class)
+        derived = declaration.derived()
+        arguments = []
+        for i, attribute in enumerate(declaration.all_attributes()):
+            if derived[i]:
+                arguments.append("*")
+            else:
+                primitive = ifcopenshell.util.attribute.get_primitive_type(attribute)
+                arguments.append(self.serialise_attribute(row[i + 1], primitive))
+        return f"#{ifc_id}={declaration.name().upper()}({','.join(arguments)});".encode("ascii")
+
+    def serialise_attribute(self, value: Any, primitive: Any) -> str:
+        if value is None:
+            return "$"
+        if isinstance(primitive, tuple) and isinstance(value, str):
+            value = json.loads(value)  # Aggregates and typed select values are stored as JSON
+        if isinstance(value, dict):
+            inner = self.serialise_attribute(value["value"], None)
+            return f"{value['type'].upper()}({inner})"
+        if isinstance(value, list):
+            inner = primitive[1] if isinstance(primitive, tuple) and primitive[0] != "select" else "entity"
+            return "(" + ",".join(self.serialise_attribute(v, inner) for v in value) + ")"
+        if isinstance(primitive, tuple):
+            primitive = "entity"  # Untyped numbers in selects are entity references
+        if isinstance(value, bool):
+            return ".T." if value else ".F."
+        if primitive == "entity":
+            return f"#{value}"
+        if primitive == "float" or isinstance(value, float):
+            text = repr(float(value)).upper()
+            mantissa, _, exponent = text.partition("E")
+            if "." not in mantissa:
+                mantissa += "."
+            return mantissa + (f"E{exponent}" if exponent else "")
+        if primitive == "boolean":
+            return ".T." if value else ".F."
+        if isinstance(value, int):
+            return str(value)
+        if primitive == "enum":
+            # Logicals are stored in text columns as 1, 0 or UNKNOWN
+            return {"1": ".T.", "0": ".F.", "UNKNOWN": ".U."}.get(value, f".{value}.")
+        if primitive == "binary":
+            return f'"{value}"'
+        value = value.replace("\\", "\\\\").replace("'", "''")
+        if not value.isascii():
+            value = re.sub(
+                r"[^\x20-\x7e]+", lambda m: f"\\X2\\{m.group().encode('utf-16-be').hex().upper()}\\X0\\", value
+            )
+        return f"'{value}'"
+
+    def apply_pset_changes(self) -> None:
+        """Copy edited psets values into the IfcProperty or IfcPhysicalQuantity they came from."""
+        if "dirty_psets" not in self.tables:
+            return
+        for ifc_id, pset_name, name in self.c.execute("SELECT * FROM dirty_psets").fetchall():
+            row = self.c.execute(
+                "SELECT value FROM psets WHERE ifc_id = ? AND pset_name = ? AND name = ?", (ifc_id, pset_name, name)
+            ).fetchone()
+            prop = self.get_property(ifc_id, pset_name, name)
+            if row is None or prop is None or row[0] is None:
+                continue
+            pset_id, prop_id, prop_class = prop
+            column = self.value_columns.get(prop_class)
+            if column is None:
+                continue  # Enumerated, list, table and bounded values are not supported
+            prop_id = self.get_own_property(ifc_id, pset_id, prop_id)
+            if prop_id is None:
+                continue  # A type pset can't be overridden without an IfcRelDefinesByProperties table
+            value = row[0]
+            if column != "NominalValue":
+                value = float(value)
+            else:
+                nominal = self.get_value(prop_class, prop_id, column)
+                nominal = json.loads(nominal) if nominal else {"type": "IfcLabel", "value": ""}
+                value = json.dumps({"type": nominal["type"], "value": self.cast_value(value, nominal["value"])})
+            self.c.execute(f'UPDATE {prop_class} SET "{column}" = ? WHERE ifc_id = ?', (value, prop_id))
+        self.c.execute("DELETE FROM dirty_psets")
+
+    def cast_value(self, value: Any, original: Any) -> Any:
+        if isinstance(original, bool):
+            return str(value).lower() in ("1", "true", ".t.")
+        elif isinstance(original, int):
+            return int(float(value))
+        elif isinstance(original, float):
+            return float(value)
+        return str(value)
+
+    def get_property(self, ifc_id: int, pset_name: str, name: str) -> Union[tuple[int, int, str], None]:
+        # Occurrence property sets override those of the type, so search them first
+        for pset_id in self.get_property_set_ids(ifc_id):
+            pset_class = self.get_ifc_class(pset_id)
+            column = self.property_columns.get(pset_class)
+            if column is None or self.get_value(pset_class, pset_id, "Name") != pset_name:
+                continue
+            for prop_id in self.get_ids(self.get_value(pset_class, pset_id, column)):
+                prop_class = self.get_ifc_class(prop_id)
+                if self.get_value(prop_class, prop_id, "Name") == name:
+                    return pset_id, prop_id, prop_class
+
+    def get_own_property(self, ifc_id: int, pset_id: int, prop_id: int) -> Union[int, None]:
+        """Return the property to edit for an element, copied first if it is shared or defined by its type."""
+        pset_class = self.get_ifc_class(pset_id)
+        if pset_id in self.get_property_set_ids(ifc_id, should_inherit=False):
+            pset_id, copies = self.get_own_pset(ifc_id, pset_id)
+            prop_id = copies.get(prop_id, prop_id)
+            if len(self.get_references(prop_id, tuple(self.property_columns.values()))) < 2:
+                return prop_id
+            # The property is also listed by another pset
+            new_prop_id = self.copy_row(self.get_ifc_class(prop_id), prop_id)
+            self.set_ids(pset_class, pset_id, self.property_columns[pset_class], prop_id, new_prop_id)
+            self.update_inverses(prop_id, remove=(pset_id,))
+            self.update_inverses(new_prop_id, add=(pset_id,))
+            return new_prop_id
+
+        # Defined by the type, the occurrence pset of the same name overrides it property by property
+        name = self.get_value(pset_class, pset_id, "Name")
+        for occurrence_pset_id in self.get_property_set_ids(ifc_id, should_inherit=False):
+            if self.get_ifc_class(occurrence_pset_id) == pset_class:
+                if self.get_value(pset_class, occurrence_pset_id, "Name") == name:
+                    occurrence_pset_id = self.get_own_pset(ifc_id, occurrence_pset_id)[0]
+                    new_prop_id = self.copy_row(self.get_ifc_class(prop_id), prop_id)
+                    self.set_ids(pset_class, occurrence_pset_id, self.property_columns[pset_class], None, new_prop_id)
+                    self.update_inverses(new_prop_id, add=(occurrence_pset_id,))
+                    return new_prop_id
+        if "IfcRelDefinesByProperties" not in self.tables:
+            return None
+        new_prop_id = self.copy_row(self.get_ifc_class(prop_id), prop_id)
+        properties = {self.property_columns[pset_class]: json.dumps([new_prop_id])}
+        new_pset_id = self.copy_row(pset_class, pset_id, **properties)
+        self.update_inverses(new_prop_id, add=(new_pset_id,))
+        self.add_pset(ifc_id, new_pset_id)
+        return new_prop_id
+
+    def get_own_pset(self, ifc_id: int, pset_id: int) -> tuple[int, dict[int, int]]:
+        """Return the pset only defining the element, with the ids of the properties copied for it if it was shared."""
+        owners = []
+        for owner_id, owner_class, column in self.get_references(pset_id, self.pset_owner_columns):
+            if column == "HasPropertySets":
+                owners.append((owner_id, owner_class, column, [owner_id]))
+            else:
+                related_ids = self.get_ids(self.get_value(owner_class, owner_id, "RelatedObjects"))
+                owners.append((owner_id, owner_class, column, related_ids))
+        owner_id, owner_class, column, related_ids = next(o for o in owners if ifc_id in o[3])
+        if len(owners) == 1 and related_ids == [ifc_id]:
+            return pset_id, {}
+
+        pset_class = self.get_ifc_class(pset_id)
+        prop_ids = self.get_ids(self.get_value(pset_class, pset_id, self.property_columns[pset_class]))
+        copies = {prop_id: self.copy_row(self.get_ifc_class(prop_id), prop_id) for prop_id in prop_ids}
+        properties = {self.property_columns[pset_class]: json.dumps(list(copies.values()))}
+        new_pset_id = self.copy_row(pset_class, pset_id, **properties)
+        for new_prop_id in copies.values():
+            self.update_inverses(new_prop_id, add=(new_pset_id,))
+        if related_ids == [ifc_id]:
+            # Either a type's own pset or a relationship of this element only, it can refer to the copy instead
+            self.set_ids(owner_class, owner_id, column, pset_id, new_pset_id)
+            self.update_inverses(pset_id, remove=(owner_id,))
+            self.update_inverses(new_pset_id, add=(owner_id,))
+        else:
+            self.set_ids(owner_class, owner_id, "RelatedObjects", ifc_id, None)
+            self.update_inverses(ifc_id, remove=(owner_id,))
+            self.add_pset(ifc_id, new_pset_id)
+        return new_pset_id, copies
+
+    def add_pset(self, ifc_id: int, pset_id: int) -> None:
+        owner_history = self.get_value(self.get_ifc_class(pset_id), pset_id, "OwnerHistory")
+        rel_id = self.insert_row(
+            "IfcRelDefinesByProperties",
+            OwnerHistory=owner_history,
+            RelatedObjects=json.dumps([ifc_id]),
+            RelatingPropertyDefinition=pset_id,
+        )
+        self.update_inverses(ifc_id, add=(rel_id,))
+        self.update_inverses(pset_id, add=(rel_id,))
+
+    def remove_deleted_references(self) -> None:
+        """Remove deleted rows from relationships, and delete those left without related objects."""
+        for ifc_id, ifc_class in self.c.execute("SELECT ifc_id, ifc_class FROM dirty").fetchall():
+            if self.get_value(ifc_class, ifc_id, "ifc_id") is not None:
+                continue
+            for rel_id, rel_class, column in self.get_references(ifc_id, ("RelatedObjects", "RelatedElements")):
+                if self.set_ids(rel_class, rel_id, column, ifc_id, None):
+                    continue
+                pset_ids = self.get_ids(self.get_value(rel_class, rel_id, "RelatingPropertyDefinition"))
+                self.delete_row(rel_class, rel_id)
+                for pset_id in pset_ids:
+                    if not self.get_references(pset_id, self.pset_owner_columns):
+                        self.delete_pset(pset_id)
+
+    def delete_pset(self, pset_id: int) -> None:
+        pset_class = self.get_ifc_class(pset_id)
+        prop_ids = self.get_ids(self.get_value(pset_class, pset_id, self.property_columns.get(pset_class, "")))
+        self.delete_row(pset_class, pset_id)
+        for prop_id in prop_ids:
+            if not self.get_references(prop_id, tuple(self.property_columns.values())):
+                self.delete_row(self.get_ifc_class(prop_id), prop_id)
+
+    def get_references(self, ifc_id: int, columns: tuple[str, ...]) -> list[tuple[int, str, str]]:
+        """Return the id, class and column of the rows referring to an entity in one of the columns."""
+        ifc_class = self.get_ifc_class(ifc_id)
+        inverses = self.get_value(ifc_class, ifc_id, "inverses") if ifc_class else None
+        if inverses is not None:
+            candidates = [(i, self.get_ifc_class(i)) for i in self.get_ids(inverses)]
+        else:
+            # Deleted rows and databases converted without inverses
+            candidates = []
+            for table in sorted(self.tables):
+                for column in columns:
+                    if column in self.get_columns(table):
+                        query = f"""
+                            SELECT ifc_id FROM {table}
+                            WHERE EXISTS (SELECT 1 FROM json_each("{column}") WHERE value = ?)
+                            """
+                        candidates.extend((row[0], table) for row in self.c.execute(query, (ifc_id,)).fetchall())
+        return [
+            (i, c, column)
+            for i, c in dict.fromkeys(candidates)
+            for column in columns
+            if ifc_id in self.get_ids(self.get_value(c, i, column))
+        ]
+
+    def set_ids(
+        self, ifc_class: str, ifc_id: int, column: str, old_id: Union[int, None], new_id: Union[int, None]
+    ) -> list[int]:
+        """Replace, remove (new_id None) or append (old_id None) a reference and return the references left."""
+        value = self.get_value(ifc_class, ifc_id, column)
+        ids = [i for i in self.get_ids(value) if i != old_id or new_id is not None]
+        ids = [new_id if i == old_id else i for i in ids] + ([new_id] if old_id is None else [])
+        if isinstance(value, str):
+            value = json.dumps(ids)
+        else:
+            value = ids[0] if ids else None
+        self.c.execute(f'UPDATE {ifc_class} SET "{column}" = ? WHERE ifc_id = ?', (value, ifc_id))
+        return ids
+
+    def update_inverses(self, ifc_id: int, add: tuple[int, ...] = (), remove: tuple[int, ...] = ()) -> None:
+        ifc_class = self.get_ifc_class(ifc_id)
+        if "inverses" not in self.get_columns(ifc_class):
+            return
+        inverses = [i for i in self.get_ids(self.get_value(ifc_class, ifc_id, "inverses")) if i not in remove]
+        inverses += [i for i in add if i not in inverses]
+        self.c.execute(f"UPDATE {ifc_class} SET inverses = ? WHERE ifc_id = ?", (json.dumps(inverses), ifc_id))
+
+    def copy_row(self, ifc_class: str, ifc_id: int, **values: Any) -> int:
+        row = self.c.execute(f"SELECT * FROM {ifc_class} WHERE ifc_id = ?", (ifc_id,)).fetchone()
+        return self.insert_row(ifc_class, **(dict(zip(self.get_columns(ifc_class), row)) | values))
+
+    def insert_row(self, ifc_class: str, **values: Any) -> int:
+        """Insert an entity with a new id and GlobalId, its other attributes are null unless given."""
+        import ifcopenshell.guid
+
+        columns = self.get_columns(ifc_class)
+        row = {column: None for column in columns} | values
+        row["ifc_id"] = ifc_id = self.get_new_id()
+        if "GlobalId" in columns:
+            row["GlobalId"] = ifcopenshell.guid.new()
+        if "inverses" in columns:
+            row["inverses"] = json.dumps([])
+        placeholders = ", ".join("?" * len(columns))
+        self.c.execute(f"INSERT INTO {ifc_class} VALUES ({placeholders})", [row[column] for column in columns])
+        if "id_map_data" in self.tables:
+            class_id = self.c.execute("SELECT id FROM class_def WHERE name = ?", (ifc_class,)).fetchone()[0]
+            self.c.execute("INSERT INTO id_map_data VALUES (?, ?)", (ifc_id, class_id))
+        else:
+            self.c.execute("INSERT INTO id_map (ifc_id, ifc_class) VALUES (?, ?)", (ifc_id, ifc_class))
+        return ifc_id
+
+    def delete_row(self, ifc_class: str, ifc_id: int) -> None:
+        self.c.execute(f"DELETE FROM {ifc_class} WHERE ifc_id = ?", (ifc_id,))
+        id_map = "id_map_data" if "id_map_data" in self.tables else "id_map"
+        self.c.execute(f"DELETE FROM {id_map} WHERE ifc_id = ?", (ifc_id,))
+
+    def get_new_id(self) -> int:
+        """Return an id used neither in the source file nor in the database."""
+        if self.next_id is None:
+            ids = [max(self.get_offsets(), default=0)]
+            for table in ("id_map", "dirty"):
+                ids.append(self.c.execute(f"SELECT max(ifc_id) FROM {table}").fetchone()[0] or 0)
+            self.next_id = max(ids) + 1
+        self.next_id += 1
+        return self.next_id - 1
+
+    def get_property_set_ids(self, ifc_id: int, should_inherit: bool = True) -> list[int]:
+        ifc_class = self.get_ifc_class(ifc_id)
+        pset_ids, type_ids = [], []
+        for rel_id, rel_class in self.get_definitions(ifc_id, ifc_class):
+            if rel_class == "IfcRelDefinesByProperties":
+                pset_ids.extend(self.get_ids(self.get_value(rel_class, rel_id, "RelatingPropertyDefinition")))
+            elif rel_class == "IfcRelDefinesByType" and should_inherit:
+                type_ids.extend(self.get_ids(self.get_value(rel_class, rel_id, "RelatingType")))
+        for type_id in [ifc_id] + type_ids:
+            type_class = self.get_ifc_class(type_id)
+            if "HasPropertySets" in self.get_columns(type_class):
+                pset_ids.extend(self.get_ids(self.get_value(type_class, type_id, "HasPropertySets")))
+        return pset_ids
+
+    def get_definitions(self, ifc_id: int, ifc_class: str) -> list[tuple[int, str]]:
+        if "inverses" in self.get_columns(ifc_class):
+            inverse_ids = self.get_ids(self.get_value(ifc_class, ifc_id, "inverses"))
+            return [(i, self.get_ifc_class(i)) for i in inverse_ids]
+        results = []
+        for rel_class in ("IfcRelDefinesByProperties", "IfcRelDefinesByType"):
+            if rel_class in self.tables:
+                query = f"""
+                    SELECT ifc_id FROM {rel_class}
+                    WHERE EXISTS (SELECT 1 FROM json_each(RelatedObjects) WHERE value = ?)
+                    """
+                results.extend((row[0], rel_class) for row in self.c.execute(query, (ifc_id,)).fetchall())
+        return results
+
+    def get_ifc_class(self, ifc_id: int) -> str:
+        row = self.c.execute("SELECT ifc_class FROM id_map WHERE ifc_id = ?", (ifc_id,)).fetchone()
+        return row[0] if row else ""
+
+    def get_columns(self, ifc_class: str) -> list[str]:
+        if ifc_class not in self.columns:
+            self.columns[ifc_class] = [row[1] for row in self.c.execute(f"PRAGMA table_info('{ifc_class}')")]
+        return self.columns[ifc_class]
+
+    def get_value(self, ifc_class: str, ifc_id: int, column: str) -> Any:
+        if column not in self.get_columns(ifc_class):
+            return None
+        row = self.c.execute(f'SELECT "{column}" FROM {ifc_class} WHERE ifc_id = ?', (ifc_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_ids(self, value: Any) -> list[int]:
+        if isinstance(value, str):
+            value = json.loads(value)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+
+class IndexAdvisor:
+    equality_operators = ("=", "==", "IN", "IS")
+    keywords = {
+        "ON", "USING", "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "FULL", "GROUP",
+        "ORDER", "LIMIT", "HAVING", "WINDOW", "UNION", "EXCEPT", "INTERSECT", "INDEXED", "NOT", "AND", "OR",
+    }  # fmt: skip
+
+    def __init__(
+        self,
+        db: "sqlite3.Connection",
+        threshold: Union[int, None] = None,
+        min_rows: int = 1000,
+        max_columns: int = 4,
+        log_size: int = 1000,
+    ):
+        """Log ad hoc queries against a converted SQLite database and advise indexes for them.
+
+        Every logged SELECT is explained with ``EXPLAIN QUERY PLAN``. Full
+        scans of tables with at least ``min_rows`` rows, typically the class
+        tables and psets, are turned into an index candidate on the columns
+        the query filters, joins and orders that table by: columns compared to
+        values for equality first, then one compared to a range, then the
+        columns joined to other tables and those the query is ordered by. When
+        the other columns the query reads from the table fit within
+        ``max_columns`` they are appended, so the index also covers the query. Scans reached through views (compact psets, folded
+        class tables, supertypes) are traced back to their base tables.
+
+        :param db: Open connection to the converted database.
+        :param threshold: Create a candidate index once this many logged
+            queries needed it. None only records recommendations.
+        :param min_rows: Smaller tables are cheap to scan and never advised.
+        :param max_columns: Widest index to make covering.
+        :param log_size: Number of recent statements kept in ``log``.
+
+        Example:
+
+        .. code:: python
+
+            advisor = IndexAdvisor(sqlite3.connect("model.db"), threshold=3)
+            rows = advisor.execute("SELECT ifc_id FROM IfcWall WHERE Name = ?", ("Wall 1",))
+            for recommendation in advisor.get_recommendations():
+                print(recommendation["statement"], recommendation["queries"])
+        """
+        from collections import deque
+
+        self.db = db
+        self.threshold = threshold
+        self.min_rows = min_rows
+        self.max_columns = max_columns
+        self.log: typing.Deque[dict[str, Any]] = deque(maxlen=log_size)
+        self.candidates: dict[tuple[str, tuple[str, ...]], dict[str, Any]] = {}
+        self.row_counts: dict[str, int] = {}
+        self.columns: dict[str, list[str]] = {}
+        self.views: dict[str, str] = {}
+        self.load_schema()
+
+    def load_schema(self) -> None:
+        self.tables = set()
+        self.views.clear()
+        query = "SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'view')"
+        for kind, name, sql in self.db.execute(query):
+            if kind == "view":
+                self.views[name] = sql
+            elif not name.startswith("sqlite_"):
+                self.tables.add(name)
+        self.columns.clear()
+
+    def execute(self, query: str, parameters: Union[tuple, dict] = ()) -> list[tuple]:
+        """Run a query, log it and return all its rows."""
+        start = time.perf_counter()
+        rows = self.db.execute(query, parameters).fetchall()
+        self.log_query(query, parameters, time.perf_counter() - start)
+        return rows
+
+    def log_query(self, query: str, parameters: Union[tuple, dict] = (), elapsed: float = 0.0) -> dict[str, Any]:
+        """Record a query executed elsewhere, e.g. through a paged cursor.
+
+        :param elapsed: Seconds the query took, used to rank recommendations.
+        :return: The log entry, with the query plan and advised indexes.
+        """
+        entry: dict[str, Any] = {"query": query, "elapsed": elapsed, "plan": [], "scans": [], "indexes": []}
+        self.log.append(entry)
+        if not re.match(r"\s*(SELECT|WITH)\b", query, re.IGNORECASE):
+            return entry
+        try:
+            plan = self.db.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()
+        except sqlite3.Error:
+            return entry
+        entry["plan"] = [row[-1] for row in plan]
+        for table, columns in self.analyse(query, entry["plan"]):
+            entry["scans"].append(table)
+            if not columns:
+                continue
+            candidate = self.candidates.setdefault(
+                (table, columns), {"queries": 0, "elapsed": 0.0, "created": False, "query": query}
+            )
+            candidate["queries"] += 1
+            candidate["elapsed"] += elapsed
+            entry["indexes"].append(self.get_statement(table, columns))
+            if self.threshold is not None and candidate["queries"] >= self.threshold and not candidate["created"]:
+                self.create_index(table, columns, candidate)
+        return entry
+
+    def analyse(self, query: str, plan: list[str]) -> list[tuple[str, tuple[str, ...]]]:
+        """Return the large tables the plan fully scans, each with the index columns advised for it."""
+        query = re.sub(r"'(?:[^']|'')*'", "?", query)
+        sources = self.get_sources(query)
+        results = []
+        for detail in plan:
+            match = re.fullmatch(r"SCAN (\S+)", detail)
+            if not match:
+                continue
+            name = match.group(1)
+            matches = [s for s in sources if name in (s[1], s[2])]
+            if not matches:
+                continue
+            table = matches[0][1]
+            if self.get_row_count(table) < self.min_rows:
+                continue
+            aliases = {s[0] for s in matches}
+            is_single = len({s[0] for s in sources}) == 1
+            results.append((table, self.get_index_columns(query, table, aliases, is_single)))
+        return results
+
+    def get_sources(self, query: str, depth: int = 0) -> list[tuple[str, str, str]]:
+        """Return (query alias, base table, plan alias) for each table the query reads, looking through views."""
+        sources = []
+        for alias, name in self.get_aliases(query):
+            if name in self.tables:
+                sources.append((alias, name, alias))
+            elif name in self.views and depth < 4:
+                view_sources = self.get_sources(self.views[name], depth + 1)
+                sources.extend((alias, table, inner) for _, table, inner in view_sources)
+        return sources
+
+    def get_aliases(self, query: str) -> list[tuple[str, str]]:
+        aliases = []
+        pattern = r"\b(?:FROM|JOIN)\s+[`\"\[]?(\w+)[`\"\]]?(?:\s+(?:AS\s+)?[`\"\[]?(\w+)[`\"\]]?)?"
+        for name, alias in re.findall(pattern, query, re.IGNORECASE):
+            if not alias or alias.upper() in self.keywords:
+                alias = name
+            aliases.append((alias, name))
+        return aliases
+
+    def get_index_columns(self, query: str, table: str, aliases: set[str], is_single: bool) -> tuple[str, ...]:
+        columns = self.get_columns(table)
+        if not columns:
+            return ()
+        operators = r"==|<=|>=|=|<|>|\bIN\b|\bIS\b(?!\s+NOT\b)|\bBETWEEN\b"
+        reference = r"(?:[`\"\[]?(\w+)[`\"\]]?\.)?[`\"\[]?([\w.]+?)[`\"\]]?"
+        value = r"\?\d*|[:@$]\w+|[-+]?\d[\w.+-]*|NULL\b|\("
+        equalities: list[str] = []
+        ranges: list[str] = []
+        joins: list[str] = []
+
+        def add(target: list[str], qualifier: str, column: str) -> None:
+            if (qualifier in aliases or (not qualifier and is_single)) and column in columns and column not in target:
+                target.append(column)
+
+        # A column compared to a value filters the table, compared to another column it joins it
+        comparison = rf"{reference}\s*({operators})(?![=<>])\s*(?:({value})|{reference}(?![\w.]))"
+        for qualifier, column, operator, constant, other_qualifier, other_column in re.findall(
+            comparison, query, re.IGNORECASE
+        ):
+            if constant:
+                add(equalities if operator.upper() in self.equality_operators else ranges, qualifier, column)
+            else:
+                add(joins, qualifier, column)
+                add(joins, other_qualifier, other_column)
+        for constant, operator, qualifier, column in re.findall(
+            rf"(?<![\w.])({value})\s*(==|<=|>=|=|<|>)\s*{reference}(?![\w.])", query, re.IGNORECASE
+        ):
+            add(equalities if operator in ("=", "==") else ranges, qualifier, column)
+        orders: list[str] = []
+        order_by = re.search(r"\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|$)", query, re.IGNORECASE | re.DOTALL)
+        for qualifier, column in re.findall(reference.replace("+?", "+"), order_by.group(1) if order_by else ""):
+            add(orders, qualifier, column)
+
+        index = equalities + [c for c in ranges[:1] if c not in equalities]
+        index += [c for c in joins + orders if c not in index]
+        if not index:
+            return ()
+        # Append the other columns read from the table if they fit, so no row lookups are needed
+        primary_keys = {row[1] for row in self.db.execute(f"PRAGMA table_info(`{table}`)") if row[5]}
+        read = set()
+        for qualifier, column in re.findall(reference.replace("+?", "+"), query):
+            if column == "*" or (qualifier and qualifier not in aliases) or (not qualifier and not is_single):
+                continue
+            if column in columns and column not in index and column not in primary_keys:
+                read.add(column)
+        is_star = re.search(rf"(?:^|[\s,])(?:(?:{'|'.join(map(re.escape, aliases))})\.)?\*", query) is not None
+        if not is_star and len(index) + len(read) <= self.max_columns:
+            index += sorted(read, key=columns.index)
+        return tuple(index)
+
+    def get_columns(self, table: str) -> list[str]:
+        if table not in self.columns:
+            self.columns[table] = [row[1] for row in self.db.execute(f"PRAGMA table_info(`{table}`)")]
+        return self.columns[table]
+
+    def get_row_count(self, table: str) -> int:
+        if table not in self.row_counts:
+            self.row_counts[table] = self.db.execute(f"SELECT count(*) FROM `{table}`").fetchone()[0]
+        return self.row_counts[table]
+
+    def get_index_name(self, table: str, columns: tuple[str, ...]) -> str:
+        return re.sub(r"\W", "_", f"idx_advised_{table}_{'_'.join(columns)}")
+
+    def get_statement(self, table: str, columns: tuple[str, ...]) -> str:
+        quoted = ", ".join(f"`{c}`" for c in columns)
+        return f"CREATE INDEX IF NOT EXISTS {self.get_index_name(table, columns)} ON `{table}` ({quoted})"
+
+    def create_index(self, table: str, columns: tuple[str, ...], candidate: dict[str, Any]) -> None:
+        try:
+            self.db.execute(self.get_statement(table, columns))
+            self.db.execute(f"ANALYZE `{table}`")
+            self.db.commit()
+        except sqlite3.OperationalError:
+            # Locked by an open statement or read only, retried on the next query that needs it
+            return
+        candidate["created"] = True
+
+    def get_recommendations(self) -> list[dict[str, Any]]:
+        """Return advised indexes, the most time consuming workload first.
+
+        Each recommendation has the table, columns, number of logged queries
+        and their total seconds that scanned for it, an example query, the
+        CREATE INDEX statement and whether it was already created.
+        """
+        recommendations = [
+            {"table": table, "columns": list(columns), "statement": self.get_statement(table, columns), **candidate}
+            for (table, columns), candidate in self.candidates.items()
+        ]
+        return sorted(recommendations, key=lambda r: (r["elapsed"], r["queries"]), reverse=True)
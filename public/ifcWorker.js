@@ -8,6 +8,9 @@ importScripts("https://cdnjs.cloudflare.com/ajax/libs/sql.js/1.10.2/sql-wasm.js"
 let pyodide = null;
 // Create a cache to store the loaded IFC model data
 let ifcModelCache = null;
+// Load generation per filename, bumped by every load so caches keyed on it don't outlive a reload
+const modelLoads = new Map();
+let modelGeneration = 0;
 let pySqliteReady = false;
 
 // sql.js module and in-memory database
@@ -536,6 +539,7 @@ function postSqliteStatus(status, modelKey, extra) {
 
 // Handle loading an IFC file
 async function handleLoadIfc({ arrayBuffer, filename, messageId }) {
+  modelLoads.set(filename, ++modelGeneration);
   try {
 
     // Make sure Pyodide is initialized
@@ -728,7 +732,8 @@ async function handleLoadIfc({ arrayBuffer, filename, messageId }) {
                               should_get_inverses=True,
                               should_get_psets=True,
                               should_get_geometry=False,
-                              should_skip_geometry_data=False
+                              should_skip_geometry_data=False,
+                              should_get_stats=True
                           )
                           patcher.patch()
                           sqlite_success = os.path.exists(sqlite_db_path)
@@ -746,17 +751,14 @@ async function handleLoadIfc({ arrayBuffer, filename, messageId }) {
                                   table_count = len(tables)
                                   print(f"Python: Created {table_count} tables")
 
-                                  # Get total row count across all tables
+                                  # Row counts from the stats catalog gathered while converting, instead of scanning every table
                                   total_rows = 0
-                                  for table in tables:
-                                      table_name = table[0]
-                                      cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                                      count = cursor.fetchone()[0]
+                                  cursor.execute("SELECT ifc_class, row_count FROM stats_classes WHERE row_count > 0")
+                                  for table_name, count in cursor.fetchall():
                                       total_rows += count
-                                      if count > 0:  # Only log non-empty tables
-                                          print(f"Python: Table {table_name}: {count} rows")
+                                      print(f"Python: Table {table_name}: {count} rows")
 
-                                  print(f"Python: Total rows across all tables: {total_rows}")
+                                  print(f"Python: Total rows across class tables: {total_rows}")
                                   conn.close()
                               except Exception as db_error:
                                   print(f"Python: Error checking database statistics: {db_error}")
@@ -2469,17 +2471,141 @@ except Exception as e:
   }
 }
 
+// Relationship index module for Python node scripts, registered once in Pyodide as
+// ifc_relationship_index. The index itself is cached per model load.
+const RELATIONSHIP_INDEX_PY = `"""Relationship index shared by all Python node scripts, injected as ifc_index next to ifc_file."""
+
+_indexes = {}
+
+
+class RelationshipIndex:
+    """O(1) lookups of containment, aggregation, group membership, types, space boundaries and GlobalIds.
+
+    The maps hold STEP ids, so one index serves every ifcopenshell.file opened
+    from the same model content. Lookups return entities of the bound file.
+    It reflects the model as loaded, not edits made by the running script.
+    """
+
+    def __init__(self, ifc_file):
+        self.file = ifc_file
+        self.container_of, self.contained_in = {}, {}
+        self.parent_of, self.parts_of = {}, {}
+        self.groups_of, self.members_of = {}, {}
+        self.type_of, self.occurrences_of = {}, {}
+        self.spaces_of, self.boundaries_of = {}, {}
+        self.id_by_guid = {}
+
+        for rel in ifc_file.by_type("IfcRelContainedInSpatialStructure"):
+            self.add(self.container_of, self.contained_in, rel.RelatingStructure, rel.RelatedElements)
+        for rel in ifc_file.by_type("IfcRelAggregates"):
+            self.add(self.parent_of, self.parts_of, rel.RelatingObject, rel.RelatedObjects)
+        for rel in ifc_file.by_type("IfcRelAssignsToGroup"):
+            for element in rel.RelatedObjects:
+                self.groups_of.setdefault(element.id(), []).append(rel.RelatingGroup.id())
+            self.members_of.setdefault(rel.RelatingGroup.id(), []).extend(e.id() for e in rel.RelatedObjects)
+        for rel in ifc_file.by_type("IfcRelDefinesByType"):
+            self.add(self.type_of, self.occurrences_of, rel.RelatingType, rel.RelatedObjects)
+        for rel in ifc_file.by_type("IfcRelSpaceBoundary"):
+            if rel.RelatingSpace and rel.RelatedBuildingElement:
+                space_id, element_id = rel.RelatingSpace.id(), rel.RelatedBuildingElement.id()
+                if space_id not in self.spaces_of.get(element_id, ()):
+                    self.spaces_of.setdefault(element_id, []).append(space_id)
+                    self.boundaries_of.setdefault(space_id, []).append(element_id)
+        for element in ifc_file.by_type("IfcRoot"):
+            self.id_by_guid[element.GlobalId] = element.id()
+
+    def add(self, parent_of, children_of, parent, children):
+        parent_id = parent.id()
+        for child in children:
+            parent_of[child.id()] = parent_id
+        children_of.setdefault(parent_id, []).extend(c.id() for c in children)
+
+    def get(self, ifc_id):
+        return None if ifc_id is None else self.file.by_id(ifc_id)
+
+    def get_all(self, ifc_ids):
+        return [self.file.by_id(i) for i in ifc_ids]
+
+    def container(self, element):
+        """Spatial structure element the element is contained in (IfcRelContainedInSpatialStructure)."""
+        return self.get(self.container_of.get(element.id()))
+
+    def contained(self, structure):
+        return self.get_all(self.contained_in.get(structure.id(), ()))
+
+    def parent(self, element):
+        """Whole the element is a part of (IfcRelAggregates), e.g. the storey of a space."""
+        return self.get(self.parent_of.get(element.id()))
+
+    def parts(self, element):
+        return self.get_all(self.parts_of.get(element.id(), ()))
+
+    def groups(self, element):
+        """Groups, systems and zones the element is assigned to (IfcRelAssignsToGroup)."""
+        return self.get_all(self.groups_of.get(element.id(), ()))
+
+    def members(self, group):
+        return self.get_all(self.members_of.get(group.id(), ()))
+
+    def type(self, element):
+        return self.get(self.type_of.get(element.id()))
+
+    def occurrences(self, element_type):
+        return self.get_all(self.occurrences_of.get(element_type.id(), ()))
+
+    def spaces(self, element):
+        """Spaces the element is contained in or bounds (IfcRelSpaceBoundary)."""
+        container_id = self.container_of.get(element.id())
+        space_ids = list(self.spaces_of.get(element.id(), ()))
+        if container_id is not None and self.file.by_id(container_id).is_a("IfcSpace"):
+            space_ids.insert(0, container_id)
+        return self.get_all(dict.fromkeys(space_ids))
+
+    def boundaries(self, space):
+        """Building elements bounding the space (IfcRelSpaceBoundary)."""
+        return self.get_all(self.boundaries_of.get(space.id(), ()))
+
+    def storey(self, element):
+        """Building storey the element is in, through containment and aggregation."""
+        ifc_id = element.id()
+        while ifc_id is not None:
+            if self.file.by_id(ifc_id).is_a("IfcBuildingStorey"):
+                return self.file.by_id(ifc_id)
+            ifc_id = self.container_of.get(ifc_id, self.parent_of.get(ifc_id))
+        return None
+
+    def by_guid(self, guid):
+        return self.get(self.id_by_guid.get(guid))
+
+
+def get_index(ifc_file, model_key):
+    """Return the index of the model load with this key, building it on first use."""
+    if model_key is None:
+        return RelationshipIndex(ifc_file)  # A model not loaded through the worker can't be told apart
+    index = _indexes.get(model_key)
+    if index is None:
+        # Only the current model is kept, a changed model invalidates the previous index
+        _indexes.clear()
+        index = _indexes[model_key] = RelationshipIndex(ifc_file)
+    index.file = ifc_file
+    return index
+`;
+
 // Execute custom Python code against the currently loaded IFC model
-async function handleRunPython({ script, arrayBuffer, inputData, properties, messageId }) {
+async function handleRunPython({ script, arrayBuffer, modelName, inputData, properties, messageId }) {
   try {
     await initPyodide();
 
     // Write IFC file only if arrayBuffer is provided
     let hasIfcFile = false;
+    let modelKey = null;
     if (arrayBuffer && arrayBuffer instanceof ArrayBuffer) {
       try {
         pyodide.FS.writeFile("model.ifc", new Uint8Array(arrayBuffer));
         hasIfcFile = true;
+        // The main thread sends the file of the model's last load, so the load identifies its content
+        const generation = modelLoads.get(modelName);
+        modelKey = generation ? `${modelName}:${generation}` : null;
       } catch (fsError) {
 
       }
@@ -2491,14 +2617,24 @@ async function handleRunPython({ script, arrayBuffer, inputData, properties, mes
     namespace.set("user_script", script);
     namespace.set("input_data_json", JSON.stringify(inputData || null));
     namespace.set("properties_json", JSON.stringify(properties || {}));
+    namespace.set("model_key", modelKey);
+    namespace.set("relationship_index_source", RELATIONSHIP_INDEX_PY);
 
     const pythonCode = `
 import json, ifcopenshell, traceback
-import os
+import os, sys, types
+
+# Register the relationship index module once, so its cache outlives single node runs
+if 'ifc_relationship_index' not in sys.modules:
+    _module = types.ModuleType('ifc_relationship_index')
+    exec(relationship_index_source, _module.__dict__)
+    sys.modules['ifc_relationship_index'] = _module
+import ifc_relationship_index
 
 # Initialize all variables that should be available to user code
 ifc_file = None
 model = None  # Legacy alias for ifc_file
+ifc_index = None  # Relationship lookups shared across nodes, see RELATIONSHIP_INDEX_PY
 input_data = None
 properties = {}
 result = None
@@ -2515,6 +2651,12 @@ try:
             print(f"Python: Warning - Could not load IFC file: {ifc_error}")
             ifc_file = None
             model = None
+        if ifc_file is not None:
+            try:
+                ifc_index = ifc_relationship_index.get_index(ifc_file, model_key)
+            except Exception as index_error:
+                print(f"Python: Warning - Could not build relationship index: {index_error}")
+                ifc_index = None
     elif not has_ifc_file:
         print("Python: No IFC file provided - ifc_file will be None")
     
@@ -2864,6 +3006,7 @@ async function handleWarmSqlite({ modelKey, messageId }) {
 
 // Fast path loader: parse IFC metadata and counts, then build SQLite in background
 async function handleLoadIfcFast({ arrayBuffer, filename, messageId }) {
+  modelLoads.set(filename, ++modelGeneration);
   try {
     await initPyodide();
 
@@ -3113,7 +3256,8 @@ try:
       should_get_inverses=True,
       should_get_psets=True,
       should_get_geometry=False,
-      should_skip_geometry_data=False
+      should_skip_geometry_data=False,
+      should_get_stats=True
     )
     patcher.patch()
     success = os.path.exists(db_path)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Measure the cold start of public/ifc2sql.py the way the Pyodide worker runs it.
+
+Every sample runs in a fresh interpreter and reports, in milliseconds:
+
+- ifcopenshell: importing ifcopenshell, which the worker pays regardless
+- module: decoding and exec'ing ifc2sql.py from base64, like pyodide-worker.ts
+- first_row: until the first class is inserted by a geometry free conversion
+- total: until the geometry free conversion is finished
+
+Usage: python scripts/benchmark-ifc2sql-startup.py model.ifc [--module public/ifc2sql.py] [--runs 5]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SAMPLE = """
+import time
+start = time.perf_counter()
+import base64, json, os, tempfile
+import ifcopenshell
+timings = {"ifcopenshell": time.perf_counter() - start}
+
+encoded_code = base64.b64encode(open(MODULE, "rb").read())
+exec(base64.b64decode(encoded_code).decode("utf-8"))
+timings["module"] = time.perf_counter() - start
+
+ifc_file = ifcopenshell.open(IFC)
+database = os.path.join(tempfile.mkdtemp(), "model.db")
+patcher = Patcher(ifc_file, database=database, should_get_geometry=False)
+for event in patcher.patch_iter():
+    if event["kind"] == "class" and "first_row" not in timings:
+        timings["first_row"] = time.perf_counter() - start
+timings["total"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("ifc", help="IFC-SPF model to convert")
+    parser.add_argument("--module", default=str(Path(__file__).parent.parent / "public" / "ifc2sql.py"))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    code = f"MODULE = {str(Path(args.module).resolve())!r}\nIFC = {str(Path(args.ifc).resolve())!r}\n{SAMPLE}"
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'stage':<14}{'median ms':>10}{'min ms':>10}")
+    for stage in samples[0]:
+        values = [s[stage] * 1000 for s in samples]
+        print(f"{stage:<14}{statistics.median(values):>10.1f}{min(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
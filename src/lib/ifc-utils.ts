@@ -2527,6 +2527,7 @@ export async function runPythonScript(
       data: {
         script: code,
         arrayBuffer,
+        modelName: arrayBuffer ? model?.name : undefined,
         inputData,
         properties
       },
@@ -0,0 +1,110 @@
+import importlib.util
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ifcopenshell = pytest.importorskip("ifcopenshell")
+pytest.importorskip("ifcpatch")
+import ifcopenshell.api
+
+spec = importlib.util.spec_from_file_location("ifc2sql", ROOT / "public" / "ifc2sql.py")
+ifc2sql = importlib.util.module_from_spec(spec)
+sys.modules["ifc2sql"] = ifc2sql
+spec.loader.exec_module(ifc2sql)
+
+
+def run(f, usecase, **settings):
+    return ifcopenshell.api.run(usecase, f, **settings)
+
+
+def build_model(path: Path, walls: int = 6) -> None:
+    """Write a small IFC4 model with spaces, walls, a wall type, psets, materials and classifications."""
+    f = ifcopenshell.api.run("project.create_file", version="IFC4")
+    project = run(f, "root.create_entity", ifc_class="IfcProject", name="Project")
+    run(f, "unit.assign_unit")
+    model = run(f, "context.add_context", context_type="Model")
+    body = run(f, "context.add_context", context_type="Model", context_identifier="Body", target_view="MODEL_VIEW", parent=model)
+    site = run(f, "root.create_entity", ifc_class="IfcSite", name="Site")
+    building = run(f, "root.create_entity", ifc_class="IfcBuilding", name="Building")
+    storey = run(f, "root.create_entity", ifc_class="IfcBuildingStorey", name="Level 0")
+    run(f, "aggregate.assign_object", relating_object=project, products=[site])
+    run(f, "aggregate.assign_object", relating_object=site, products=[building])
+    run(f, "aggregate.assign_object", relating_object=building, products=[storey])
+    for element in (site, building, storey):
+        run(f, "geometry.edit_object_placement", product=element)
+
+    material = run(f, "material.add_material", name="Concrete")
+    layer_set = run(f, "material.add_material_set", name="W200", set_type="IfcMaterialLayerSet")
+    layer = run(f, "material.add_layer", layer_set=layer_set, material=material)
+    run(f, "material.edit_layer", layer=layer, attributes={"LayerThickness": 0.2})
+    classification = run(f, "classification.add_classification", classification="Uniclass")
+
+    wall_type = run(f, "root.create_entity", ifc_class="IfcWallType", name="Type A")
+    type_pset = run(f, "pset.add_pset", product=wall_type, name="Pset_WallCommon")
+    run(f, "pset.edit_pset", pset=type_pset, properties={"Reference": "TA"})
+
+    shared = None
+    for i in range(walls):
+        space = run(f, "root.create_entity", ifc_class="IfcSpace", name=f"S{i}")
+        run(f, "aggregate.assign_object", relating_object=storey, products=[space])
+        matrix = np.eye(4)
+        matrix[0, 3] = i * 5.0
+        run(f, "geometry.edit_object_placement", product=space, matrix=matrix)
+        representation = run(f, "geometry.add_wall_representation", context=body, length=4.0, height=3.0, thickness=4.0)
+        run(f, "geometry.assign_representation", product=space, representation=representation)
+
+        wall = run(f, "root.create_entity", ifc_class="IfcWall", name=f"W{i}")
+        run(f, "spatial.assign_container", relating_structure=storey, products=[wall])
+        matrix = np.eye(4)
+        matrix[0, 3], matrix[1, 3] = i * 5.0 + 1, 1.0
+        run(f, "geometry.edit_object_placement", product=wall, matrix=matrix)
+        representation = run(f, "geometry.add_wall_representation", context=body, length=2.0, height=1.0, thickness=0.2)
+        run(f, "geometry.assign_representation", product=wall, representation=representation)
+        run(f, "type.assign_type", related_objects=[wall], relating_type=wall_type)
+        pset = run(f, "pset.add_pset", product=wall, name="Pset_WallCommon")
+        properties = {"IsExternal": i % 2 == 0, "FireRating": "EI60" if i % 2 else "EI30", "ThermalTransmittance": 0.2 + i}
+        run(f, "pset.edit_pset", pset=pset, properties=properties)
+        run(f, "material.assign_material", products=[wall], type="IfcMaterialLayerSetUsage", material=layer_set)
+        run(f, "classification.add_reference", products=[wall], identification=f"Ss_25_{i}", name=f"Wall {i}", classification=classification)
+        if shared is None:
+            shared = run(f, "pset.add_pset", product=wall, name="Shared")
+            run(f, "pset.edit_pset", pset=shared, properties={"Zone": "A"})
+        else:
+            # One property set instance defining several occurrences
+            shared.DefinesOccurrence[0].RelatedObjects += (wall,)
+    f.write(str(path))
+
+
+@pytest.fixture(scope="session")
+def model_path(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("models") / "model.ifc"
+    build_model(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def other_model_path(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("models") / "other.ifc"
+    build_model(path, walls=3)
+    return path
+
+
+def convert(model_path: Path, database: Path, **options) -> sqlite3.Connection:
+    patcher = ifc2sql.Patcher(ifcopenshell.open(str(model_path)), database=str(database), **options)
+    patcher.patch()
+    return sqlite3.connect(str(database))
+
+
+def load_worker_queries() -> dict:
+    """Return the namespace of the query helpers embedded in the Pyodide worker."""
+    source = (ROOT / "ifc2sql" / "pyodide-worker.ts").read_text()
+    match = re.search(r"# Open query cursors by handle.*?(?=\nprint\(\"IFC processing environment)", source, re.S)
+    namespace = dict(vars(ifc2sql))
+    exec(match.group(0), namespace)
+    return namespace
@@ -0,0 +1,64 @@
+import pytest
+
+from conftest import convert, ifcopenshell, run
+
+import ifcopenshell.util.element
+
+
+@pytest.fixture
+def model(model_path) -> ifcopenshell.file:
+    # A wall whose type has a constituent set and a classification reference, but not the wall itself
+    model = ifcopenshell.open(str(model_path))
+    wall_type = run(model, "root.create_entity", ifc_class="IfcWallType", name="Type B")
+    constituents = run(model, "material.add_material_set", name="Sandwich", set_type="IfcMaterialConstituentSet")
+    for name in ("Steel", "Insulation"):
+        material = run(model, "material.add_material", name=name)
+        run(model, "material.add_constituent", constituent_set=constituents, material=material)
+    run(
+        model, "material.assign_material", products=[wall_type], type="IfcMaterialConstituentSet", material=constituents
+    )
+    classification = model.by_type("IfcClassification")[0]
+    run(
+        model,
+        "classification.add_reference",
+        products=[wall_type],
+        identification="Ss_25_99",
+        name="Sandwich wall",
+        classification=classification,
+    )
+    wall = run(model, "root.create_entity", ifc_class="IfcWall", name="W6")
+    run(model, "type.assign_type", related_objects=[wall], relating_type=wall_type)
+    return model
+
+
+def test_rows(model, tmp_path):
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+    with convert(path, tmp_path / "model.db", should_get_associations=True, should_get_geometry=False) as db:
+        materials = db.execute("SELECT * FROM element_material ORDER BY ifc_id, layer_index").fetchall()
+        classifications = db.execute("SELECT * FROM element_classification ORDER BY ifc_id").fetchall()
+        query = """
+            SELECT w.Name FROM IfcWall w JOIN element_classification c ON c.ifc_id = w.ifc_id
+            WHERE c.code LIKE 'Ss_25_%' ORDER BY w.Name
+        """
+        classified = [row[0] for row in db.execute(query)]
+
+    walls = {w.Name: w.id() for w in model.by_type("IfcWall")}
+    concrete = model.by_type("IfcMaterial")[0].id()
+    steel, insulation = [m.id() for m in model.by_type("IfcMaterial")[1:]]
+    wall_type = model.by_type("IfcWallType")[1].id()
+    expected = [(walls[f"W{i}"], concrete, 0, 0.2, "Concrete") for i in range(6)]
+    expected += [(wall_type, steel, 0, None, "Steel"), (wall_type, insulation, 1, None, "Insulation")]
+    expected += [(walls["W6"], steel, 0, None, "Steel"), (walls["W6"], insulation, 1, None, "Insulation")]
+    assert materials == sorted(expected, key=lambda row: row[:3])
+
+    expected = [(model.by_type("IfcProject")[0].id(), "Uniclass", None, None)]
+    expected += [(walls[f"W{i}"], "Uniclass", f"Ss_25_{i}", f"Wall {i}") for i in range(6)]
+    expected += [(i, "Uniclass", "Ss_25_99", "Sandwich wall") for i in (wall_type, walls["W6"])]
+    assert classifications == sorted(expected)
+    assert classified == [f"W{i}" for i in range(7)]
+
+    # The same materials as ifcopenshell resolves, inherited from the type where the occurrence has none
+    for name, ifc_id in walls.items():
+        names = {m.Name for m in ifcopenshell.util.element.get_materials(model.by_id(ifc_id))}
+        assert names == {row[4] for row in materials if row[0] == ifc_id}, name
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from conftest import ifc2sql, ifcopenshell
+
+QUERIES = [
+    "SELECT * FROM psets ORDER BY ifc_id, pset_name, name",
+    "SELECT * FROM id_map ORDER BY ifc_id",
+    """
+    SELECT w.Name, p.value FROM IfcWall w JOIN psets p ON p.ifc_id = w.ifc_id
+    WHERE p.pset_name = 'Pset_WallCommon' AND p.name = 'FireRating' AND p.value = 'EI60' ORDER BY w.Name
+    """,
+    "SELECT ifc_class, count(*) FROM id_map GROUP BY ifc_class ORDER BY ifc_class",
+]
+
+
+def convert(model_path, database, **options) -> sqlite3.Connection:
+    patcher = ifc2sql.Patcher(
+        ifcopenshell.open(str(model_path)), database=str(database), should_get_geometry=False, **options
+    )
+    for _ in patcher.patch_iter(batch_size=2):  # Names are interned across batches
+        pass
+    return sqlite3.connect(str(database))
+
+
+@pytest.fixture(scope="module")
+def databases(model_path, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("compact")
+    with convert(model_path, directory / "model.db") as db, convert(
+        model_path, directory / "compact.db", should_compact_psets=True
+    ) as compact:
+        yield db, compact
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_views_match_tables(databases, query):
+    db, compact = databases
+    cursor, compact_cursor = db.execute(query), compact.execute(query)
+    rows = [tuple((type(v), v) for v in row) for row in cursor]
+    assert [tuple((type(v), v) for v in row) for row in compact_cursor] == rows
+    assert [c[0] for c in compact_cursor.description] == [c[0] for c in cursor.description]
+    assert rows
+
+
+def test_names_are_interned(databases):
+    db, compact = databases
+    query = "SELECT name, type FROM sqlite_master WHERE name IN ('psets', 'id_map') ORDER BY name"
+    assert compact.execute(query).fetchall() == [("id_map", "view"), ("psets", "view")]
+    assert compact.execute("SELECT name FROM pset_def ORDER BY name").fetchall() == [("Pset_WallCommon",), ("Shared",)]
+    properties = compact.execute("SELECT pset_id, name FROM prop_def").fetchall()
+    assert len(properties) == len(set(properties)) == 5
+    classes = [row[0] for row in compact.execute("SELECT name FROM class_def")]
+    assert sorted(classes) == sorted(set(classes)) == [row[0] for row in db.execute(QUERIES[3])]
+    count = "SELECT count(*) FROM {}"
+    assert compact.execute(count.format("pset_values")).fetchone() == db.execute(count.format("psets")).fetchone()
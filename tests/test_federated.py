@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from conftest import convert, ifc2sql
+
+OPTIONS = [
+    {},
+    {"should_get_geometry": False},
+    {"should_get_spatial_closure": True},
+    {"should_get_associations": True},
+    {"should_get_room_assignment": True},
+    {"should_get_geometric_quantities": True},
+    {"should_get_lods": True},
+    {"should_get_search_index": True},
+    {"should_get_supertypes": True},
+    {"materialised_supertypes": ("IfcElement",)},
+    {"should_get_pset_pivots": True, "pset_pivot_threshold": 0.1},
+    {"should_get_guid_map": True},
+    {"should_get_guid_map": True, "should_compact_guids": True},
+    {"should_get_stats": True},
+    {"should_optimise_storage": True},
+    {"should_preview": True},
+    {"should_expand": True},
+]
+
+
+def get_count(db: sqlite3.Connection, table: str) -> int:
+    return db.execute(f"SELECT count(*) FROM `{table}`").fetchone()[0]
+
+
+def get_tables(db: sqlite3.Connection) -> set[str]:
+    query = "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+    query += " AND name NOT LIKE 'search_index_%' AND name NOT LIKE 'sqlite_%'"
+    return {row[0] for row in db.execute(query)} - set(ifc2sql.FederatedPatcher.skipped_tables)
+
+
+@pytest.mark.parametrize("options", OPTIONS, ids=lambda o: "-".join(o) or "default")
+def test_federation(model_path, other_model_path, tmp_path, options):
+    paths = [model_path, other_model_path]
+    sources = [convert(path, tmp_path / f"{i}.db", **options) for i, path in enumerate(paths)]
+    database = tmp_path / "federated.db"
+    ifc2sql.FederatedPatcher([str(p) for p in paths], str(database), max_workers=1, **options).patch()
+    db = sqlite3.connect(database)
+
+    assert db.execute("SELECT model_id, id_offset FROM models ORDER BY model_id").fetchall() == [
+        (1, 0),
+        (2, sources[0].execute("SELECT max(ifc_id) FROM id_map").fetchone()[0]),
+    ]
+    assert get_tables(db) - {"models"} == set().union(*(get_tables(s) for s in sources))
+    for table in get_tables(db) - {"models"}:
+        if table in ifc2sql.STATS_TABLES:
+            # Statistics of the same key in both models are added up
+            keys, columns = ifc2sql.STATS_TABLES[table]
+            query = f"SELECT {', '.join(keys)}, {columns[0]} FROM {table}"
+            expected: dict = {}
+            for source in sources:
+                for *key, count in source.execute(query):
+                    expected[tuple(key)] = expected.get(tuple(key), 0) + count
+            assert {tuple(key): count for *key, count in db.execute(query)} == expected, table
+        else:
+            assert get_count(db, table) == sum(get_count(s, table) for s in sources if table in get_tables(s)), table
+
+    # Ids are shifted per model, so references resolve within the merged model
+    assert get_count(db, "id_map") == db.execute("SELECT count(DISTINCT ifc_id) FROM id_map").fetchone()[0]
+    for (model_id,) in db.execute("SELECT model_id FROM models"):
+        query = """
+            SELECT count(*) FROM IfcWall w JOIN id_map m ON m.ifc_id = w.ObjectPlacement
+            WHERE m.ifc_class = 'IfcLocalPlacement' AND m.model_id = ?
+            AND w.ifc_id IN (SELECT ifc_id FROM id_map WHERE model_id = ?)
+        """
+        walls = db.execute(query, (model_id, model_id)).fetchone()[0]
+        assert walls == get_count(sources[model_id - 1], "IfcWall")
+
+    # Folded classes are read through a view, their rows are edited in the data table
+    walls = "IfcWall_data" if "IfcWall_data" in get_tables(db) else "IfcWall"
+    db.execute(f"UPDATE {walls} SET Name = 'Edited'")
+    db.execute("DELETE FROM psets WHERE name = 'FireRating'")
+
+
+def test_merge_change_tracked_databases(model_path, other_model_path, tmp_path):
+    paths = [model_path, other_model_path]
+    databases = [str(tmp_path / f"{i}.db") for i in range(len(paths))]
+    for path, database in zip(paths, databases):
+        convert(path, database, should_get_geometry=False, should_track_changes=True)
+    federation = ifc2sql.FederatedPatcher([str(p) for p in paths], str(tmp_path / "federated.db"))
+    federation.merge(databases)
+    db = sqlite3.connect(tmp_path / "federated.db")
+    assert not db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    db.execute("UPDATE IfcWall SET Name = 'Edited'")
+    db.execute("UPDATE psets SET value = 'EI90' WHERE name = 'FireRating'")
+    db.execute("DELETE FROM IfcWall")
+
+
+def test_unsupported_options(model_path, tmp_path):
+    for option in ("should_compact_psets", "should_track_changes"):
+        with pytest.raises(ValueError):
+            ifc2sql.FederatedPatcher([str(model_path)], str(tmp_path / "federated.db"), **{option: True})
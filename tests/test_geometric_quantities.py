@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from conftest import convert, ifc2sql, ifcopenshell, run
+
+import ifcopenshell.geom
+import ifcopenshell.util.shape
+
+
+@pytest.mark.parametrize("batch_size", [2**20, 12], ids=["one-batch", "batches"])
+def test_quantities(model_path, tmp_path, monkeypatch, batch_size):
+    get_geometric_quantities_rows = ifc2sql.Patcher.get_geometric_quantities_rows
+    monkeypatch.setattr(
+        ifc2sql.Patcher,
+        "get_geometric_quantities_rows",
+        lambda self: get_geometric_quantities_rows(self, batch_size=batch_size),
+    )
+    # A wall turned by 90 degrees, so its plan sizes swap
+    model = ifcopenshell.open(str(model_path))
+    wall = run(model, "root.create_entity", ifc_class="IfcWall", name="Turned")
+    matrix = np.array([[0.0, -1.0, 0.0, 50.0], [1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]])
+    run(model, "geometry.edit_object_placement", product=wall, matrix=matrix)
+    body = model.by_type("IfcGeometricRepresentationSubContext")[0]
+    representation = run(model, "geometry.add_wall_representation", context=body, length=2.0, height=1.0, thickness=0.2)
+    run(model, "geometry.assign_representation", product=wall, representation=representation)
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+
+    with convert(path, tmp_path / "model.db", should_get_geometric_quantities=True) as db:
+        rows = {row[0]: row[1:] for row in db.execute("SELECT * FROM geometric_quantities")}
+
+    # Spaces are 4 by 4 by 3, walls 2 by 0.2 by 1
+    expected = {}
+    for element in model.by_type("IfcSpace"):
+        expected[element.id()] = (80.0, 48.0, 16.0, 3.0, 4.0, 4.0)
+    for element in model.by_type("IfcWall"):
+        expected[element.id()] = (5.2, 0.4, 0.4, 1.0, 2.0, 0.2)
+    expected[wall.id()] = (5.2, 0.4, 0.4, 1.0, 0.2, 2.0)
+    assert rows.keys() == expected.keys()
+    for ifc_id, values in expected.items():
+        assert rows[ifc_id] == pytest.approx(values)
+
+    # As ifcopenshell.util.shape measures the tessellated shapes
+    settings = ifcopenshell.geom.settings()
+    for element in model.by_type("IfcProduct"):
+        if element.id() in rows:
+            shape = ifcopenshell.geom.create_shape(settings, element)  # Owns the buffers of its geometry
+            geometry = shape.geometry
+            assert rows[element.id()][0] == pytest.approx(ifcopenshell.util.shape.get_area(geometry))
+            assert rows[element.id()][1] == pytest.approx(ifcopenshell.util.shape.get_volume(geometry))
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from conftest import convert, ifc2sql, ifcopenshell
+
+pytestmark = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork", reason="The slowed down worker is only inherited by forked workers"
+)
+
+BUDGET = 0.5
+
+
+class SlowConnection:
+    """Worker side of the pipe that stalls on the given (element id, is_simplified) requests."""
+
+    def __init__(self, connection, slow: set[tuple[int, bool]], log: str):
+        self.connection = connection
+        self.slow = slow
+        self.log = log
+
+    def recv(self):
+        message = self.connection.recv()
+        if message is not None:
+            with open(self.log, "a") as f:
+                f.write(f"{os.getpid()} {message[0]} {int(message[1])}\n")
+            if tuple(message) in self.slow:
+                time.sleep(60)  # Far over the budget, the worker is killed
+        return message
+
+    def send(self, message):
+        if message is None:
+            with open(self.log, "a") as f:
+                f.write(f"{os.getpid()} load\n")
+        self.connection.send(message)
+
+
+@pytest.fixture
+def walls(model_path) -> dict[str, int]:
+    return {w.Name: w.id() for w in ifcopenshell.open(str(model_path)).by_type("IfcWall")}
+
+
+@pytest.fixture
+def log(monkeypatch, tmp_path, walls) -> str:
+    # W0 exceeds the budget once and gets a placeholder, W1 also exceeds it when simplified and fails
+    slow = {(walls["W0"], False), (walls["W1"], False), (walls["W1"], True)}
+    log = str(tmp_path / "workers.log")
+    tessellate_elements = ifc2sql.tessellate_elements
+
+    def tessellate_slowly(filepath, settings, connection):
+        tessellate_elements(filepath, settings, SlowConnection(connection, slow, log))
+
+    monkeypatch.setattr(ifc2sql, "tessellate_elements", tessellate_slowly)
+    return log
+
+
+def get_shapes(db: sqlite3.Connection) -> dict[int, tuple[str, np.ndarray]]:
+    query = "SELECT s.ifc_id, g.id, g.verts FROM shape s JOIN geometry g ON g.id = s.geometry"
+    return {i: (g, np.frombuffer(v, dtype="d").reshape(-1, 3)) for i, g, v in db.execute(query)}
+
+
+def test_placeholders(model_path, tmp_path, walls, log):
+    options = {"geometry_time_budget": BUDGET, "should_retry_deferred_geometry": False}
+    with convert(model_path, tmp_path / "model.db", **options) as db:
+        statuses = dict(db.execute("SELECT ifc_id, status FROM geometry_status"))
+        shapes = get_shapes(db)
+    assert statuses == {walls["W0"]: "placeholder", walls["W1"]: "failed"}
+    assert walls["W1"] not in shapes
+
+    # The placeholder is the bounding box of the wall, 2 long, 0.2 thick and 1 high
+    with convert(model_path, tmp_path / "expected.db") as db:
+        expected = get_shapes(db)
+    geometry_id, verts = shapes[walls["W0"]]
+    assert geometry_id == f"{walls['W0']}-placeholder"
+    assert len(verts) == 8
+    expected_verts = expected[walls["W0"]][1]
+    assert np.allclose(verts.min(axis=0), expected_verts.min(axis=0))
+    assert np.allclose(verts.max(axis=0), expected_verts.max(axis=0))
+    for name in ("W2", "W3", "W4", "W5"):
+        assert np.array_equal(shapes[walls[name]][1], expected[walls[name]][1])
+
+    # Each killed worker is replaced by a new one that loads the model again
+    lines = [line.split() for line in open(log).read().splitlines()]
+    requests = {(int(line[1]), line[2] == "1"): line[0] for line in lines if len(line) == 3}
+    loaded = [line[0] for line in lines if line[1:] == ["load"]]
+    for name in ("W0", "W1"):
+        pid = requests[(walls[name], True)]
+        assert pid != requests[(walls[name], False)]
+        assert pid in loaded
+
+
+def test_retry(model_path, tmp_path, walls, log):
+    with convert(model_path, tmp_path / "model.db", geometry_time_budget=BUDGET) as db:
+        statuses = dict(db.execute("SELECT ifc_id, status FROM geometry_status"))
+        shapes = get_shapes(db)
+        query = "SELECT count(*) FROM shape WHERE ifc_id IN (?, ?)"
+        shape_count = db.execute(query, (walls["W0"], walls["W1"])).fetchone()[0]
+        placeholder_count = db.execute("SELECT count(*) FROM geometry WHERE id LIKE '%-placeholder'").fetchone()[0]
+    assert statuses == {walls["W0"]: "deferred", walls["W1"]: "deferred"}
+    assert shape_count == 2  # The placeholder was replaced, not added to
+    assert placeholder_count == 0
+
+    # Tessellated again in the second pass, they get their real mesh
+    with convert(model_path, tmp_path / "expected.db") as db:
+        expected = get_shapes(db)
+    assert shapes.keys() == expected.keys()
+    for ifc_id, (geometry_id, verts) in expected.items():
+        assert shapes[ifc_id][0] == geometry_id
+        assert np.array_equal(shapes[ifc_id][1], verts)
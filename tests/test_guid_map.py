@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import convert, ifcopenshell
+
+import ifcopenshell.guid
+
+
+@pytest.mark.parametrize("should_compact_guids", [False, True], ids=["text", "compact"])
+def test_lookups(model_path, tmp_path, should_compact_guids):
+    # Two walls sharing a GlobalId, and GlobalIds that don't decode into 16 bytes
+    model = ifcopenshell.open(str(model_path))
+    walls = model.by_type("IfcWall")
+    walls[1].GlobalId = walls[0].GlobalId
+    walls[2].GlobalId = "zzzzzzzzzzzzzzzzzzzzzz"  # Above the 128 bits
+    walls[3].GlobalId = "Invalid"
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+
+    options = {"should_get_guid_map": True, "should_compact_guids": should_compact_guids, "should_get_geometry": False}
+    with convert(path, tmp_path / "model.db", **options) as db:
+        rows = db.execute("SELECT guid, ifc_id, ifc_class FROM guid_map").fetchall()
+        query = "SELECT ifc_id, ifc_class FROM guid_map WHERE guid = ? ORDER BY ifc_id"
+        lookups = {}
+        for element in model.by_type("IfcRoot"):
+            key = element.GlobalId
+            if should_compact_guids and element not in walls[2:4]:
+                key = bytes.fromhex(ifcopenshell.guid.expand(key))
+            lookups[element.id()] = db.execute(query, (key,)).fetchall()
+        plan = db.execute(f"EXPLAIN QUERY PLAN {query}", (key,)).fetchall()
+
+    assert len(rows) == len(model.by_type("IfcRoot"))
+    for element in model.by_type("IfcRoot"):
+        if element in walls[:2]:
+            assert lookups[element.id()] == [(walls[0].id(), "IfcWall"), (walls[1].id(), "IfcWall")]
+        else:
+            assert lookups[element.id()] == [(element.id(), element.is_a())]
+    assert "USING PRIMARY KEY (guid=?)" in plan[0][-1]
+    types = {type(guid) for guid, ifc_id, _ in rows if ifc_id not in (walls[2].id(), walls[3].id())}
+    assert types == {bytes if should_compact_guids else str}
+    assert {type(guid) for guid, ifc_id, _ in rows if ifc_id in (walls[2].id(), walls[3].id())} == {str}
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+LAZY_MODULES = ("ifcopenshell.geom", "ifcopenshell.util.element", "ifcopenshell.util.placement", "shapely")
+
+SCRIPT = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("ifc2sql", {module!r})
+ifc2sql = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ifc2sql)
+if {model!r}:
+    import ifcopenshell
+    ifc2sql.Patcher(ifcopenshell.open({model!r}), database=":memory:", **{options!r}).patch()
+print(",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+
+def get_imported(model: str = "", **options) -> list[str]:
+    module = str(ROOT / "public" / "ifc2sql.py")
+    script = SCRIPT.format(module=module, model=model, options=options, modules=LAZY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return [m for m in output.strip().split(",") if m]
+
+
+def test_module_import_is_lazy():
+    assert get_imported() == []
+
+
+def test_conversion_imports_enabled_options_only(model_path):
+    assert get_imported(str(model_path), should_get_geometry=False, should_get_psets=False) == []
+    # ifcopenshell.util.shape imports ifcopenshell.util.element itself
+    imported = get_imported(str(model_path), should_get_psets=False)
+    assert imported == ["ifcopenshell.geom", "ifcopenshell.util.element", "ifcopenshell.util.placement", "shapely"]
@@ -0,0 +1,61 @@
+import pytest
+
+from conftest import convert, ifc2sql
+
+
+@pytest.fixture
+def db(model_path, tmp_path):
+    with convert(model_path, tmp_path / "model.db", should_get_geometry=False) as db:
+        yield db
+
+
+def get_plan(db, query, parameters=()) -> list[str]:
+    return [row[-1] for row in db.execute(f"EXPLAIN QUERY PLAN {query}", parameters)]
+
+
+@pytest.mark.parametrize(
+    "query, parameters, table, columns, search",
+    [
+        (
+            "SELECT w.Name FROM IfcWall w JOIN psets p ON p.ifc_id = w.ifc_id WHERE p.name = ? AND p.value = ?",
+            ("FireRating", "EI60"),
+            "psets",
+            ["name", "value", "ifc_id"],
+            "(name=? AND value=?)",
+        ),
+        (
+            "SELECT w.Name FROM IfcWall w JOIN psets p ON w.ifc_id = p.ifc_id WHERE p.name = 'ThermalTransmittance' "
+            "AND p.value > 2.5 ORDER BY p.pset_name",
+            (),
+            "psets",
+            ["name", "value", "ifc_id", "pset_name"],
+            "(name=? AND value>?)",
+        ),
+        (
+            "SELECT Name FROM IfcWall WHERE ObjectType IS NULL AND Name >= ? ORDER BY Tag",
+            ("W3",),
+            "IfcWall",
+            ["ObjectType", "Name", "Tag"],
+            "(ObjectType=? AND Name>?)",
+        ),
+    ],
+)
+def test_filters_before_joins(db, query, parameters, table, columns, search):
+    advisor = ifc2sql.IndexAdvisor(db, threshold=1, min_rows=1)
+    advisor.execute(query, parameters)
+    recommendation = advisor.get_recommendations()[0]
+    assert (recommendation["table"], recommendation["columns"]) == (table, columns)
+    quoted = ", ".join(f"`{c}`" for c in columns)
+    assert recommendation["statement"].endswith(f"ON `{table}` ({quoted})")
+    assert recommendation["created"]
+
+    # The created index serves the filters
+    name = advisor.get_index_name(table, tuple(columns))
+    assert any(name in detail and search in detail for detail in get_plan(db, query, parameters))
+    assert db.execute(query, parameters).fetchall() == advisor.execute(query, parameters)
+
+
+def test_join_only(db):
+    advisor = ifc2sql.IndexAdvisor(db, min_rows=1)
+    advisor.execute("SELECT w.Name, p.value FROM IfcWall w JOIN psets p ON p.ifc_id = w.ifc_id")
+    assert [r["columns"] for r in advisor.get_recommendations()] == [["ifc_id", "value"]]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from conftest import convert, ifcopenshell, run
+
+
+@pytest.fixture
+def path(model_path, tmp_path):
+    # A column tessellated into many more vertices than the boxes of the fixture
+    model = ifcopenshell.open(str(model_path))
+    column = run(model, "root.create_entity", ifc_class="IfcColumn", name="C0")
+    run(model, "geometry.edit_object_placement", product=column)
+    profile = model.createIfcCircleProfileDef("AREA", None, None, 500.0)  # In millimetres
+    position = model.createIfcAxis2Placement3D(model.createIfcCartesianPoint((0.0, 0.0, 0.0)))
+    solid = model.createIfcExtrudedAreaSolid(profile, position, model.createIfcDirection((0.0, 0.0, 1.0)), 3000.0)
+    body = model.by_type("IfcGeometricRepresentationSubContext")[0]
+    representation = model.createIfcShapeRepresentation(body, "Body", "SweptSolid", [solid])
+    run(model, "geometry.assign_representation", product=column, representation=representation)
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+    return path
+
+
+def get_lods(path, database, **options) -> tuple[np.ndarray, list[tuple]]:
+    """Return the vertices of the column and its levels of detail as (lod, ratio, verts, faces, error)."""
+    with convert(path, database, should_get_lods=True, **options) as db:
+        column = "SELECT s.geometry FROM shape s JOIN IfcColumn c ON c.ifc_id = s.ifc_id"
+        verts = db.execute(f"SELECT verts FROM geometry WHERE id = ({column})").fetchone()[0]
+        query = f"SELECT lod, ratio, verts, faces, error FROM geometry_lod WHERE id = ({column}) ORDER BY lod"
+        lods = [
+            (lod, ratio, np.frombuffer(v, dtype="d").reshape(-1, 3), np.frombuffer(f, dtype=np.int32).reshape(-1, 3), e)
+            for lod, ratio, v, f, e in db.execute(query)
+        ]
+        assert db.execute("SELECT count(DISTINCT id) FROM geometry_lod").fetchone() == (1,)  # Boxes get none
+    return np.frombuffer(verts, dtype="d").reshape(-1, 3), lods
+
+
+def test_vertex_counts(path, tmp_path):
+    verts, lods = get_lods(path, tmp_path / "model.db")
+    assert len(verts) >= 32
+    assert [(lod, ratio) for lod, ratio, *_ in lods] == [(1, 0.5), (2, 0.2), (3, 0.05)]
+    count = len(verts)
+    lower, upper = verts.min(axis=0), verts.max(axis=0)
+    diagonal = np.linalg.norm(upper - lower)
+    for _, ratio, lod_verts, lod_faces, error in lods:
+        assert len(lod_verts) < count
+        assert len(lod_verts) <= max(int(len(verts) * ratio), 4)
+        count = len(lod_verts)
+        assert len(lod_faces) and lod_faces.max() < len(lod_verts)
+        assert np.unique(lod_faces).size == len(lod_verts)  # No unused vertex
+        # Cluster means stay within the original shape
+        assert np.all(lod_verts >= lower - 1e-9) and np.all(lod_verts <= upper + 1e-9)
+        assert 0 < error <= diagonal
+    assert [error for *_, error in lods] == sorted(error for *_, error in lods)
+
+
+def test_levels_without_reduction_are_skipped(path, tmp_path):
+    _, lods = get_lods(path, tmp_path / "model.db", lod_ratios=(0.5, 0.5, 0.05))
+    assert [(lod, ratio) for lod, ratio, *_ in lods] == [(1, 0.5), (3, 0.05)]
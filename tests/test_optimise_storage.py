@@ -0,0 +1,51 @@
+import json
+import sqlite3
+
+import pytest
+
+from conftest import convert
+
+
+def get_tables(db: sqlite3.Connection) -> dict[str, str]:
+    return dict(db.execute("SELECT name, type FROM sqlite_master WHERE name LIKE 'Ifc%' AND type IN ('table', 'view')"))
+
+
+def get_rows(db: sqlite3.Connection, table: str) -> list[tuple]:
+    cursor = db.execute(f"SELECT * FROM `{table}` ORDER BY ifc_id")
+    columns = [c[0] for c in cursor.description]
+    rows = []
+    for row in cursor:
+        # Types are compared too, as 1 == 1.0 == True. Inverse order is not stable between runs.
+        rows.append(
+            tuple(
+                (type(v), sorted(json.loads(v)) if c == "inverses" and v is not None else v)
+                for c, v in zip(columns, row)
+            )
+        )
+    return rows
+
+
+@pytest.mark.parametrize("threshold", [0.05, 1.0])
+def test_round_trip(model_path, tmp_path, threshold):
+    options = {"should_get_geometry": False}
+    with convert(model_path, tmp_path / "model.db", **options) as db, convert(
+        model_path,
+        tmp_path / "optimised.db",
+        should_optimise_storage=True,
+        sparse_column_threshold=threshold,
+        **options,
+    ) as optimised:
+        tables = get_tables(db)
+        optimised_tables = get_tables(optimised)
+        folded = sorted(t for t, kind in optimised_tables.items() if kind == "view" and f"{t}_data" in optimised_tables)
+        assert "IfcWall" in folded
+        assert set(optimised_tables) == set(tables) | {f"{t}_data" for t in folded}
+        assert all(kind == "table" for t, kind in optimised_tables.items() if t not in folded)
+        if sqlite3.sqlite_version_info >= (3, 37, 0):
+            query = "SELECT count(*) FROM sqlite_master WHERE name = ? AND sql LIKE '%STRICT'"
+            assert optimised.execute(query, ("IfcWall_data",)).fetchone()[0] == 1
+
+        for table in tables:
+            columns = [row[1] for row in db.execute(f"PRAGMA table_info(`{table}`)")]
+            assert [row[1] for row in optimised.execute(f"PRAGMA table_info(`{table}`)")] == columns
+            assert get_rows(optimised, table) == get_rows(db, table), table
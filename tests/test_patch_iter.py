@@ -0,0 +1,75 @@
+import asyncio
+import gc
+import sqlite3
+
+import pytest
+
+from conftest import ifc2sql, ifcopenshell
+
+
+@pytest.fixture
+def patcher(model_path, tmp_path):
+    file = ifcopenshell.open(str(model_path))
+    return ifc2sql.Patcher(file, database=str(tmp_path / "model.db"), should_commit_progressively=True)
+
+
+def get_status(patcher) -> dict[str, str]:
+    with sqlite3.connect(patcher.file_patched) as db:
+        return dict(db.execute("SELECT name, status FROM conversion_status"))
+
+
+def test_complete(patcher):
+    events = list(patcher.patch_iter())
+    assert events[-1] == {"kind": "stage", "name": "conversion", "progress": 100}
+    assert [e["progress"] for e in events] == sorted(e["progress"] for e in events)
+    assert not patcher.is_cancelled
+    assert get_status(patcher)["conversion"] == "complete"
+
+
+def test_cancel(patcher):
+    count = iter(range(1000))
+    events = list(patcher.patch_iter(cancel=lambda: next(count) >= 3))
+    assert len(events) == 4  # Polled after every event, the fourth one stops it
+    assert patcher.is_cancelled
+    assert get_status(patcher)["conversion"] == "running"
+
+
+def test_close_early(patcher):
+    events = patcher.patch_iter()
+    next(events)
+    next(events)
+    events.close()
+    assert patcher.is_cancelled
+    assert get_status(patcher)["conversion"] == "running"
+    with pytest.raises(sqlite3.ProgrammingError):
+        patcher.db.execute("SELECT 1")  # Closed
+
+
+def test_drop_early(patcher):
+    events = patcher.patch_iter()
+    next(events)
+    del events
+    gc.collect()
+    assert patcher.is_cancelled
+
+
+def test_close_after_last_event(patcher):
+    events = patcher.patch_iter()
+    for event in events:
+        if event["name"] == "conversion":
+            break
+    events.close()
+    assert not patcher.is_cancelled
+    assert get_status(patcher)["conversion"] == "complete"
+
+
+def test_async_break(patcher):
+    async def convert():
+        events = patcher.patch_async()
+        async for event in events:
+            if event["kind"] == "class":
+                break
+        await events.aclose()
+
+    asyncio.run(convert())
+    assert patcher.is_cancelled
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from conftest import convert, ifc2sql, ifcopenshell
+
+import ifcopenshell.geom
+import ifcopenshell.util.placement
+import ifcopenshell.util.shape
+import ifcopenshell.util.unit
+
+
+@pytest.fixture
+def model(model_path) -> ifcopenshell.file:
+    model = ifcopenshell.open(str(model_path))
+    # A turned and tilted storey with unnormalised axes, a building with a 2D placement, and a chair placed
+    # relative to a wall at the end of the longest chain
+    storey = model.by_type("IfcBuildingStorey")[0].ObjectPlacement.RelativePlacement
+    storey.Location.Coordinates = (1.0, 2.0, 3.0)
+    storey.Axis = model.createIfcDirection((0.0, 0.1, 2.0))
+    storey.RefDirection = model.createIfcDirection((1.0, 1.0, 0.0))
+    building = model.by_type("IfcBuilding")[0].ObjectPlacement
+    building.RelativePlacement = model.createIfcAxis2Placement2D(
+        model.createIfcCartesianPoint((5.0, 0.0)), model.createIfcDirection((0.0, 1.0))
+    )
+    wall = model.by_type("IfcWall")[2].ObjectPlacement
+    chair = model.createIfcFurniture(ifcopenshell.guid.new(), Name="Chair")
+    location = model.createIfcCartesianPoint((0.5, 0.0, 0.0))
+    chair.ObjectPlacement = model.createIfcLocalPlacement(wall, model.createIfcAxis2Placement3D(location))
+    return model
+
+
+def test_matrices(model):
+    patcher = ifc2sql.Patcher(model, database=":memory:")
+    matrices = patcher.get_placement_matrices()
+    placements = model.by_type("IfcLocalPlacement")
+    assert matrices.keys() == {p.id() for p in placements}
+    for placement in placements:
+        assert np.allclose(matrices[placement.id()], ifcopenshell.util.placement.get_local_placement(placement))
+
+
+def test_shape_rows(model, tmp_path):
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+    settings = ifcopenshell.geom.settings()
+    unit_scale = ifcopenshell.util.unit.calculate_unit_scale(model)
+    with convert(path, tmp_path / "model.db") as db:
+        rows = {row[0]: row[1:] for row in db.execute("SELECT ifc_id, x, y, z, matrix, geometry FROM shape")}
+
+    # Elements without a tessellated shape get the matrix of their placement, in the units of the model
+    products = [p for p in model.by_type("IfcProduct") if p.ObjectPlacement]
+    assert rows.keys() == {p.id() for p in products}
+    for product in products:
+        expected = ifcopenshell.util.placement.get_local_placement(product.ObjectPlacement)
+        *xyz, matrix, geometry = rows[product.id()]
+        if geometry is not None:
+            # The geometry iterator's, whose axes are orthogonalised
+            shape = ifcopenshell.geom.create_shape(settings, product)
+            expected = ifcopenshell.util.shape.get_shape_matrix(shape).copy()
+            expected[:3, 3] /= unit_scale
+        assert np.allclose(np.frombuffer(matrix, dtype="d").reshape(4, 4), expected)
+        assert np.allclose(xyz, expected[:3, 3])
@@ -0,0 +1,59 @@
+import collections
+import json
+import sqlite3
+
+from conftest import convert, ifc2sql, ifcopenshell
+
+SPATIAL = ("IfcSite", "IfcBuilding", "IfcBuildingStorey", "IfcSpace", "IfcRelAggregates")
+
+
+def get_walls(db: sqlite3.Connection) -> list[tuple]:
+    """Return the wall rows with their inverses sorted, as their order is not stable between runs."""
+    rows = db.execute("SELECT * FROM IfcWall ORDER BY ifc_id").fetchall()
+    return [(*row[:-1], sorted(json.loads(row[-1]))) for row in rows]
+
+
+def test_preview_then_complete(model_path, tmp_path):
+    database = str(tmp_path / "model.db")
+    model = ifcopenshell.open(str(model_path))
+    patcher = ifc2sql.Patcher(model, database=database, should_preview=True)
+    statuses: dict[str, list[str]] = collections.defaultdict(list)
+    preview = None
+    for event in patcher.patch_iter():
+        with sqlite3.connect(database) as db:
+            for name, status in db.execute("SELECT name, status FROM conversion_status WHERE kind = 'class'"):
+                if not statuses[name] or statuses[name][-1] != status:
+                    statuses[name].append(status)
+            if event["name"] == "preview":
+                preview = {
+                    "id_map": db.execute("SELECT count(*) FROM id_map").fetchone()[0],
+                    "walls": db.execute("SELECT Name, inverses FROM IfcWall ORDER BY Name").fetchall(),
+                    "psets": db.execute("SELECT count(*) FROM psets").fetchone()[0],
+                    "spatial": {c: db.execute(f"SELECT count(inverses) FROM {c}").fetchone()[0] for c in SPATIAL},
+                    "classes": {row[0] for row in db.execute("SELECT name FROM conversion_status")},
+                }
+        db.close()
+
+    # The first commit holds the whole id_map, the spatial structure in full and the products without inverses
+    assert preview is not None
+    assert preview["id_map"] == len(list(model))
+    assert preview["walls"] == [(f"W{i}", None) for i in range(6)]
+    assert preview["psets"] == 0
+    assert preview["spatial"] == {c: len(model.by_type(c)) for c in SPATIAL}
+    assert "IfcPropertySet" not in preview["classes"]
+
+    # Products other than the spatial structure go from preview to complete, the rest are complete straight away
+    for name, history in statuses.items():
+        assert history == (["preview", "complete"] if patcher.get_class_priority(name) == 1 else ["complete"]), name
+    assert statuses["IfcWall"] == ["preview", "complete"]
+    assert statuses["IfcSite"] == ["complete"]
+
+    # Then the same database as converted without a preview
+    with sqlite3.connect(database) as db, convert(model_path, tmp_path / "expected.db") as expected:
+        assert get_walls(db) == get_walls(expected)
+        query = "SELECT * FROM psets ORDER BY ifc_id, pset_name, name"
+        assert db.execute(query).fetchall() == expected.execute(query).fetchall()
+        query = "SELECT ifc_id, x, y, z, matrix, geometry FROM shape ORDER BY ifc_id"
+        assert db.execute(query).fetchall() == expected.execute(query).fetchall()
+        status = db.execute("SELECT status FROM conversion_status WHERE name = 'conversion'").fetchone()
+        assert status == ("complete",)
@@ -0,0 +1,44 @@
+import collections
+import sqlite3
+
+from conftest import ifc2sql, ifcopenshell
+
+
+def get_status(db: sqlite3.Connection, kind: str) -> dict[str, tuple]:
+    query = "SELECT name, status, row_count FROM conversion_status WHERE kind = ?"
+    return {name: (status, row_count) for name, status, row_count in db.execute(query, (kind,))}
+
+
+def test_status_rows(model_path, tmp_path):
+    database = str(tmp_path / "model.db")
+    model = ifcopenshell.open(str(model_path))
+    ifc2sql.Patcher(model, database=database, should_commit_progressively=True).patch()
+    classes = collections.Counter(e.is_a() for e in model)
+    with sqlite3.connect(database) as db:
+        assert get_status(db, "class") == {c: ("complete", n) for c, n in classes.items()}
+        shape_count = db.execute("SELECT count(*) FROM shape").fetchone()[0]
+        assert get_status(db, "stage") == {"geometry": ("complete", shape_count), "conversion": ("complete", None)}
+        # The WAL is folded back into the database file once done
+        assert db.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+
+
+def test_read_while_converting(model_path, tmp_path):
+    database = str(tmp_path / "model.db")
+    patcher = ifc2sql.Patcher(ifcopenshell.open(str(model_path)), database=database, should_commit_progressively=True)
+    completed: list[str] = []
+    for event in patcher.patch_iter(batch_size=2):
+        if event["kind"] != "class":
+            continue
+        # Another connection sees the rows counted so far, while the conversion is still writing
+        with sqlite3.connect(database) as db:
+            assert db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+            assert get_status(db, "stage")["conversion"][0] == "running"
+            for name, (status, row_count) in get_status(db, "class").items():
+                assert status in ("running", "complete")  # Running while its batches are inserted
+                assert db.execute(f"SELECT count(*) FROM `{name}`").fetchone()[0] == row_count
+                if status == "complete" and name not in completed:
+                    completed.append(name)
+        db.close()
+
+    # Spatial structure and products come before geometry
+    assert completed.index("IfcSite") < completed.index("IfcWall") < completed.index("IfcExtrudedAreaSolid")
@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import convert
+
+COLUMNS = [
+    ("ifc_id", "INTEGER"),
+    ("Pset_WallCommon.FireRating", "TEXT"),
+    ("Pset_WallCommon.IsExternal", "INTEGER"),
+    ("Pset_WallCommon.Reference", "TEXT"),
+    ("Pset_WallCommon.ThermalTransmittance", "REAL"),
+    ("Shared.Zone", "TEXT"),
+]
+
+
+@pytest.mark.parametrize("should_compact_psets", [False, True], ids=["psets", "compact"])
+def test_wall_props(model_path, tmp_path, should_compact_psets):
+    options = {"should_get_geometry": False, "should_compact_psets": should_compact_psets}
+    with convert(model_path, tmp_path / "model.db", should_get_pset_pivots=True, **options) as db:
+        assert [tuple(row[1:3]) for row in db.execute("PRAGMA table_info('IfcWall_props')")] == COLUMNS
+        query = "SELECT w.Name, p.* FROM IfcWall_props p JOIN IfcWall w ON w.ifc_id = p.ifc_id ORDER BY w.Name"
+        rows = {name: values for name, _, *values in db.execute(query)}
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT ifc_id FROM IfcWall_props WHERE `Shared.Zone` = 'A'").fetchall()
+
+    # From the wall's own pset, its type's pset and the pset shared by all walls
+    assert rows == {
+        f"W{i}": ["EI60" if i % 2 else "EI30", int(i % 2 == 0), "TA", pytest.approx(0.2 + i), "A"] for i in range(6)
+    }
+    assert "INDEX idx_IfcWall_props_4 " in plan[0][-1]
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+
+import pytest
+
+from conftest import ifc2sql, ifcopenshell
+
+OPTIONS = {
+    "should_get_geometry": True,
+    "should_get_spatial_closure": True,
+    "should_get_associations": True,
+    "should_get_room_assignment": True,
+    "should_get_geometric_quantities": True,
+    "should_get_lods": True,
+    "should_get_search_index": True,
+    "should_get_supertypes": True,
+    "should_get_pset_pivots": True,
+    "should_get_guid_map": True,
+    "should_get_stats": True,
+    "should_optimise_storage": True,
+}
+
+# Patcher methods and module functions of each stage, the conversion is interrupted when they are called
+STAGES = [
+    "create_spatial_closure",
+    "create_associations",
+    "create_preview",
+    "insert_data",
+    "create_supertypes",
+    "create_pset_pivots",
+    "create_geometry",
+    "insert_geometry_rows",
+    "create_room_assignment",
+    "create_geometric_quantities",
+    "create_lods",
+    "create_change_tracking",
+    "optimise_storage",
+]
+
+
+class Crash(Exception):
+    pass
+
+
+def dump(db: sqlite3.Connection) -> dict[str, list]:
+    """Return the sorted rows of every table and view, except the checkpoint ledger and FTS shadow tables."""
+    names = [
+        row[0]
+        for row in db.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name")
+        if row[0] != "conversion_status" and not row[0].startswith(("search_index_", "sqlite_"))
+    ]
+    tables = {}
+    for name in names:
+        cursor = db.execute(f"SELECT * FROM `{name}`")
+        columns = [c[0] for c in cursor.description]
+        rows = []
+        for row in cursor:
+            row = list(row)
+            if "inverses" in columns and row[columns.index("inverses")]:
+                # Inverse order is not stable between runs
+                row[columns.index("inverses")] = sorted(json.loads(row[columns.index("inverses")]))
+            rows.append(repr(row))
+        tables[name] = sorted(rows)
+    return tables
+
+
+def convert(model_path, database, **options):
+    patcher = ifc2sql.Patcher(ifcopenshell.open(str(model_path)), database=str(database), **options)
+    patcher.patch()
+    return patcher
+
+
+@pytest.fixture(scope="module", params=[{}, {"should_preview": True}, {"should_track_changes": True}])
+def variant(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def reference(model_path, tmp_path_factory, variant):
+    database = tmp_path_factory.mktemp("reference") / "reference.db"
+    convert(model_path, database, pset_pivot_threshold=0.1, **OPTIONS, **variant)
+    with sqlite3.connect(database) as db:
+        return dump(db)
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_resume_after_interruption(model_path, tmp_path, monkeypatch, reference, variant, stage):
+    options = {"pset_pivot_threshold": 0.1, **OPTIONS, **variant}
+    target = ifc2sql if hasattr(ifc2sql, stage) and not hasattr(ifc2sql.Patcher, stage) else ifc2sql.Patcher
+    original = getattr(target, stage)
+    calls = []
+
+    def interrupt(*args, **kwargs):
+        calls.append(stage)
+        # Let a few batches of a repeated step through, so it is interrupted halfway
+        if len(calls) > (3 if stage in ("insert_data", "insert_geometry_rows") else 0):
+            raise Crash(stage)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(target, stage, interrupt)
+    database = tmp_path / "model.db"
+    try:
+        convert(model_path, database, should_commit_progressively=True, **options)
+    except Crash:
+        pass
+    monkeypatch.setattr(target, stage, original)
+    if not calls:
+        pytest.skip(f"{stage} is not used by this variant")
+
+    patcher = convert(model_path, database, should_resume=True, **options)
+    assert not patcher.is_cancelled
+    with sqlite3.connect(database) as db:
+        assert db.execute("SELECT status FROM conversion_status WHERE name = 'conversion'").fetchone() == ("complete",)
+        assert dump(db) == reference
+
+
+def test_resume_after_cancel_at_every_event(model_path, tmp_path, reference, variant):
+    options = {"pset_pivot_threshold": 0.1, **OPTIONS, **variant}
+    database = tmp_path / "events.db"
+    patcher = ifc2sql.Patcher(
+        ifcopenshell.open(str(model_path)), database=str(database), should_commit_progressively=True, **options
+    )
+    events = list(patcher.patch_iter())
+    stages = [i for i, event in enumerate(events) if event["kind"] != "class" or i % 10 == 0]
+    for stop in stages:
+        database.unlink()
+        count = iter(range(len(events)))
+        patcher = ifc2sql.Patcher(
+            ifcopenshell.open(str(model_path)), database=str(database), should_commit_progressively=True, **options
+        )
+        for _ in patcher.patch_iter(cancel=lambda: next(count) >= stop):
+            pass
+        convert(model_path, database, should_resume=True, **options)
+        with sqlite3.connect(database) as db:
+            assert dump(db) == reference, events[stop]
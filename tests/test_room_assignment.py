@@ -0,0 +1,39 @@
+import numpy as np
+
+from conftest import convert, ifcopenshell, run
+
+
+def add_wall(model: ifcopenshell.file, name: str, x: float) -> int:
+    wall = run(model, "root.create_entity", ifc_class="IfcWall", name=name)
+    matrix = np.eye(4)
+    matrix[0, 3], matrix[1, 3] = x, 1.0
+    run(model, "geometry.edit_object_placement", product=wall, matrix=matrix)
+    body = model.by_type("IfcGeometricRepresentationSubContext")[0]
+    representation = run(model, "geometry.add_wall_representation", context=body, length=2.0, height=1.0, thickness=0.2)
+    run(model, "geometry.assign_representation", product=wall, representation=representation)
+    return wall.id()
+
+
+def test_element_space(model_path, tmp_path):
+    model = ifcopenshell.open(str(model_path))
+    # Spaces S0 to S5 span x from 5i to 5i + 4, the walls W0 to W5 lie inside them. Across the gap between S0 and
+    # S1, the centroid of Gap is in neither, Far is nowhere near a space.
+    gap = add_wall(model, "Gap", 3.5)
+    far = add_wall(model, "Far", 100.0)
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+    ids = {e.Name: e.id() for e in model.by_type("IfcProduct") if e.Name}
+
+    with convert(path, tmp_path / "model.db", should_get_room_assignment=True) as db:
+        rows = set(db.execute("SELECT element_id, space_id, method FROM element_space"))
+        query = """
+            SELECT s.Name, w.Name FROM element_space es JOIN IfcWall w ON w.ifc_id = es.element_id
+            JOIN IfcSpace s ON s.ifc_id = es.space_id WHERE es.method = 'centroid' ORDER BY s.Name
+        """
+        names = db.execute(query).fetchall()
+
+    expected = {(ids[f"W{i}"], ids[f"S{i}"], "centroid") for i in range(6)}
+    expected |= {(gap, ids["S0"], "aabb"), (gap, ids["S1"], "aabb")}
+    assert rows == expected
+    assert far not in {row[0] for row in rows}
+    assert names == [(f"S{i}", f"W{i}") for i in range(6)]
@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from conftest import convert
+
+
+@pytest.fixture
+def db(model_path, tmp_path):
+    with convert(model_path, tmp_path / "model.db", should_get_search_index=True, should_get_geometry=False) as db:
+        yield db
+
+
+def search(db: sqlite3.Connection, query: str) -> list[str]:
+    statement = "SELECT name FROM search_index WHERE search_index MATCH ? ORDER BY name"
+    return [row[0] for row in db.execute(statement, (query,))]
+
+
+@pytest.mark.parametrize(
+    "query, names",
+    [
+        ("EI60", ["W1", "W3", "W5"]),  # A property value
+        ("properties:Shared AND properties:Zone", ["W0", "W1", "W2", "W3", "W4", "W5"]),  # A pset shared by all
+        ("TA", ["Type A", "W0", "W1", "W2", "W3", "W4", "W5"]),  # Defined by the wall type
+        ("name:W3", ["W3"]),
+        ('ifc_class:IfcSpace AND name:"S"*', ["S0", "S1", "S2", "S3", "S4", "S5"]),
+        ("Level", ["Level 0"]),
+        ("NotInTheModel", []),
+    ],
+)
+def test_match(db, query, names):
+    assert search(db, query) == names
+
+
+def test_global_id(db):
+    ifc_id, global_id = db.execute("SELECT ifc_id, GlobalId FROM IfcWall WHERE Name = 'W2'").fetchone()
+    statement = "SELECT ifc_id FROM search_index WHERE search_index MATCH ?"
+    assert db.execute(statement, (f'global_id:"{global_id}"',)).fetchall() == [(ifc_id,)]
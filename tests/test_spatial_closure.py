@@ -0,0 +1,35 @@
+from conftest import convert, ifcopenshell, run
+
+
+def test_nearest_levels(model_path, tmp_path):
+    # A chair contained in a space and a part of a wall, beside the fixture's walls contained in the storey
+    model = ifcopenshell.open(str(model_path))
+    ids = {e.Name: e.id() for e in model.by_type("IfcProduct") if e.Name}
+    chair = run(model, "root.create_entity", ifc_class="IfcFurniture", name="Chair")
+    run(model, "spatial.assign_container", relating_structure=model.by_id(ids["S2"]), products=[chair])
+    part = run(model, "root.create_entity", ifc_class="IfcBuildingElementPart", name="Part")
+    run(model, "aggregate.assign_object", relating_object=model.by_id(ids["W3"]), products=[part])
+    path = tmp_path / "model.ifc"
+    model.write(str(path))
+
+    with convert(path, tmp_path / "model.db", should_get_spatial_closure=True, should_get_geometry=False) as db:
+        rows = {row[0]: row[1:] for row in db.execute("SELECT * FROM spatial_closure")}
+        query = """
+            SELECT w.Name FROM IfcWall w JOIN spatial_closure c ON c.element_id = w.ifc_id
+            JOIN IfcBuildingStorey s ON s.ifc_id = c.storey_id WHERE s.Name = 'Level 0' ORDER BY w.Name
+        """
+        walls = [row[0] for row in db.execute(query)]
+
+    site, building, storey = ids["Site"], ids["Building"], ids["Level 0"]
+    expected = {
+        site: (None, None, None, None),
+        building: (None, None, None, site),
+        storey: (None, None, building, site),
+        chair.id(): (ids["S2"], storey, building, site),
+        part.id(): (None, storey, building, site),
+    }
+    for i in range(6):
+        expected[ids[f"S{i}"]] = (None, storey, building, site)
+        expected[ids[f"W{i}"]] = (None, storey, building, site)
+    assert rows == expected
+    assert walls == [f"W{i}" for i in range(6)]
@@ -0,0 +1,88 @@
+import collections
+import sqlite3
+
+import pytest
+
+from conftest import convert, ifc2sql, ifcopenshell
+
+OPTIONS = {"should_get_geometry": False, "should_get_stats": True}
+
+
+def get_stats(db: sqlite3.Connection) -> dict[str, dict[tuple, tuple]]:
+    """Return the value columns of each stats_* table by key."""
+    stats = {}
+    for table, (keys, columns) in ifc2sql.STATS_TABLES.items():
+        query = f"SELECT {', '.join(keys + columns)} FROM {table}"
+        stats[table] = {tuple(row[: len(keys)]): tuple(row[len(keys) :]) for row in db.execute(query)}
+    return stats
+
+
+def get_expected(model_path) -> dict[str, dict[tuple, tuple]]:
+    """Return the stats_* rows of classes and properties counted from the model itself."""
+    model = ifcopenshell.open(str(model_path))
+    schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(model.schema)
+    classes = collections.Counter(e.is_a() for e in model)
+    columns = {}
+    for ifc_class in classes:
+        for i, attribute in enumerate(schema.declaration_by_name(ifc_class).all_attributes()):
+            null_count = sum(e[i] is None for e in model.by_type(ifc_class, include_subtypes=False))
+            columns[(ifc_class, attribute.name())] = (classes[ifc_class], null_count)
+    return {
+        "stats_classes": {(c,): (n,) for c, n in classes.items()},
+        "stats_columns": columns,
+        # Walls and their type have Pset_WallCommon, the walls also share one Shared pset
+        "stats_psets": {("Pset_WallCommon",): (7,), ("Shared",): (6,)},
+        "stats_properties": {
+            ("Pset_WallCommon", "FireRating"): (6, 0, None, None),
+            ("Pset_WallCommon", "IsExternal"): (6, 0, None, None),
+            ("Pset_WallCommon", "Reference"): (7, 0, None, None),
+            ("Pset_WallCommon", "ThermalTransmittance"): (6, 0, 0.2, 5.2),
+            ("Shared", "Zone"): (6, 0, None, None),
+        },
+    }
+
+
+def check_stats(stats: dict[str, dict[tuple, tuple]], expected: dict[str, dict[tuple, tuple]], factor: int = 1):
+    assert stats["stats_classes"] == {k: (n * factor,) for k, (n,) in expected["stats_classes"].items()}
+    assert {k: (n, nulls) for k, (n, nulls, *_) in stats["stats_columns"].items()} == {
+        k: (n * factor, nulls * factor) for k, (n, nulls) in expected["stats_columns"].items()
+    }
+    assert stats["stats_columns"][("IfcMaterialLayer", "LayerThickness")][2:] == (0.2, 0.2)
+    assert stats["stats_psets"] == {k: (n * factor,) for k, (n,) in expected["stats_psets"].items()}
+    assert stats["stats_properties"] == {
+        k: (n * factor, nulls * factor, *values) for k, (n, nulls, *values) in expected["stats_properties"].items()
+    }
+
+
+@pytest.mark.parametrize(
+    "options, batch_size",
+    [({}, 10000), ({"should_preview": True}, 10000), ({}, 2)],
+    ids=["default", "preview", "batches"],
+)
+def test_counts(model_path, tmp_path, options, batch_size):
+    database = str(tmp_path / "model.db")
+    patcher = ifc2sql.Patcher(ifcopenshell.open(str(model_path)), database=database, **OPTIONS, **options)
+    for _ in patcher.patch_iter(batch_size=batch_size):
+        pass
+    with sqlite3.connect(database) as db:
+        check_stats(get_stats(db), get_expected(model_path))
+
+
+def test_resume(model_path, tmp_path):
+    database = str(tmp_path / "model.db")
+    patcher = ifc2sql.Patcher(
+        ifcopenshell.open(str(model_path)), database=database, should_commit_progressively=True, **OPTIONS
+    )
+    count = iter(range(1000))
+    events = list(patcher.patch_iter(cancel=lambda: next(count) >= 10, batch_size=2))
+    assert patcher.is_cancelled and events[-1]["kind"] == "class"  # Stopped halfway through the class rows
+    with convert(model_path, database, should_resume=True, **OPTIONS) as db:
+        check_stats(get_stats(db), get_expected(model_path))
+
+
+def test_federated(model_path, tmp_path):
+    # The same model twice, so every count doubles and the ranges stay the same
+    database = str(tmp_path / "federated.db")
+    ifc2sql.FederatedPatcher([str(model_path)] * 2, database, max_workers=1, **OPTIONS).patch()
+    with sqlite3.connect(database) as db:
+        check_stats(get_stats(db), get_expected(model_path), factor=2)
@@ -0,0 +1,49 @@
+import json
+import sqlite3
+
+import pytest
+
+from conftest import convert, ifcopenshell
+
+
+def get_elements(db: sqlite3.Connection) -> list[tuple]:
+    """Return the IfcElement rows with their inverses sorted, as their order is not stable between runs."""
+    rows = db.execute("SELECT * FROM IfcElement ORDER BY ifc_id").fetchall()
+    return [(*row[:-1], sorted(json.loads(row[-1]))) for row in rows]
+
+
+@pytest.mark.parametrize(
+    "supertype", ["IfcRoot", "IfcProduct", "IfcElement", "IfcBuildingElement", "IfcSpatialElement"]
+)
+def test_views(model_path, tmp_path, supertype):
+    model = ifcopenshell.open(str(model_path))
+    with convert(model_path, tmp_path / "model.db", should_get_supertypes=True, should_get_geometry=False) as db:
+        assert db.execute("SELECT type FROM sqlite_master WHERE name = ?", (supertype,)).fetchone() == ("view",)
+        cursor = db.execute(f"SELECT * FROM `{supertype}`")
+        columns = [c[0] for c in cursor.description]
+        rows = {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    # Every instance of a concrete subtype, with the attributes they all share
+    declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name(model.schema).declaration_by_name(supertype)
+    attributes = [a.name() for a in declaration.all_attributes()]
+    assert columns == ["ifc_id", "ifc_class", *attributes, "inverses"]
+    elements = model.by_type(supertype)
+    assert {ifc_id: row["ifc_class"] for ifc_id, row in rows.items()} == {e.id(): e.is_a() for e in elements}
+    for element in elements:
+        assert rows[element.id()]["GlobalId"] == element.GlobalId
+        assert rows[element.id()]["Name"] == element.Name
+
+
+def test_materialised(model_path, tmp_path):
+    options = {"should_get_supertypes": True, "should_get_geometry": False}
+    with convert(model_path, tmp_path / "views.db", **options) as views, convert(
+        model_path, tmp_path / "model.db", materialised_supertypes=("IfcElement",), **options
+    ) as db:
+        assert db.execute("SELECT type FROM sqlite_master WHERE name = 'IfcElement'").fetchone() == ("table",)
+        assert db.execute("SELECT type FROM sqlite_master WHERE name = 'IfcProduct'").fetchone() == ("view",)
+        assert get_elements(db) == get_elements(views)
+        global_id = db.execute("SELECT GlobalId FROM IfcWall WHERE Name = 'W2'").fetchone()[0]
+        query = "SELECT Name FROM IfcElement WHERE GlobalId = ?"
+        assert db.execute(query, (global_id,)).fetchall() == [("W2",)]
+        plan = db.execute(f"EXPLAIN QUERY PLAN {query}", (global_id,)).fetchall()
+        assert "INDEX idx_IfcElement_GlobalId" in plan[0][-1]
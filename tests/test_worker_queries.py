@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from conftest import load_worker_queries
+
+
+@pytest.fixture
+def worker():
+    namespace = load_worker_queries()
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (x integer)")
+    db.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(500)))
+
+    class Patcher:
+        pass
+
+    Patcher.db = db
+    namespace["conversion_patcher"] = Patcher
+    return namespace
+
+
+def fetch_all_pages(worker, page_size, max_rows, query="SELECT x FROM t"):
+    handle = worker["open_query"](query, page_size, max_rows)
+    pages = []
+    while True:
+        page = worker["fetch_query_page"](handle)
+        pages.append(page)
+        if not page["hasMore"]:
+            return pages
+
+
+@pytest.mark.parametrize(
+    "page_size, max_rows, sizes, truncated",
+    [
+        (1, 3, [1, 1, 1], True),
+        (1000, 1001, [500], False),
+        (100, 101, [100, 1], True),
+        (100, 500, [100] * 5, False),
+        (100, 100000, [100] * 5, False),
+        (7, 10, [7, 3], True),
+    ],
+)
+def test_pages_are_bounded(worker, page_size, max_rows, sizes, truncated):
+    pages = fetch_all_pages(worker, page_size, max_rows)
+    assert [len(page["rows"]) for page in pages] == sizes
+    assert pages[-1]["truncated"] is truncated
+    assert pages[-1]["rowCount"] == sum(sizes)
+    assert pages[-1]["handle"] is None
+    assert worker["query_cursors"] == {}
+    rows = [row[0] for page in pages for row in page["rows"]]
+    assert rows == list(range(len(rows)))
+
+
+def test_single_row_pages(worker):
+    pages = fetch_all_pages(worker, 1, 100000, "SELECT x FROM t WHERE x < 4")
+    assert [page["rows"] for page in pages] == [[[0]], [[1]], [[2]], [[3]]]
+    assert [page["hasMore"] for page in pages] == [True, True, True, False]
+    assert not pages[-1]["truncated"]
+
+
+def test_statement_without_rows(worker):
+    pages = fetch_all_pages(worker, 10, 100, "UPDATE t SET x = x")
+    assert pages == [{"columns": [], "rows": [], "handle": None, "hasMore": False, "truncated": False, "rowCount": 0}]
+
+
+@pytest.mark.parametrize(
+    "page_size, max_rows", [(0, 10), (10, 0), (-1, 10), (10, -5), (1.5, 10), ("10", 10), (True, 10)]
+)
+def test_invalid_bounds(worker, page_size, max_rows):
+    with pytest.raises(ValueError):
+        worker["open_query"]("SELECT x FROM t", page_size, max_rows)
+    assert worker["query_cursors"] == {}
@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from conftest import convert, ifc2sql, ifcopenshell
+
+import ifcopenshell.util.element
+import ifcopenshell.validate
+
+
+def get_wall_psets(db: sqlite3.Connection) -> list[tuple]:
+    query = """
+        SELECT w.Name, p.pset_name, p.name, p.value FROM psets p JOIN IfcWall w ON w.ifc_id = p.ifc_id
+        ORDER BY w.Name, p.pset_name, p.name
+    """
+    return db.execute(query).fetchall()
+
+
+def set_pset_value(db: sqlite3.Connection, wall: str, name: str, value: str) -> None:
+    query = "UPDATE psets SET value = ? WHERE name = ? AND ifc_id = (SELECT ifc_id FROM IfcWall WHERE Name = ?)"
+    if db.execute("SELECT type FROM sqlite_master WHERE name = 'psets'").fetchone()[0] == "view":
+        query = """
+            UPDATE pset_values SET value = ? WHERE prop_id IN (SELECT id FROM prop_def WHERE name = ?)
+            AND ifc_id = (SELECT ifc_id FROM IfcWall WHERE Name = ?)
+        """
+    assert db.execute(query, (value, name, wall)).rowcount == 1
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"should_get_inverses": False}, {"should_compact_psets": True}],
+    ids=["default", "no-inverses", "compact"],
+)
+def test_round_trip(model_path, tmp_path, options):
+    database = tmp_path / "model.db"
+    db = convert(model_path, database, should_get_geometry=False, should_track_changes=True, **options)
+    db.execute("UPDATE IfcWall SET Name = 'Edited' WHERE Name = 'W0'")
+    set_pset_value(db, "W1", "FireRating", "EI120")  # Only defining W1
+    set_pset_value(db, "W2", "Zone", "B")  # Shared by every wall
+    set_pset_value(db, "W5", "Zone", "C")
+    set_pset_value(db, "W3", "Reference", "TB")  # Defined by the wall type
+    db.execute("DELETE FROM IfcWall WHERE Name = 'W4'")
+    ifc_id = db.execute("SELECT max(ifc_id) FROM id_map").fetchone()[0] + 1000
+    columns = [row[1] for row in db.execute("PRAGMA table_info('IfcWall')")][1:]
+    columns = ", ".join(f'"{c}"' if c != "Name" else "'New'" for c in columns)
+    db.execute(f"INSERT INTO IfcWall SELECT {ifc_id}, {columns} FROM IfcWall WHERE Name = 'W5'")
+    db.execute("UPDATE IfcWall SET GlobalId = ? WHERE ifc_id = ?", (ifcopenshell.guid.new(), ifc_id))
+    db.commit()
+    expected = get_wall_psets(db)
+
+    output = tmp_path / "output.ifc"
+    ifc2sql.WriteBack(str(database), str(model_path), str(output)).execute()
+    model = ifcopenshell.open(str(output))
+    walls = {wall.Name: wall for wall in model.by_type("IfcWall")}
+    assert sorted(walls) == ["Edited", "New", "W1", "W2", "W3", "W5"]
+    psets = {name: ifcopenshell.util.element.get_psets(wall) for name, wall in walls.items()}
+    assert psets["W1"]["Pset_WallCommon"]["FireRating"] == "EI120"
+    assert psets["W3"]["Pset_WallCommon"]["FireRating"] == "EI60"
+    assert {name: p["Shared"]["Zone"] for name, p in psets.items() if name != "New"} == {
+        "Edited": "A",
+        "W1": "A",
+        "W2": "B",
+        "W3": "A",
+        "W5": "C",
+    }
+    assert {name: p["Pset_WallCommon"]["Reference"] for name, p in psets.items() if name != "New"} == {
+        "Edited": "TA",
+        "W1": "TA",
+        "W2": "TA",
+        "W3": "TB",
+        "W5": "TA",
+    }
+    assert ifcopenshell.util.element.get_psets(model.by_type("IfcWallType")[0])["Pset_WallCommon"]["Reference"] == "TA"
+
+    # The deleted wall left no relationship pointing at it, nor its relationships and psets of it only. What
+    # its representation and material usage are left without is not cleaned up.
+    logger = ifcopenshell.validate.json_logger()
+    ifcopenshell.validate.validate(model, logger)
+    errors = [
+        s for s in logger.statements if s["instance"].is_a("IfcRelationship") or s["instance"].is_a("IfcProperty")
+    ]
+    assert not errors
+    assert {s["instance"].is_a() for s in logger.statements} == {
+        "IfcProductDefinitionShape",
+        "IfcMaterialLayerSetUsage",
+    }
+    assert len(model.by_type("IfcRelAssociatesClassification")) == 6  # The project's and those of the other walls
+    assert len([p for p in model.by_type("IfcPropertySet") if p.Name == "Pset_WallCommon"]) == 6
+
+    # Converting the output again gives the edited database's psets
+    with convert(output, tmp_path / "output.db", should_get_geometry=False, **options) as converted:
+        assert get_wall_psets(converted) == expected